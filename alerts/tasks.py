@@ -1,32 +1,66 @@
+from collections import defaultdict
 from datetime import timedelta
-from django.db.models import Count
+from django.db import connection
+from django.db.models import Max
 from django.utils import timezone
 from celery import shared_task
-from projects.models import Project
-from .models import Notification
+from prometheus_client import Histogram
+from .models import Notification, ProjectAlert
+
+ALERT_EVALUATION_SECONDS = Histogram(
+    "glitchtip_alert_evaluation_seconds",
+    "Time spent evaluating all project event alerts",
+)
+
+# Issues without notifications that exceed an alert's quantity within its
+# timespan. Only events newer than the longest timespan are scanned.
+TRIGGERED_ALERT_ISSUES_SQL = """
+SELECT alert.id, event.issue_id
+FROM alerts_projectalert alert
+JOIN issues_issue issue ON issue.project_id = alert.project_id
+JOIN events_event event ON event.issue_id = issue.id
+WHERE alert.quantity IS NOT NULL
+AND alert.timespan_minutes IS NOT NULL
+AND event.created >= %(min_start)s
+AND event.created >= %(now)s - make_interval(mins => alert.timespan_minutes)
+AND NOT EXISTS (
+    SELECT 1 FROM alerts_notification_issues notified
+    WHERE notified.issue_id = issue.id
+)
+GROUP BY alert.id, event.issue_id
+HAVING COUNT(*) >= alert.quantity
+ORDER BY alert.id
+"""
 
 
 @shared_task
 def process_event_alerts():
     """ Inspect alerts and determine if new notifications need sent """
-    now = timezone.now()
-    for project in Project.objects.all():
-        for alert in project.projectalert_set.filter(
+    with ALERT_EVALUATION_SECONDS.time():
+        now = timezone.now()
+        max_timespan = ProjectAlert.objects.filter(
             quantity__isnull=False, timespan_minutes__isnull=False
-        ):
-            start_time = now - timedelta(minutes=alert.timespan_minutes)
-            quantity_in_timespan = alert.quantity
-            issues = (
-                project.issue_set.filter(
-                    notification__isnull=True, event__created__gte=start_time,
-                )
-                .annotate(num_events=Count("event"))
-                .filter(num_events__gte=quantity_in_timespan)
+        ).aggregate(Max("timespan_minutes"))["timespan_minutes__max"]
+        if max_timespan is None:
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                TRIGGERED_ALERT_ISSUES_SQL,
+                {"now": now, "min_start": now - timedelta(minutes=max_timespan)},
             )
-            if issues:
-                notification = alert.notification_set.create()
-                notification.issues.add(*issues)
-                send_notification.delay(notification.pk)
+            alert_issues = defaultdict(list)
+            notified_issue_ids = set()
+            for alert_id, issue_id in cursor.fetchall():
+                # An issue is notified once, by the first alert it triggers
+                if issue_id not in notified_issue_ids:
+                    notified_issue_ids.add(issue_id)
+                    alert_issues[alert_id].append(issue_id)
+
+        for alert_id, issue_ids in alert_issues.items():
+            notification = Notification.objects.create(project_alert_id=alert_id)
+            notification.issues.add(*issue_ids)
+            send_notification.delay(notification.pk)
 
 
 @shared_task
@@ -1,5 +1,6 @@
 import json
 from datetime import timedelta
+from unittest.mock import patch
 
 from django.core import mail
 from django.shortcuts import reverse
@@ -92,6 +93,26 @@ class AlertTestCase(GlitchTipTestCase):
         process_event_alerts()
         self.assertEqual(Notification.objects.count(), 1)
 
+    def test_alert_multiple_projects(self):
+        """ Alerts are evaluated together, regardless of project count """
+        baker.make("projects.Project", organization=self.organization, _quantity=3)
+        other_project = baker.make("projects.Project", organization=self.organization)
+        for project in [self.project, other_project]:
+            baker.make(
+                "alerts.ProjectAlert", project=project, timespan_minutes=1, quantity=2,
+            )
+        issue = baker.make("issues.Issue", project=self.project)
+        baker.make("events.Event", issue=issue, _quantity=2)
+        baker.make("events.Event", issue__project=other_project)
+
+        # Max timespan, triggered issues, and one notification create/add
+        with self.assertNumQueries(4), patch("alerts.tasks.send_notification"):
+            process_event_alerts()
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(
+            Notification.objects.get().project_alert.project, self.project
+        )
+
     def test_alert_on_regression(self):
         baker.make(
             "alerts.ProjectAlert", project=self.project, timespan_minutes=1, quantity=1,
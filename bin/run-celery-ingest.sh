@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+set -e
+
+exec celery -A glitchtip worker -l info -Q "${EVENT_INGEST_QUEUE:-celery}"
@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+set -e
+
+exec ./manage.py uptime_worker
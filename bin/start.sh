@@ -16,6 +16,15 @@ case $SERVER_ROLE in
     worker)
         SCRIPT="./bin/run-celery.sh"
         ;;
+    ingest_worker)
+        SCRIPT="./bin/run-celery-ingest.sh"
+        ;;
+    ingest_batch_worker)
+        SCRIPT="./bin/run-ingest-batch.sh"
+        ;;
+    uptime_worker)
+        SCRIPT="./bin/run-uptime-worker.sh"
+        ;;
     beat)
         SCRIPT="./bin/run-beat.sh"
         ;;
@@ -23,7 +32,7 @@ case $SERVER_ROLE in
         SCRIPT="./bin/run-celery-with-beat.sh"
         ;;
     *)
-        echo "Unknown server role provided: $SERVER_ROLE. Should be web|worker|beat."
+        echo "Unknown server role provided: $SERVER_ROLE. Should be web|worker|ingest_worker|ingest_batch_worker|uptime_worker|beat."
         exit 1
         ;;
 esac
@@ -0,0 +1,53 @@
+# Generated by Django 4.1 on 2026-10-18 05:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0007_remove_file_blobs_file_blob'),
+        ('difs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debuginformationfile',
+            name='arch',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='debuginformationfile',
+            name='code_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='debuginformationfile',
+            name='debug_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='debuginformationfile',
+            name='symcache',
+            field=models.ForeignKey(blank=True, help_text="Symbol lookup table converted from the file's object", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='files.file'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE difs_debuginformationfile
+            SET debug_id = lower(data->>'debug_id'),
+                code_id = lower(data->>'code_id'),
+                arch = data->>'arch'
+            WHERE data IS NOT NULL
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='debuginformationfile',
+            index=models.Index(fields=['project', 'debug_id'], name='difs_debugi_project_7f276f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debuginformationfile',
+            index=models.Index(fields=['project', 'code_id'], name='difs_debugi_project_145c11_idx'),
+        ),
+    ]
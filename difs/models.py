@@ -1,5 +1,10 @@
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from files.models import File
 from glitchtip.base_models import CreatedModel
+from projects.cache import invalidate_project_auth
 
 
 class DebugInformationFile(CreatedModel):
@@ -9,7 +14,9 @@ class DebugInformationFile(CreatedModel):
 
     class Meta:
         indexes = [
-            models.Index(fields=["project", "file"])
+            models.Index(fields=["project", "file"]),
+            models.Index(fields=["project", "debug_id"]),
+            models.Index(fields=["project", "code_id"]),
         ]
 
     name = models.TextField()
@@ -20,8 +27,37 @@ class DebugInformationFile(CreatedModel):
 
     data = models.JSONField(null=True, blank=True)
 
+    # Object identifiers, lower case, matched against event debug_meta images
+    debug_id = models.CharField(max_length=64, null=True, blank=True)
+    code_id = models.CharField(max_length=64, null=True, blank=True)
+    arch = models.CharField(max_length=32, null=True, blank=True)
+
+    symcache = models.ForeignKey(
+        "files.File",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        help_text="Symbol lookup table converted from the file's object",
+    )
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_project_auth(self.project_id)
+
+    def delete(self, *args, **kwargs):
+        invalidate_project_auth(self.project_id)
+        return super().delete(*args, **kwargs)
+
     def is_proguard_mapping(self):
         try:
             return self.data["symbol_type"] == "proguard"
         except Exception:
             return False
+
+
+@receiver(post_delete, sender=DebugInformationFile)
+def delete_symcache(sender, instance, **kwargs):
+    """The symcache File belongs to its DIF only, including in cascade deletes"""
+    if instance.symcache_id:
+        File.objects.filter(pk=instance.symcache_id).delete()
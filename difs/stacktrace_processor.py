@@ -62,14 +62,14 @@ class StacktraceProcessor:
         return True
 
     @classmethod
-    def resolve_stacktrace(cls, event, symbol_file):
-        # Process event
+    def get_stacktrace(cls, event):
+        """ Returns the first exception's stacktrace and the device arch """
         try:
             contexts = event.get("contexts")
             if contexts is None:
                 # Nodejs crash report doesn't contain this field.
                 # In future, we need to support.
-                return
+                return None, None
             arch = contexts.get("device").get("arch")
 
             # Process the first exception only.
@@ -77,6 +77,29 @@ class StacktraceProcessor:
             stacktrace = exceptions[0].get("stacktrace")
         except Exception:
             getLogger().error(f"StacktraceProcessor: Invalid event: {event}")
+            return None, None
+        return stacktrace, arch
+
+    @classmethod
+    def get_debug_images(cls, event):
+        """ Lower case debug ids and code ids of the event's debug images """
+        debug_ids = set()
+        code_ids = set()
+        try:
+            images = event.get("debug_meta", {}).get("images") or []
+            for image in images:
+                if image.get("debug_id"):
+                    debug_ids.add(str(image["debug_id"]).lower())
+                if image.get("code_id"):
+                    code_ids.add(str(image["code_id"]).lower())
+        except AttributeError:
+            getLogger().error(f"StacktraceProcessor: Invalid debug_meta: {event}")
+        return debug_ids, code_ids
+
+    @classmethod
+    def resolve_stacktrace(cls, event, symbol_file):
+        stacktrace, arch = cls.get_stacktrace(event)
+        if stacktrace is None:
             return
 
         if cls.is_android_event(event):
@@ -141,6 +164,10 @@ class StacktraceProcessor:
                 f"StacktraceProcessor: Open symbol file failed: {e}")
             return
 
+        return cls.remap_native_stacktrace(stacktrace, sym_cache)
+
+    @classmethod
+    def remap_native_stacktrace(cls, stacktrace, sym_cache):
         try:
             frames = stacktrace.get("frames")
             score = 0
@@ -159,7 +186,7 @@ class StacktraceProcessor:
                     digested_symbol.symbol == function
                 ):
                     frame["resolved"] = True
-                    frame["filename"] = digested_symbol.filename
+                    frame["filename"] = digested_symbol.full_path
                     frame["lineNo"] = digested_symbol.line
                     frame["function"] = demangle_name(digested_symbol.symbol)
                     score = score + 1
@@ -1,15 +1,24 @@
 import contextlib
+import io
 import logging
 import tempfile
+from functools import lru_cache
 from hashlib import sha1
 
 from celery import shared_task
-from symbolic import Archive
+from django.core.files import File as DjangoFile
+from django.db.models import Q
+from symbolic import Archive, SymCache
 
 from difs.models import DebugInformationFile
-from difs.stacktrace_processor import StacktraceProcessor
+from difs.stacktrace_processor import (
+    StacktraceProcessor,
+    alternative_arch,
+    find_arch_object,
+)
 from events.models import Event
 from files.models import File, FileBlob
+from organizations_ext.usage import record_organization_usage
 from projects.models import Project
 
 
@@ -29,6 +38,9 @@ DIF_STATE_CREATED = "created"
 DIF_STATE_OK = "ok"
 DIF_STATE_NOT_FOUND = "not_found"
 
+# Number of memory mapped SymCaches kept open per worker
+SYMCACHE_CACHE_SIZE = 128
+
 
 @shared_task
 def difs_assemble(project_slug, name, checksum, chunks, debug_id):
@@ -63,21 +75,43 @@ def difs_resolve_stacktrace(event_id):
 
     project_id = event.issue.project_id
 
-    difs = DebugInformationFile.objects.filter(project_id=project_id).order_by(
-        "-created"
+    difs = (
+        DebugInformationFile.objects.filter(project_id=project_id)
+        .select_related("file__blob", "symcache__blob")
+        .order_by("-created")
     )
+    is_android = StacktraceProcessor.is_android_event(event_json)
+    if not is_android:
+        stacktrace, arch = StacktraceProcessor.get_stacktrace(event_json)
+        if stacktrace is None:
+            return
+        debug_ids, code_ids = StacktraceProcessor.get_debug_images(event_json)
+        if debug_ids or code_ids:
+            difs = difs.filter(Q(debug_id__in=debug_ids) | Q(code_id__in=code_ids))
+        elif arch:
+            # Without debug images, guess by architecture
+            difs = difs.filter(
+                Q(arch__in=alternative_arch.get(arch, [arch])) | Q(arch__isnull=True)
+            )
     resolved_stracktrackes = []
 
     for dif in difs:
         if StacktraceProcessor.is_supported(event_json, dif) is False:
             continue
-        blobs = [dif.file.blob]
-        with difs_concat_file_blobs_to_disk(blobs) as symbol_file:
-            remapped_stacktrace = StacktraceProcessor.resolve_stacktrace(
-                event_json, symbol_file.name
+        if is_android:
+            with dif.file.blob.local_path() as symbol_path:
+                remapped_stacktrace = StacktraceProcessor.resolve_stacktrace(
+                    event_json, symbol_path
+                )
+        else:
+            sym_cache = difs_get_symcache(dif, arch)
+            if sym_cache is None:
+                continue
+            remapped_stacktrace = StacktraceProcessor.remap_native_stacktrace(
+                stacktrace, sym_cache
             )
-            if remapped_stacktrace is not None and remapped_stacktrace.score > 0:
-                resolved_stracktrackes.append(remapped_stacktrace)
+        if remapped_stacktrace is not None and remapped_stacktrace.score > 0:
+            resolved_stracktrackes.append(remapped_stacktrace)
     if len(resolved_stracktrackes) > 0:
         best_remapped_stacktrace = max(
             resolved_stracktrackes, key=lambda item: item.score
@@ -86,6 +120,50 @@ def difs_resolve_stacktrace(event_id):
         event.save()
 
 
+def difs_get_symcache(dif, arch=None):
+    """
+    Get the DIF's SymCache, converting and storing it on first use for DIFs
+    uploaded before SymCaches were created at upload
+    """
+    if dif.symcache is None:
+        with dif.file.blob.local_path() as symbol_path:
+            try:
+                archive = Archive.open(symbol_path)
+                obj = find_arch_object(archive, dif.arch or arch)
+            except Exception as err:
+                getLogger().error("Open symbol file failed: %s", err)
+                return None
+            dif.symcache = difs_create_symcache(obj, dif.name)
+        if dif.symcache is None:
+            return None
+        dif.save(update_fields=["symcache"])
+    return difs_load_symcache(dif.symcache.blob.checksum)
+
+
+@lru_cache(maxsize=SYMCACHE_CACHE_SIZE)
+def difs_load_symcache(checksum: str) -> SymCache:
+    """Open a stored SymCache, memory mapped and kept per worker"""
+    blob = FileBlob.objects.get(checksum=checksum)
+    with blob.local_path() as path:
+        return SymCache.open(path)
+
+
+def difs_create_symcache(obj, name):
+    """Convert a symbolic object to a SymCache and store it as a File"""
+    if obj is None:
+        return None
+    try:
+        output = io.BytesIO()
+        SymCache.from_object(obj).dump_into(output)
+    except Exception as err:
+        getLogger().error("Create SymCache error: %s", err)
+        return None
+    output.seek(0)
+    symcache_file = File(name=f"{name}.symcache", headers={})
+    symcache_file.putfile(output)
+    return symcache_file
+
+
 def difs_get_file_from_chunks(checksum, chunks):
     files = File.objects.filter(checksum=checksum)
 
@@ -99,95 +177,108 @@ def difs_get_file_from_chunks(checksum, chunks):
 
 
 def difs_create_file_from_chunks(name, checksum, chunks):
-    blobs = FileBlob.objects.filter(checksum__in=chunks)
-
-    total_checksum = sha1(b"")
-    size = 0
-
-    for blob in blobs:
-        size = size + blob.blob.size
-
-        with open(blob.blob.path, "rb") as binary_file:
-            content = binary_file.read()
-            total_checksum.update(content)
-
-    total_checksum = total_checksum.hexdigest()
-    if checksum != total_checksum:
-        raise ChecksumMismatched()
+    """
+    Create a file from uploaded chunks. Multiple chunks are streamed in upload
+    order into a single blob, as debug files must be opened as one file.
+    """
+    blobs_by_checksum = {
+        blob.checksum: blob for blob in FileBlob.objects.filter(checksum__in=chunks)
+    }
+    blobs = [blobs_by_checksum[chunk] for chunk in chunks if chunk in blobs_by_checksum]
+
+    with tempfile.TemporaryFile() as output:
+        total_checksum = sha1(b"")
+        size = 0
+        for blob in blobs:
+            with blob.blob.open("rb") as binary_file:
+                for content in binary_file.chunks():
+                    size += len(content)
+                    total_checksum.update(content)
+                    if len(blobs) > 1:
+                        output.write(content)
+
+        total_checksum = total_checksum.hexdigest()
+        if checksum != total_checksum:
+            raise ChecksumMismatched()
+
+        if len(blobs) == 1:
+            file_blob = blobs[0]
+        else:
+            output.seek(0)
+            file_blob, _ = FileBlob.objects.get_or_create(
+                checksum=checksum,
+                defaults={"blob": DjangoFile(output, name=checksum), "size": size},
+            )
 
     file = File(name=name, headers={}, size=size, checksum=checksum)
-    file.blob = blobs[0]
+    file.blob = file_blob
     file.save()
     return file
 
 
-@contextlib.contextmanager
-def difs_concat_file_blobs_to_disk(blobs):
-    output = tempfile.NamedTemporaryFile(delete=False)
-    for blob in blobs:
-        with open(blob.blob.path, "rb") as binary_file:
-            content = binary_file.read()
-            output.write(content)
-
-    output.flush()
-    output.seek(0)
-    try:
-        yield output
-    finally:
-        output.close()
+def difs_get_object_metadata(obj):
+    return {
+        "arch": obj.arch,
+        "file_format": obj.file_format,
+        "code_id": obj.code_id,
+        "debug_id": obj.debug_id,
+        "kind": obj.kind,
+        "features": list(obj.features),
+        "symbol_type": "native",
+    }
 
 
-def difs_extract_metadata_from_file(file):
-    with difs_concat_file_blobs_to_disk([file.blob]) as _input:
+@contextlib.contextmanager
+def difs_open_archive(file):
+    with file.blob.local_path() as path:
         # Only one kind of file format is supported now
         try:
-            archive = Archive.open(_input.name)
+            archive = Archive.open(path)
         except Exception as err:
             getLogger().error("Extract metadata error: %s", err)
             raise UnsupportedFile() from err
-        else:
-            return [
-                {
-                    "arch": obj.arch,
-                    "file_format": obj.file_format,
-                    "code_id": obj.code_id,
-                    "debug_id": obj.debug_id,
-                    "kind": obj.kind,
-                    "features": list(obj.features),
-                    "symbol_type": "native",
-                }
-                for obj in archive.iter_objects()
-            ]
+        yield archive
 
 
-def difs_create_difs(project, name, file):
-    metadatalist = difs_extract_metadata_from_file(file)
-    for metadata in metadatalist:
-        dif = DebugInformationFile.objects.filter(
-            project_id=project.id, file=file
-        ).first()
+def difs_extract_metadata_from_file(file):
+    with difs_open_archive(file) as archive:
+        return [difs_get_object_metadata(obj) for obj in archive.iter_objects()]
 
-        if dif is not None:
-            continue
 
-        code_id = metadata["code_id"]
-        debug_id = metadata["debug_id"]
-        arch = metadata["arch"]
-        kind = metadata["kind"]
-        features = metadata["features"]
-        symbol_type = metadata["symbol_type"]
-
-        dif = DebugInformationFile(
-            project=project,
-            name=name,
-            file=file,
-            data={
-                "arch": arch,
-                "debug_id": debug_id,
-                "code_id": code_id,
-                "kind": kind,
-                "features": features,
-                "symbol_type": symbol_type,
-            },
-        )
-        dif.save()
+def difs_create_difs(project, name, file):
+    created = False
+    with difs_open_archive(file) as archive:
+        for obj in archive.iter_objects():
+            metadata = difs_get_object_metadata(obj)
+            debug_id = (metadata["debug_id"] or "").lower() or None
+            code_id = (metadata["code_id"] or "").lower() or None
+            arch = metadata["arch"]
+
+            if DebugInformationFile.objects.filter(
+                project_id=project.id, file=file, debug_id=debug_id, arch=arch
+            ).exists():
+                continue
+
+            dif = DebugInformationFile(
+                project=project,
+                name=name,
+                file=file,
+                debug_id=debug_id,
+                code_id=code_id,
+                arch=arch,
+                data={
+                    "arch": arch,
+                    "debug_id": metadata["debug_id"],
+                    "code_id": metadata["code_id"],
+                    "kind": metadata["kind"],
+                    "features": metadata["features"],
+                    "symbol_type": metadata["symbol_type"],
+                },
+            )
+            # Convert once at upload, instead of for every event
+            dif.symcache = difs_create_symcache(obj, name)
+            dif.save()
+            created = True
+    # Objects of one archive share its file, count its bytes once
+    if created:
+        record_organization_usage("file_bytes", {project.organization_id: file.size})
@@ -7,7 +7,12 @@ from django.core.files import File as DjangoFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from model_bakery import baker
 
-from difs.tasks import ChecksumMismatched, difs_create_file_from_chunks
+from difs.tasks import (
+    ChecksumMismatched,
+    difs_create_difs,
+    difs_create_file_from_chunks,
+    difs_resolve_stacktrace,
+)
 from files.models import File
 from glitchtip.test_utils.test_case import GlitchTipTestCase
 
@@ -21,6 +26,16 @@ class DebugInformationFileModelTestCase(GlitchTipTestCase):
         dif = baker.make("difs.DebugInformationFile", data={"symbol_type": "proguard"})
         self.assertEqual(dif.is_proguard_mapping(), True)
 
+    def test_delete_symcache(self):
+        dif = baker.make("difs.DebugInformationFile", symcache=baker.make(File))
+        other_dif = baker.make("difs.DebugInformationFile", symcache=baker.make(File))
+        dif.delete()
+        self.assertFalse(File.objects.filter(pk=dif.symcache_id).exists())
+        # Deleted with the project
+        other_dif.project.delete()
+        self.assertFalse(File.objects.filter(pk=other_dif.symcache_id).exists())
+        self.assertTrue(File.objects.filter(pk=other_dif.file_id).exists())
+
 
 class DifsAssembleAPITestCase(GlitchTipTestCase):
     def setUp(self):
@@ -214,6 +229,10 @@ class DifsTasksTestCase(GlitchTipTestCase):
         difs_create_file_from_chunks("12", checksum, chunks)
         file = File.objects.filter(checksum=checksum).first()
         self.assertEqual(file.checksum, checksum)
+        # Chunks are assembled in order into one blob
+        self.assertEqual(file.blob.checksum, checksum)
+        with file.blob.blob.open("rb") as blob_file:
+            self.assertEqual(blob_file.read(), b"12")
 
     def test_difs_create_file_from_chunks_with_mismatched_checksum(self):
         fileblob1 = self.create_file_blob("1", "1")
@@ -222,3 +241,62 @@ class DifsTasksTestCase(GlitchTipTestCase):
         chunks = [fileblob1.checksum, fileblob2.checksum]
         with self.assertRaises(ChecksumMismatched):
             difs_create_file_from_chunks("123", checksum, chunks)
+
+    def test_difs_resolve_stacktrace_by_debug_id(self):
+        debug_id = "81701af2-27b8-9847-1cbc-57992efae007"
+        dif = baker.make(
+            "difs.DebugInformationFile", project=self.project, debug_id=debug_id
+        )
+        baker.make(
+            "difs.DebugInformationFile",
+            project=self.project,
+            debug_id="a959d2e6-e4e5-303e-b508-670eb84b392c",
+            _quantity=3,
+        )
+        event = baker.make(
+            "events.Event",
+            issue__project=self.project,
+            data={
+                "exception": {"values": [{"stacktrace": {"frames": []}}]},
+                "contexts": {"device": {"arch": "x86_64"}},
+                "debug_meta": {"images": [{"debug_id": debug_id.upper()}]},
+            },
+        )
+        with patch("difs.tasks.difs_get_symcache") as get_symcache:
+            get_symcache.return_value = None
+            difs_resolve_stacktrace(event.pk)
+        get_symcache.assert_called_once_with(dif, "x86_64")
+
+    def test_difs_create_difs_file_bytes(self):
+        file = baker.make("files.File", size=1000)
+        archive = MagicMock()
+        archive.iter_objects.return_value = ["x86_64", "arm64"]
+
+        @contextlib.contextmanager
+        def open_archive(file):
+            yield archive
+
+        def get_object_metadata(obj):
+            return {
+                "arch": obj,
+                "debug_id": f"{obj}-id",
+                "code_id": None,
+                "kind": "dbg",
+                "features": [],
+                "symbol_type": "native",
+            }
+
+        with patch("difs.tasks.difs_open_archive", open_archive), patch(
+            "difs.tasks.difs_get_object_metadata", get_object_metadata
+        ), patch("difs.tasks.difs_create_symcache", return_value=None), patch(
+            "difs.tasks.record_organization_usage"
+        ) as record_usage:
+            difs_create_difs(self.project, "test", file)
+            # Objects of one file are counted once
+            record_usage.assert_called_once_with(
+                "file_bytes", {self.project.organization_id: 1000}
+            )
+            record_usage.reset_mock()
+            difs_create_difs(self.project, "test", file)
+            record_usage.assert_not_called()
+        self.assertEqual(file.debuginformationfile_set.count(), 2)
@@ -14,6 +14,7 @@ from symbolic import ProguardMapper
 
 from files.models import File, FileBlob
 from organizations_ext.models import Organization
+from organizations_ext.usage import record_organization_usage
 from projects.models import Project
 
 from .models import DebugInformationFile
@@ -237,6 +238,8 @@ class DsymsAPIView(views.APIView):
                     dif.name = filename
                     dif.project = project
                     dif.file = fileobj
+                    dif.debug_id = proguard_id.lower()
+                    dif.arch = metadata["arch"]
                     dif.data = {
                         "arch": metadata["arch"],
                         "debug_id": proguard_id,
@@ -244,6 +247,9 @@ class DsymsAPIView(views.APIView):
                         "features": ["mapping"],
                     }
                     dif.save()
+                    record_organization_usage(
+                        "file_bytes", {project.organization_id: size}
+                    )
 
                 result = {
                     "id": dif.id,
@@ -5,6 +5,7 @@ from django.utils import timezone
 from model_bakery import baker
 from freezegun import freeze_time
 from glitchtip import test_utils  # pylint: disable=unused-import
+from organizations_ext.usage import flush_usage, record_organization_usage
 from ..tasks import warn_organization_throttle
 
 
@@ -36,7 +37,8 @@ class OrganizationWarnThrottlingTestCase(TestCase):
                 subscription.current_period_start + timedelta(days=30)
             )
             subscription.save()
-            baker.make("events.Event", issue__project=project, _quantity=9)
+            record_organization_usage("events", {project.organization_id: 9})
+            flush_usage()
             warn_organization_throttle()
             self.assertEqual(len(mail.outbox), 1)
             warn_organization_throttle()
@@ -53,6 +55,7 @@ class OrganizationWarnThrottlingTestCase(TestCase):
             warn_organization_throttle()
             self.assertEqual(len(mail.outbox), 1)
 
-            baker.make("events.Event", issue__project=project, _quantity=9)
+            record_organization_usage("events", {project.organization_id: 9})
+            flush_usage()
             warn_organization_throttle()
             self.assertEqual(len(mail.outbox), 2)
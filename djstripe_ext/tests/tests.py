@@ -5,7 +5,6 @@ from django.conf import settings
 from django.utils import timezone
 from rest_framework.test import APITestCase
 from model_bakery import baker
-from freezegun import freeze_time
 from glitchtip import test_utils  # pylint: disable=unused-import
 
 
@@ -66,21 +65,25 @@ class SubscriptionAPITestCase(APITestCase):
             reverse("subscription-detail", args=[self.organization.slug])
             + "events_count/"
         )
-        with freeze_time(timezone.datetime(2020, 3, 1)):
-            baker.make("events.Event", issue__project__organization=self.organization)
-        with freeze_time(timezone.datetime(2020, 1, 5)):
-            baker.make("events.Event")
-            baker.make("events.Event", issue__project__organization=self.organization)
-            baker.make(
-                "performance.TransactionEvent",
-                group__project__organization=self.organization,
-            )
-            baker.make(
-                "releases.ReleaseFile",
-                file__blob__size=1000000,
-                release__organization=self.organization,
-                _quantity=2,
-            )
+        baker.make(
+            "organizations_ext.OrganizationUsage",
+            organization=self.organization,
+            period_start=timezone.make_aware(timezone.datetime(2020, 2, 2)),
+            events=5,
+        )
+        baker.make(
+            "organizations_ext.OrganizationUsage",
+            period_start=timezone.make_aware(timezone.datetime(2020, 1, 2)),
+            events=5,
+        )
+        baker.make(
+            "organizations_ext.OrganizationUsage",
+            organization=self.organization,
+            period_start=timezone.make_aware(timezone.datetime(2020, 1, 2)),
+            events=1,
+            transactions=1,
+            file_bytes=2000000,
+        )
         res = self.client.get(url)
         self.assertEqual(
             res.data,
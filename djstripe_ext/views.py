@@ -10,6 +10,7 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 
 from organizations_ext.models import Organization
+from projects.cache import invalidate_organization_project_auth
 
 from .serializers import (
     CreateSubscriptionSerializer,
@@ -53,13 +54,16 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
             )
             # Check organization throttle, in case it changed recently
             if subscription:
-                Organization.objects.filter(
+                if Organization.objects.filter(
                     id=subscription.customer.subscriber_id,
                     is_accepting_events=False,
                     is_active=True,
                     djstripe_customers__subscriptions__plan__amount__gt=0,
                     djstripe_customers__subscriptions__status="active",
-                ).update(is_accepting_events=True)
+                ).update(is_accepting_events=True):
+                    invalidate_organization_project_auth(
+                        subscription.customer.subscriber_id
+                    )
 
             return subscription
         except Subscription.DoesNotExist:
@@ -0,0 +1,288 @@
+"""
+Batched event ingest
+
+In async ingest mode with EVENT_INGEST_BATCH_SIZE set, the ingest API queues raw
+events on the celery broker instead of sending one celery task per event. The
+ingest_worker management command consumes them in batches, resolving the
+issues of a batch with a single INSERT ... ON CONFLICT and inserting all events
+with another. Only the events that were inserted, and not ignored as duplicates,
+are post-processed.
+"""
+import json
+import logging
+import operator
+from collections import Counter
+from functools import reduce
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from celery import current_app
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from rest_framework import exceptions
+from sentry_sdk import capture_exception, set_level
+
+from difs.tasks import difs_run_resolve_stacktrace
+from glitchtip.partitioning import skip_duplicate_ids
+from issues.grouping import GroupingKey, cache_issue_id, get_cached_issue_id
+from issues.models import EventStatus, Issue
+from issues.tasks import update_search_index_issue
+
+from .models import Event, LogLevel
+from .serializers import get_event_serializer_class
+from .tasks import get_ingest_project, release_ingest_usage, try_store_event
+
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE_NAME = "glitchtip-event-ingest"
+
+INSERT_ISSUES_SQL = """
+INSERT INTO issues_issue (
+    created, culprit, has_seen, is_public, level, metadata, tags,
+    project_id, title, type, status, count, last_seen, grouping_hash
+)
+VALUES {values}
+ON CONFLICT DO NOTHING
+RETURNING id, project_id, grouping_hash, status
+"""
+INSERT_ISSUE_VALUES = (
+    "(%s, %s, false, false, %s, %s, %s, %s, %s, %s, %s, 1, %s, %s::bytea)"
+)
+
+
+def queue_event(project_id: int, data: dict, client_ip: Optional[str]):
+    """Queue an event for the batch ingest worker"""
+    with current_app.pool.acquire(block=True) as conn:
+        queue = conn.SimpleQueue(INGEST_QUEUE_NAME)
+        queue.put({"project_id": project_id, "data": data, "client_ip": client_ip})
+        queue.close()
+
+
+def consume_event_batch(queue, batch_size: int, timeout: float = 1.0) -> int:
+    """
+    Wait up to timeout for queued events, then store up to batch_size of them
+    Returns the number of messages consumed
+    """
+    messages = []
+    try:
+        messages.append(queue.get(block=True, timeout=timeout))
+        while len(messages) < batch_size:
+            messages.append(queue.get(block=False))
+    except queue.Empty:
+        pass
+    if not messages:
+        return 0
+
+    items = [message.payload for message in messages]
+    try:
+        store_event_batch(items)
+    except Exception:  # pylint: disable=broad-except
+        # Don't lose a whole batch because of one bad event. Raised only when
+        # nothing was stored, post-processing errors are logged instead.
+        logger.warning("Batch ingest failed, storing one at a time", exc_info=True)
+        for item in items:
+            project = get_ingest_project(item["project_id"])
+            if project:
+                try_store_event(
+                    item["data"], project, {"client_ip": item.get("client_ip")}
+                )
+    for message in messages:
+        message.ack()
+    return len(messages)
+
+
+def _issue_key(issue_lookup: Dict) -> GroupingKey:
+    return (issue_lookup["project_id"], issue_lookup["grouping_hash"])
+
+
+def _fetch_issues(keys: Iterable[GroupingKey]) -> Dict[GroupingKey, Tuple[int, int]]:
+    query = reduce(
+        operator.or_,
+        (
+            Q(project_id=project_id, grouping_hash=grouping_hash)
+            for project_id, grouping_hash in keys
+        ),
+    )
+    return {
+        (project_id, bytes(grouping_hash)): (issue_id, status)
+        for issue_id, project_id, grouping_hash, status in Issue.objects.filter(
+            query
+        ).values_list("id", "project_id", "grouping_hash", "status")
+    }
+
+
+def get_or_create_issues(
+    issues: Dict[GroupingKey, Dict]
+) -> Dict[GroupingKey, Tuple[int, Optional[int]]]:
+    """
+    Find or create many issues with one select and one insert
+
+    issues maps grouping keys to issue defaults (title, culprit, type, metadata,
+    tags, and level)
+    Returns grouping keys mapped to issue id and status, which is None for cached
+    issues as other processes may have changed it
+    """
+    found = {}
+    for key in issues:
+        if issue_id := get_cached_issue_id(key):
+            found[key] = (issue_id, None)
+    if uncached := [key for key in issues if key not in found]:
+        found.update(_fetch_issues(uncached))
+    missing = [key for key in issues if key not in found]
+    if missing:
+        now = timezone.now()
+        params = []
+        for key in missing:
+            project_id, grouping_hash = key
+            defaults = issues[key]
+            params += [
+                now,
+                defaults["culprit"],
+                int(defaults.get("level", LogLevel.ERROR)),
+                json.dumps(defaults["metadata"]),
+                json.dumps(defaults.get("tags", {})),
+                project_id,
+                defaults["title"],
+                int(defaults["type"]),
+                int(EventStatus.UNRESOLVED),
+                now,
+                grouping_hash,
+            ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                INSERT_ISSUES_SQL.format(
+                    values=", ".join([INSERT_ISSUE_VALUES] * len(missing))
+                ),
+                params,
+            )
+            for issue_id, project_id, grouping_hash, status in cursor:
+                found[(project_id, bytes(grouping_hash))] = (issue_id, status)
+        # Issues created concurrently by another worker
+        if conflicted := [key for key in missing if key not in found]:
+            found.update(_fetch_issues(conflicted))
+    for key, (issue_id, status) in found.items():
+        if status == EventStatus.UNRESOLVED:
+            cache_issue_id(key, issue_id)
+    return found
+
+
+def insert_events(events: List[Event]) -> Set:
+    """
+    Insert events with one statement, ignoring duplicate ids. Returns inserted ids
+    Must run in a transaction.
+    """
+    # Partitioned tables reject duplicate ids with a trigger, not a constraint
+    skip_duplicate_ids()
+    # bulk_create doesn't tell which rows were ignored
+    # pylint: disable=protected-access
+    rows = Event.objects._insert(
+        events,
+        fields=Event._meta.concrete_fields,
+        returning_fields=[Event._meta.pk],
+        on_conflict=OnConflict.IGNORE,
+    )
+    # A single ignored row is returned as None
+    return {row[0] for row in rows if row}
+
+
+def store_event_batch(items: List[Dict]):
+    """
+    Store queued events in bulk
+
+    items are dicts of project_id, data, and client_ip as queued by queue_event
+    Invalid events are logged and skipped. Duplicate event ids are ignored.
+    """
+    projects = {}
+    prepared = []
+    # Invalid and duplicate events were counted in usage by the ingest API
+    not_stored = Counter()
+    for item in items:
+        project_id = item["project_id"]
+        if project_id not in projects:
+            projects[project_id] = get_ingest_project(project_id)
+        project = projects[project_id]
+        if project is None:
+            continue
+        data = item["data"]
+        context = {"project": project, "client_ip": item.get("client_ip")}
+        serializer = get_event_serializer_class(data)(data=data, context=context)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except exceptions.ValidationError as err:
+            set_level("warning")
+            capture_exception(err)
+            logger.warning("Invalid event %s", err.detail)
+            not_stored[project_id] += 1
+            continue
+        issue_lookup, defaults, params = serializer.prepare(serializer.validated_data)
+        prepared.append((project, _issue_key(issue_lookup), defaults, params))
+
+    if not prepared:
+        _release_not_stored(not_stored)
+        return
+    # Errors up to here fail the batch, nothing was stored yet
+    events, issues = _insert_prepared_events(prepared, not_stored)
+    _release_not_stored(not_stored)
+    try:
+        _post_process_events(events, issues)
+    except Exception:  # pylint: disable=broad-except
+        # The events are stored, they must not be stored again
+        logger.warning("Post-processing stored events failed", exc_info=True)
+
+
+def _release_not_stored(not_stored: Counter):
+    for project_id, count in not_stored.items():
+        release_ingest_usage(project_id, "events", count)
+
+
+def _insert_prepared_events(prepared: List[Tuple], not_stored: Counter):
+    """
+    Insert validated events in one transaction, counting duplicates in
+    not_stored by project id. Returns inserted (project, event) pairs, and
+    issue ids and statuses by grouping key.
+    """
+    issue_defaults = {}
+    for project, key, defaults, params in prepared:
+        issue_defaults.setdefault(key, defaults)
+
+    with transaction.atomic():
+        for project, key, defaults, params in prepared:
+            if not project.first_event and params.get("timestamp"):
+                project.first_event = params["timestamp"]
+                project.save(update_fields=["first_event"])
+        issues = get_or_create_issues(issue_defaults)
+        events = [
+            (project, Event(issue_id=issues[key][0], **params))
+            for project, key, defaults, params in prepared
+        ]
+        inserted_ids = insert_events([event for _, event in events])
+
+    # Events with duplicate ids were ignored, they must not regress or count again
+    for project, event in events:
+        if event.pk not in inserted_ids:
+            not_stored[project.id] += 1
+    events = [
+        (project, event) for project, event in events if event.pk in inserted_ids
+    ]
+    return events, issues
+
+
+def _post_process_events(events: List[Tuple], issues: Dict):
+    issue_ids = {event.issue_id for _, event in events}
+    resolved_issue_ids = [
+        issue_id
+        for issue_id, status in issues.values()
+        if status in (EventStatus.RESOLVED, None) and issue_id in issue_ids
+    ]
+    if resolved_issue_ids:
+        for issue in Issue.objects.filter(
+            id__in=resolved_issue_ids, status=EventStatus.RESOLVED
+        ):
+            issue.check_for_status_update()
+    for issue_id in issue_ids:
+        # Expire after 1 hour - in case of major backup
+        update_search_index_issue(args=[issue_id], countdown=10, expires=3600)
+    for project, event in events:
+        if event.data.get("exception") is not None and project.has_difs:
+            difs_run_resolve_stacktrace(event.pk)
@@ -1,12 +1,16 @@
 import copy
 import itertools
 import re
+import threading
+from collections import OrderedDict
 from os.path import splitext
 from urllib.parse import urlsplit
 
+from prometheus_client import Counter
 from symbolic import SourceMapView, SourceView
 
-from files.models import File
+from files.models import FileBlob
+from releases.artifacts import find_artifact, normalize_artifact_url
 from sentry.utils.safe import get_path
 
 from .base import EventProcessorBase
@@ -29,6 +33,67 @@ CLEAN_MODULE_RE = re.compile(
 VERSION_RE = re.compile(r"^[a-f0-9]{32}|[a-f0-9]{40}$", re.I)
 NODE_MODULES_RE = re.compile(r"\bnode_modules/")
 
+# Approximate, parsed views are sized by their file size
+SOURCE_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+SOURCE_CACHE_REQUESTS = Counter(
+    "glitchtip_source_cache_requests",
+    "Parsed source map and minified source cache lookups",
+    ["kind", "result"],
+)
+
+
+class SourceViewCache:
+    """
+    Per process LRU cache of parsed source maps and minified sources
+    Keyed by file blob checksum, so a changed file is never served stale
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self._cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # Threaded workers share the cache, and reordering isn't thread safe
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, checksum: str, parse):
+        key = (kind, checksum)
+        with self._lock:
+            if cached := self._cache.get(key):
+                self._cache.move_to_end(key)
+        if cached:
+            SOURCE_CACHE_REQUESTS.labels(kind, "hit").inc()
+            return cached[1]
+        SOURCE_CACHE_REQUESTS.labels(kind, "miss").inc()
+
+        blob = FileBlob.objects.filter(checksum=checksum).first()
+        if blob is None:
+            # Deleted since the release manifest was cached
+            return None
+        # symbolic parses bytes, not paths, so parsing copies the file once.
+        # Mapping it avoids reading it into memory before that.
+        with blob.open_mmap() as data:
+            view = parse(data)
+            size = len(data)
+        with self._lock:
+            # Parsed by another thread meanwhile, don't count it twice
+            if replaced := self._cache.pop(key, None):
+                self.size -= replaced[0]
+            self._cache[key] = (size, view)
+            self.size += size
+            while self.size > self.max_size and len(self._cache) > 1:
+                size, _ = self._cache.popitem(last=False)[1]
+                self.size -= size
+        return view
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.size = 0
+
+
+source_view_cache = SourceViewCache(SOURCE_CACHE_MAX_SIZE)
+
 
 def generate_module(src):
     """
@@ -81,15 +146,11 @@ class JavascriptEventProcessor(EventProcessorBase):
         merged = list(itertools.chain(*frames))
         return [f for f in merged if f is not None and f.get("lineno") is not None]
 
-    def process_frame(self, frame, map_file, minified_source):
+    def process_frame(self, frame, sourcemap_view, minified_source_view):
         # Required to determine source
         if not frame.get("abs_path") or not frame.get("lineno"):
             return
 
-        minified_source.blob.blob.seek(0)
-        map_file.blob.blob.seek(0)
-        sourcemap_view = SourceMapView.from_json_bytes(map_file.blob.blob.read())
-        minified_source_view = SourceView.from_bytes(minified_source.blob.blob.read())
         token = sourcemap_view.lookup(
             frame["lineno"] - 1,
             frame["colno"] - 1,
@@ -153,17 +214,37 @@ class JavascriptEventProcessor(EventProcessorBase):
         if in_app is not None:
             frame["in_app"] = in_app
 
+    def get_frames_by_artifacts(self, frames):
+        """
+        Group frames by their source map and minified source checksums, so each
+        is loaded once. Uses the cached release manifest, no database queries.
+        """
+        manifest = self.release.get_artifact_manifest()
+        artifacts = manifest["artifacts"]
+        frames_by_artifacts = {}
+        for frame in frames:
+            if not frame.get("abs_path"):
+                continue
+            minified_url = find_artifact(manifest, frame["abs_path"])
+            sourcemap_url = artifacts[minified_url][1] if minified_url else None
+            if sourcemap_url not in artifacts:
+                sourcemap_url = find_artifact(
+                    manifest, normalize_artifact_url(frame["abs_path"]) + ".map"
+                )
+            if not sourcemap_url:
+                continue
+            minified_checksum = artifacts[minified_url][0] if minified_url else None
+            frames_by_artifacts.setdefault(
+                (artifacts[sourcemap_url][0], minified_checksum), []
+            ).append(frame)
+        return frames_by_artifacts
+
     def transform(self):
         stacktraces = self.get_stacktraces()
         frames = self.get_valid_frames(stacktraces)
-        filenames = {frame["filename"].split("/")[-1] for frame in frames}
-        # Make a guess at which files are relevant, match then better after
-        source_files = File.objects.filter(
-            releasefile__release=self.release,
-            name__in={filename + ".map" for filename in filenames} | filenames,
-        )
+        frames_by_artifacts = self.get_frames_by_artifacts(frames)
 
-        if not source_files:
+        if not frames_by_artifacts:
             return
 
         # Copy original stacktrace before modifying them
@@ -172,19 +253,17 @@ class JavascriptEventProcessor(EventProcessorBase):
         ):
             exception["raw_stacktrace"] = copy.deepcopy(exception["stacktrace"])
 
-        frames_with_source = []
-        for frame in frames:
-            minified_filename = frame["abs_path"].split("/")[-1]
-            map_filename = minified_filename + ".map"
-            minified_file = None
-            map_file = None
-            for source_file in source_files:
-                if source_file.name == minified_filename:
-                    minified_file = source_file
-                if source_file.name == map_filename:
-                    map_file = source_file
-            if map_file:
-                frames_with_source.append((frame, map_file, minified_file))
-
-        for frame_with_source in frames_with_source:
-            self.process_frame(*frame_with_source)
+        for checksums, artifact_frames in frames_by_artifacts.items():
+            map_checksum, minified_checksum = checksums
+            sourcemap_view = source_view_cache.get(
+                "sourcemap", map_checksum, SourceMapView.from_json_bytes
+            )
+            if sourcemap_view is None:
+                continue
+            minified_source_view = None
+            if minified_checksum:
+                minified_source_view = source_view_cache.get(
+                    "source", minified_checksum, SourceView.from_bytes
+                )
+            for frame in artifact_frames:
+                self.process_frame(frame, sourcemap_view, minified_source_view)
@@ -0,0 +1,149 @@
+"""
+Cache for the environments and releases of ingested events
+
+Events name an environment and a release, which must exist in the
+organization and be linked to the event's project. The same few names repeat
+for nearly every event, so the ids of known (project, name) pairs are cached in
+process memory and in the shared django cache (redis). A cached pair means both
+the row and the project membership exist. On a miss, one statement inserts
+whichever is missing with ON CONFLICT DO NOTHING and returns the id.
+"""
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha1
+from typing import Iterable, Optional
+
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+INGEST_CACHE_TIMEOUT = 3600
+# The local cache can't be invalidated across processes, keep it brief
+LOCAL_INGEST_CACHE_TIMEOUT = 10
+LOCAL_INGEST_CACHE_SIZE = 10000
+
+# Rows inserted by concurrent statements may not be visible to the select yet,
+# the statement returns no row then and should be run again
+UPSERT_ENVIRONMENT_SQL = """
+WITH inserted AS (
+    INSERT INTO environments_environment (created, organization_id, name)
+    VALUES (%(now)s, %(organization_id)s, %(name)s)
+    ON CONFLICT (organization_id, name) DO NOTHING
+    RETURNING id
+), environment AS (
+    SELECT id FROM inserted
+    UNION ALL
+    SELECT id FROM environments_environment
+    WHERE organization_id = %(organization_id)s AND name = %(name)s
+), membership AS (
+    INSERT INTO environments_environmentproject (
+        created, environment_id, project_id, is_hidden
+    )
+    SELECT %(now)s, id, %(project_id)s, false FROM environment LIMIT 1
+    ON CONFLICT (project_id, environment_id) DO NOTHING
+)
+SELECT id FROM environment LIMIT 1
+"""
+
+UPSERT_RELEASE_SQL = """
+WITH inserted AS (
+    INSERT INTO releases_release (
+        created, organization_id, version, data, commit_count, deploy_count
+    )
+    VALUES (%(now)s, %(organization_id)s, %(name)s, '{}', 0, 0)
+    ON CONFLICT (organization_id, version) DO NOTHING
+    RETURNING id
+), release AS (
+    SELECT id FROM inserted
+    UNION ALL
+    SELECT id FROM releases_release
+    WHERE organization_id = %(organization_id)s AND version = %(name)s
+), membership AS (
+    INSERT INTO releases_release_projects (release_id, project_id)
+    SELECT id, %(project_id)s FROM release LIMIT 1
+    ON CONFLICT (release_id, project_id) DO NOTHING
+)
+SELECT id FROM release LIMIT 1
+"""
+
+_local_cache: "OrderedDict[str, tuple]" = OrderedDict()
+# Threaded workers share the local cache, and reordering isn't thread safe
+_local_cache_lock = threading.Lock()
+
+
+def _get_cache_key(kind: str, project_id: int, name: str) -> str:
+    return f"ingest-{kind}:{project_id}:{sha1(name.encode()).hexdigest()}"
+
+
+def _get_local(cache_key: str) -> Optional[int]:
+    with _local_cache_lock:
+        cached = _local_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+def _set_local(cache_key: str, value: int):
+    with _local_cache_lock:
+        _local_cache[cache_key] = (
+            time.monotonic() + LOCAL_INGEST_CACHE_TIMEOUT,
+            value,
+        )
+        _local_cache.move_to_end(cache_key)
+        while len(_local_cache) > LOCAL_INGEST_CACHE_SIZE:
+            _local_cache.popitem(last=False)
+
+
+def _upsert(sql: str, organization_id: int, project_id: int, name: str) -> int:
+    params = {
+        "now": timezone.now(),
+        "organization_id": organization_id,
+        "project_id": project_id,
+        "name": name,
+    }
+    with connection.cursor() as cursor:
+        for _ in range(3):
+            cursor.execute(sql, params)
+            if row := cursor.fetchone():
+                return row[0]
+    raise RuntimeError(f"Unable to upsert {name}")
+
+
+def _get_or_create_id(
+    kind: str, sql: str, organization_id: int, project_id: int, name: str
+) -> int:
+    cache_key = _get_cache_key(kind, project_id, name)
+    value = _get_local(cache_key)
+    if value is None:
+        value = cache.get(cache_key)
+        if value is None:
+            value = _upsert(sql, organization_id, project_id, name)
+            cache.set(cache_key, value, INGEST_CACHE_TIMEOUT)
+        _set_local(cache_key, value)
+    return value
+
+
+def get_environment_id(organization_id: int, project_id: int, name: str) -> int:
+    """Id of the named environment, created and linked to the project if needed"""
+    return _get_or_create_id(
+        "environment", UPSERT_ENVIRONMENT_SQL, organization_id, project_id, name
+    )
+
+
+def get_release_id(organization_id: int, project_id: int, version: str) -> int:
+    """Id of the release version, created and linked to the project if needed"""
+    return _get_or_create_id(
+        "release", UPSERT_RELEASE_SQL, organization_id, project_id, version
+    )
+
+
+def forget_release(project_ids: Iterable[int], version: str):
+    """Call when a release is deleted or unlinked from projects"""
+    cache_keys = [
+        _get_cache_key("release", project_id, version) for project_id in project_ids
+    ]
+    with _local_cache_lock:
+        for cache_key in cache_keys:
+            _local_cache.pop(cache_key, None)
+    cache.delete_many(cache_keys)
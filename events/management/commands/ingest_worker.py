@@ -0,0 +1,34 @@
+from celery import current_app
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from events.batch import INGEST_QUEUE_NAME, consume_event_batch
+
+
+class Command(BaseCommand):
+    help = "Store events queued by the ingest API in batches. Requires EVENT_INGEST_BATCH_SIZE."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.EVENT_INGEST_BATCH_SIZE or 100,
+            help="Max events to store per batch",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=1.0,
+            help="Seconds to wait for events before storing a partial batch",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        self.stdout.write(f"Consuming {INGEST_QUEUE_NAME} in batches of {batch_size}")
+        with current_app.connection_for_read() as conn:
+            queue = conn.SimpleQueue(INGEST_QUEUE_NAME)
+            try:
+                while True:
+                    consume_event_batch(queue, batch_size, options["timeout"])
+            finally:
+                queue.close()
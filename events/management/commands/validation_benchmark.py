@@ -0,0 +1,87 @@
+import copy
+import glob
+import json
+import logging
+from timeit import default_timer as timer
+
+from django.core.management.base import BaseCommand
+
+from events.schema import without_compiled_schema
+from events.serializers import get_event_serializer_class
+from performance.serializers import TransactionEventSerializer
+
+LARGE_SIZE = 500
+
+
+def load_payloads(pattern: str):
+    """Event and transaction payloads of test data files, including envelopes"""
+    payloads = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as json_file:
+            data = json.load(json_file)
+        for payload in data if isinstance(data, list) else [data]:
+            if "start_timestamp" in payload or "platform" in payload:
+                payloads.append(payload)
+    return payloads
+
+
+def get_serializer_class(payload):
+    if "start_timestamp" in payload:
+        return TransactionEventSerializer
+    return get_event_serializer_class(payload)
+
+
+class Command(BaseCommand):
+    help = "Time (for performance) validating test data payloads with compiled schemas and with DRF only."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations", type=int, default=200, help="Validations of each payload"
+        )
+
+    def time_validation(self, serializer_class, payloads, iterations: int) -> float:
+        copies = [copy.deepcopy(payloads) for _ in range(iterations)]
+        start = timer()
+        for payload_copies in copies:
+            for payload in payload_copies:
+                serializer = serializer_class(payload)(data=payload, context={})
+                serializer.is_valid(raise_exception=True)
+        return timer() - start
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        # Such as span description truncation warnings
+        logging.disable(logging.WARNING)
+        events = load_payloads("events/test_data/incoming_events/*.json")
+        transactions = load_payloads("events/test_data/transactions/*.json")
+        large_event = copy.deepcopy(
+            load_payloads(
+                "events/test_data/incoming_events/js_error_with_context.json"
+            )[0]
+        )
+        breadcrumbs = large_event["breadcrumbs"]
+        large_event["breadcrumbs"] = [
+            breadcrumbs[i % len(breadcrumbs)] for i in range(LARGE_SIZE)
+        ]
+        large_transaction = copy.deepcopy(
+            load_payloads("events/test_data/transactions/js_simple.json")[0]
+        )
+        spans = large_transaction["spans"]
+        large_transaction["spans"] = [spans[i % len(spans)] for i in range(LARGE_SIZE)]
+
+        self.stdout.write(f"{'payloads':<24}{'drf':>10}{'compiled':>10}{'speedup':>10}")
+        for name, payloads in [
+            ("events", events),
+            ("transactions", transactions),
+            (f"{LARGE_SIZE} breadcrumbs", [large_event]),
+            (f"{LARGE_SIZE} spans", [large_transaction]),
+        ]:
+            drf = self.time_validation(
+                lambda payload: without_compiled_schema(get_serializer_class(payload)),
+                payloads,
+                iterations,
+            )
+            compiled = self.time_validation(get_serializer_class, payloads, iterations)
+            self.stdout.write(
+                f"{name:<24}{drf:>10.3f}{compiled:>10.3f}{drf / compiled:>9.1f}x"
+            )
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 04:28
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('events', '0003_auto_20210219_1951'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='event',
+            index=models.Index(fields=['issue', 'created'], name='event_issue_created_idx'),
+        ),
+    ]
@@ -3,12 +3,12 @@ from django.db import models
 from django.contrib.postgres.fields import HStoreField
 from user_reports.models import UserReport
 from glitchtip.base_models import CreatedModel
-from glitchtip.model_utils import FromStringIntegerChoices
+from glitchtip.model_utils import FastJSONField, FromStringIntegerChoices
 
 
 class AbstractEvent(CreatedModel):
     event_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    data = models.JSONField(help_text="General event data that is searchable")
+    data = FastJSONField(help_text="General event data that is searchable")
     timestamp = models.DateTimeField(
         blank=True,
         null=True,
@@ -75,6 +75,9 @@ class Event(AbstractEvent):
 
     class Meta:
         ordering = ["-created"]
+        indexes = [
+            models.Index(fields=["issue", "created"], name="event_issue_created_idx")
+        ]
 
     def event_json(self):
         """
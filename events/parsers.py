@@ -1,27 +1,86 @@
-import codecs
-from django.conf import settings
-from rest_framework.parsers import JSONParser
+import io
+from typing import Iterator, Tuple, Union
+
+from rest_framework.parsers import BaseParser
 from rest_framework.exceptions import ParseError
+from rest_framework.settings import api_settings
 from rest_framework.utils import json
 
+from glitchtip import fast_json
+
+# Item types with JSON payloads, others such as attachments are kept as bytes
+JSON_ITEM_TYPES = {
+    "event",
+    "transaction",
+    "session",
+    "sessions",
+    "user_report",
+    "client_report",
+    "check_in",
+}
+
+
+class Envelope:
+    """
+    Sentry envelope headers and its items, which are read from the request
+    stream one at a time while iterating
+    """
+
+    def __init__(self, headers: dict, items: Iterator):
+        self.headers = headers
+        self._items = items
 
-class EnvelopeParser(JSONParser):
+    def __iter__(self) -> Iterator[Tuple[dict, Union[dict, bytes]]]:
+        return self._items
+
+
+def _load_json(line: bytes, parse_constant=None):
+    try:
+        if parse_constant is json.strict_constant:
+            return fast_json.loads(line)
+        return json.loads(line, parse_constant=parse_constant)
+    except ValueError as exc:
+        raise ParseError("JSON parse error - %s" % str(exc))
+
+
+class EnvelopeParser(BaseParser):
     media_type = "application/x-sentry-envelope"
+    strict = api_settings.STRICT_JSON
 
     def parse(self, stream, media_type=None, parser_context=None):
         """
-        Parses the incoming bytestream as JSON and returns the resulting data.
-        Supports multiple lines of JSON objects
+        Parses the envelope headers and returns an Envelope, with items parsed
+        lazily. Items are delimited by the length header when present, otherwise
+        by newline.
         """
-        parser_context = parser_context or {}
-        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
-
-        try:
-            decoded_stream = codecs.getreader(encoding)(stream)
-            parse_constant = json.strict_constant if self.strict else None
-            messages = []
-            for line in decoded_stream:
-                messages.append(json.loads(line, parse_constant=parse_constant))
-            return messages
-        except ValueError as exc:
-            raise ParseError("JSON parse error - %s" % str(exc))
+        if isinstance(stream, io.RawIOBase):
+            stream = io.BufferedReader(stream)
+        parse_constant = json.strict_constant if self.strict else None
+        headers = _load_json(stream.readline(), parse_constant)
+        if not isinstance(headers, dict):
+            raise ParseError("Envelope headers must be an object")
+        return Envelope(headers, self.parse_items(stream, parse_constant))
+
+    def parse_items(self, stream, parse_constant=None):
+        while line := stream.readline():
+            if not line.strip():
+                continue
+            item_header = _load_json(line, parse_constant)
+            if not isinstance(item_header, dict):
+                raise ParseError("Envelope item headers must be an object")
+            length = item_header.get("length")
+            if length is not None:
+                try:
+                    payload = stream.read(int(length))
+                except (TypeError, ValueError) as exc:
+                    raise ParseError("Invalid envelope item length") from exc
+                if len(payload) < int(length):
+                    raise ParseError("Envelope item is shorter than its length")
+                # Consume the newline after the payload
+                if stream.readline().strip():
+                    raise ParseError("Envelope item is longer than its length")
+            else:
+                payload = stream.readline().rstrip(b"\r\n")
+            if item_header.get("type") in JSON_ITEM_TYPES:
+                payload = _load_json(payload, parse_constant)
+            yield item_header, payload
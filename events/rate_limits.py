@@ -0,0 +1,169 @@
+"""
+Token bucket rate limits for event ingest
+
+Each limit is a bucket of count tokens that refills over window seconds, so
+that bursts up to count are allowed while the sustained rate is count per
+window. Limits are set per DSN key on ProjectKey and per project by
+INGEST_PROJECT_RATE_LIMIT_COUNT. All buckets of a request are checked and
+taken in one Redis round trip by a Lua script. An event is only counted when
+every bucket has a token.
+
+When the cache isn't Redis, such as in development, buckets are kept in process
+memory instead.
+"""
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_REQUESTS = Counter(
+    "glitchtip_ingest_rate_limit_requests",
+    "Ingest requests checked against rate limits, by the scope that rejected them",
+    ["result"],
+)
+
+# KEYS are bucket keys, ARGV holds the count and window in ms of each bucket
+# Returns the 1-based index of the limiting bucket, or 0, and the wait in ms
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local tokens = {}
+local limited = 0
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local count = tonumber(ARGV[i * 2 - 1])
+    local window = tonumber(ARGV[i * 2])
+    local state = redis.call("HMGET", key, "tokens", "ts")
+    local available = tonumber(state[1]) or count
+    local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+    available = math.min(count, available + elapsed * count / window)
+    tokens[i] = available
+    if available < 1 then
+        local wait = math.ceil((1 - available) * window / count)
+        if wait > retry_after then
+            limited = i
+            retry_after = wait
+        end
+    end
+end
+if limited == 0 then
+    for i, key in ipairs(KEYS) do
+        redis.call("HSET", key, "tokens", tostring(tokens[i] - 1), "ts", now)
+        redis.call("PEXPIRE", key, tonumber(ARGV[i * 2]))
+    end
+end
+return {limited, retry_after}
+"""
+
+
+@dataclass
+class RateLimit:
+    key: str
+    scope: str
+    count: int
+    window: int  # seconds
+
+
+@dataclass
+class RateLimited:
+    scope: str
+    retry_after: int  # seconds
+
+
+def get_rate_limits(project_auth: Dict, public_key: str) -> List[RateLimit]:
+    """Limits that apply to an event sent with public_key, from project auth cache"""
+    limits = []
+    if key_limit := project_auth.get("rate_limits", {}).get(public_key):
+        count, window = key_limit
+        limits.append(RateLimit(f"rl:key:{public_key}", "key", count, window))
+    if settings.INGEST_PROJECT_RATE_LIMIT_COUNT:
+        limits.append(
+            RateLimit(
+                f"rl:project:{project_auth['id']}",
+                "project",
+                settings.INGEST_PROJECT_RATE_LIMIT_COUNT,
+                settings.INGEST_PROJECT_RATE_LIMIT_WINDOW,
+            )
+        )
+    return limits
+
+
+class LocalTokenBuckets:
+    """Same algorithm as TOKEN_BUCKET_SCRIPT, for one process"""
+
+    def __init__(self):
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        self.lock = threading.Lock()
+
+    def take(self, limits: List[RateLimit]) -> Tuple[int, int]:
+        now = time.monotonic() * 1000
+        with self.lock:
+            tokens = []
+            limited = 0
+            retry_after = 0
+            for i, limit in enumerate(limits, 1):
+                window = limit.window * 1000
+                available, last = self.buckets.get(limit.key, (limit.count, now))
+                available = min(
+                    limit.count, available + (now - last) * limit.count / window
+                )
+                tokens.append(available)
+                if available < 1:
+                    wait = math.ceil((1 - available) * window / limit.count)
+                    if wait > retry_after:
+                        limited = i
+                        retry_after = wait
+            if limited == 0:
+                for limit, available in zip(limits, tokens):
+                    self.buckets[limit.key] = (available - 1, now)
+            return limited, retry_after
+
+
+local_buckets = LocalTokenBuckets()
+_script = None
+
+
+def _take_tokens(limits: List[RateLimit]) -> Tuple[int, int]:
+    global _script  # pylint: disable=global-statement
+    try:
+        # pylint: disable=import-outside-toplevel
+        from django_redis import get_redis_connection
+
+        connection = get_redis_connection("default")
+    except (ImportError, NotImplementedError):
+        return local_buckets.take(limits)
+    if _script is None:
+        _script = connection.register_script(TOKEN_BUCKET_SCRIPT)
+    args = []
+    for limit in limits:
+        args += [limit.count, limit.window * 1000]
+    limited, retry_after = _script(
+        keys=[limit.key for limit in limits], args=args, client=connection
+    )
+    return int(limited), int(retry_after)
+
+
+def check_rate_limits(limits: List[RateLimit]) -> Optional[RateLimited]:
+    """Take a token from each limit's bucket, unless any of them is empty"""
+    if not limits:
+        return None
+    try:
+        limited, retry_after = _take_tokens(limits)
+    except Exception:  # pylint: disable=broad-except
+        # Don't reject events because the rate limiter is unavailable
+        logger.warning("Rate limit check failed", exc_info=True)
+        RATE_LIMIT_REQUESTS.labels("error").inc()
+        return None
+    if not limited:
+        RATE_LIMIT_REQUESTS.labels("accepted").inc()
+        return None
+    scope = limits[limited - 1].scope
+    RATE_LIMIT_REQUESTS.labels(scope).inc()
+    return RateLimited(scope, max(1, math.ceil(retry_after / 1000)))
@@ -0,0 +1,378 @@
+"""
+Compiled validators for event payloads
+
+DRF validates each event by copying every declared field of the serializer and
+its nested serializers, then running each field through several layers of
+method calls. Events with hundreds of breadcrumbs or spans spend most of their
+ingest time there. A Schema compiles the declared fields of a serializer class
+once, into plain functions that produce the same validated data.
+
+Schemas only handle payloads they are certain about. Anything else, such as
+invalid values, values that forgiving fields would drop and report in
+handled_errors, or field types the compiler doesn't know, raises
+SchemaFallback, and the payload is validated again by DRF. Error responses and
+handled errors therefore always come from DRF.
+
+JSONField values are not checked to be JSON serializable, as payloads are
+always parsed from JSON. Serializers that override to_internal_value must move
+their changes to a normalize_input(data) method to be compiled.
+"""
+import re
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Callable, Dict, List, Optional
+
+from django.core.validators import ProhibitNullCharactersValidator
+from rest_framework import fields, serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import SkipField, empty
+from rest_framework.validators import ProhibitSurrogateCharactersValidator
+
+from glitchtip.serializers import FlexibleDateTimeField
+
+from .fields import (
+    ForgivingDisallowRegexField,
+    ErrorValueDetail,
+    ForgivingHStoreField,
+    GenericField,
+    QueryStringField,
+)
+
+SURROGATES = re.compile("[\ud800-\udfff]")
+# Checked inline by compiled char fields
+CHAR_VALIDATORS = (
+    ProhibitNullCharactersValidator,
+    ProhibitSurrogateCharactersValidator,
+)
+# Fields whose to_internal_value is used as is
+CONVERTED_FIELDS = (
+    serializers.DateTimeField,
+    serializers.UUIDField,
+    FlexibleDateTimeField,
+    QueryStringField,
+)
+IDENTITY_FIELDS = (GenericField, fields._UnvalidatedField)
+
+
+class SchemaFallback(Exception):
+    """The payload needs full DRF validation"""
+
+
+class HandledErrors(Exception):
+    """A forgiving field dropped invalid values, as in ForgivingFieldMixin"""
+
+    def __init__(self, value, errors: List[ErrorValueDetail]):
+        super().__init__()
+        self.value = value
+        self.errors = errors
+
+
+def _fallback(value):
+    raise SchemaFallback()
+
+
+def _with_validators(convert: Callable, field) -> Callable:
+    validators = [
+        validator
+        for validator in field.validators
+        if not isinstance(validator, CHAR_VALIDATORS)
+    ]
+    if not validators:
+        return convert
+
+    def validate(value):
+        value = convert(value)
+        for validator in validators:
+            if getattr(validator, "requires_context", False):
+                validator(value, field)
+            else:
+                validator(value)
+        return value
+
+    return validate
+
+
+def _compile_char(field, pattern: Optional[str] = None) -> Callable:
+    allow_blank = field.allow_blank
+    trim_whitespace = field.trim_whitespace
+    regex = re.compile(pattern) if pattern else None
+
+    def convert(value):
+        if type(value) is not str:  # pylint: disable=unidiomatic-typecheck
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise SchemaFallback()
+            value = str(value)
+        if trim_whitespace:
+            value = value.strip()
+        if not value:
+            if allow_blank:
+                return ""
+            raise SchemaFallback()
+        if "\x00" in value or SURROGATES.search(value):
+            raise SchemaFallback()
+        if regex and regex.match(value) is None:
+            # Forgiving fields report these in handled_errors
+            raise SchemaFallback()
+        return value
+
+    return convert
+
+
+def _compile_message(field) -> Callable:
+    # pylint: disable=import-outside-toplevel
+    from .serializers import FormattedMessageSerializer
+
+    convert_char = _compile_char(field)
+    schema = get_schema(FormattedMessageSerializer)
+
+    def convert(value):
+        if isinstance(value, dict):
+            return schema.run_validation(value)
+        return convert_char(value)
+
+    return convert
+
+
+def _compile_dict(field) -> Callable:
+    convert_child = compile_field(field.child)
+    allow_empty = field.allow_empty
+
+    def convert(value):
+        if not isinstance(value, dict) or (not allow_empty and not value):
+            raise SchemaFallback()
+        return {
+            str(key): convert_child(child_value) for key, child_value in value.items()
+        }
+
+    return convert
+
+
+def _compile_forgiving_dict(field) -> Callable:
+    """Same as ForgivingHStoreField, raises HandledErrors for dropped values"""
+    convert_child = compile_field(field.child)
+    allow_empty = field.allow_empty
+
+    def convert(value):
+        if not isinstance(value, dict) or (not allow_empty and not value):
+            raise SchemaFallback()
+        result = {}
+        errors = []
+        for key, child_value in value.items():
+            if child_value is None:
+                continue
+            key = str(key)
+            try:
+                result[key] = convert_child(child_value)
+            except SchemaFallback:
+                # Let DRF tell the error
+                try:
+                    result[key] = field.child.run_validation(child_value)
+                except ValidationError as err:
+                    errors += [
+                        ErrorValueDetail(str(detail), detail.code, child_value)
+                        for detail in err.detail
+                    ]
+        if errors:
+            raise HandledErrors(result, errors)
+        return result
+
+    return convert
+
+
+def _compile_list(field) -> Callable:
+    convert_child = compile_field(field.child)
+    allow_empty = field.allow_empty
+
+    def convert(value):
+        if isinstance(value, (str, Mapping)) or not hasattr(value, "__iter__"):
+            raise SchemaFallback()
+        if not allow_empty and len(value) == 0:
+            raise SchemaFallback()
+        return [convert_child(item) for item in value]
+
+    return convert
+
+
+def _compile_conversion(field) -> Callable:
+    """Compile converting a value that isn't empty or None"""
+    # pylint: disable=import-outside-toplevel
+    from .serializers import MessageField
+
+    field_class = type(field)
+    if isinstance(field, serializers.ListSerializer):
+        return _fallback
+    if isinstance(field, serializers.Serializer):
+        return get_schema(field_class).run_validation
+    if field_class is serializers.CharField:
+        return _compile_char(field)
+    if field_class is ForgivingDisallowRegexField:
+        return _compile_char(field, field.disallow_regex)
+    if field_class is MessageField:
+        return _compile_message(field)
+    if field_class is serializers.JSONField and not field.binary:
+        return lambda value: value
+    if field_class in IDENTITY_FIELDS:
+        return lambda value: value
+    if field_class in (serializers.DictField, serializers.HStoreField):
+        return _compile_dict(field)
+    if field_class is ForgivingHStoreField:
+        return _compile_forgiving_dict(field)
+    if field_class is serializers.ListField:
+        return _compile_list(field)
+    if field_class in CONVERTED_FIELDS:
+        return field.to_internal_value
+    return _fallback
+
+
+def compile_field(field) -> Callable:
+    """
+    Compile a bound field into a function of its primitive value, or empty when
+    missing, as Field.run_validation. Raises SkipField when missing and optional.
+    """
+    convert = _compile_conversion(field)
+    if not isinstance(field, serializers.Serializer):
+        convert = _with_validators(convert, field)
+    required = field.required
+    allow_null = field.allow_null
+    default = field.default
+    if getattr(default, "requires_context", False):
+        return _fallback
+
+    def run_validation(value):
+        if value is empty:
+            if required:
+                raise SchemaFallback()
+            if default is empty:
+                raise SkipField()
+            return default() if callable(default) else default
+        if value is None:
+            if allow_null:
+                return None
+            raise SchemaFallback()
+        return convert(value)
+
+    return run_validation
+
+
+class Schema:
+    """Compiled validation of one serializer class"""
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        # Validates nested values, and calls validate methods of the class
+        self.prototype = serializer_class()
+        self.normalize = getattr(self.prototype, "normalize_input", None)
+        self.compiled = (
+            self.normalize is not None
+            or serializer_class.to_internal_value
+            is serializers.Serializer.to_internal_value
+        )
+        self.has_validators = bool(self.prototype.validators)
+        self.has_validate = (
+            serializer_class.validate is not serializers.Serializer.validate
+        )
+        self.plan = []
+        for name, field in self.prototype.fields.items():
+            if field.read_only:
+                continue
+            if field.source_attrs != [name]:
+                self.compiled = False
+            validate_method = getattr(serializer_class, "validate_" + name, None)
+            self.plan.append(
+                (name, compile_field(field), validate_method is not None)
+            )
+
+    def to_internal_value(self, data, serializer=None):
+        """Same as Serializer.to_internal_value of serializer, or the prototype"""
+        if not self.compiled:
+            raise SchemaFallback()
+        if self.normalize:
+            data = self.normalize(data)
+        if not isinstance(data, Mapping) or hasattr(data, "getlist"):
+            raise SchemaFallback()
+        if serializer is None:
+            serializer = self.prototype
+        result = OrderedDict()
+        for name, run_validation, has_validate_method in self.plan:
+            try:
+                value = run_validation(data.get(name, empty))
+            except SkipField:
+                continue
+            except HandledErrors as handled:
+                if serializer is self.prototype:
+                    raise SchemaFallback() from handled
+                value = handled.value
+                handled_errors = serializer.context.get("handled_errors", {})
+                serializer.context["handled_errors"] = handled_errors | {
+                    name: handled.errors
+                }
+            if has_validate_method:
+                value = getattr(serializer, "validate_" + name)(value)
+            result[name] = value
+        return result
+
+    def run_validation(self, data, serializer=None):
+        """Same as Serializer.run_validation, for a value that isn't empty or None"""
+        if serializer is None:
+            serializer = self.prototype
+        result = self.to_internal_value(data, serializer)
+        if self.has_validators:
+            serializer.run_validators(result)
+        if self.has_validate:
+            result = serializer.validate(result)
+        return result
+
+    def validate(self, data, serializer=None):
+        """
+        Validate as serializer.run_validation(data)
+        Raises SchemaFallback when the payload needs full DRF validation
+        """
+        if data is empty or data is None:
+            raise SchemaFallback()
+        try:
+            return self.run_validation(data, serializer)
+        except Exception as err:  # pylint: disable=broad-except
+            # Including errors DRF would raise, it raises them again
+            raise SchemaFallback() from err
+
+    def validate_many(self, data) -> List:
+        """Validate as serializer_class(data=data, many=True) would"""
+        if not isinstance(data, list):
+            raise SchemaFallback()
+        return [self.validate(item) for item in data]
+
+
+_schemas: Dict[type, Schema] = {}
+
+
+def get_schema(serializer_class) -> Schema:
+    """Schema of serializer_class, compiled on first use"""
+    schema = _schemas.get(serializer_class)
+    if schema is None:
+        # Compiling twice in concurrent threads is harmless
+        schema = _schemas[serializer_class] = Schema(serializer_class)
+    return schema
+
+
+class CompiledSchemaMixin:
+    """
+    Validate serializers with their compiled Schema, falling back to DRF
+    Must come before serializers.Serializer in the bases of a serializer
+    """
+
+    use_compiled_schema = True
+
+    def run_validation(self, data=empty):
+        if self.use_compiled_schema:
+            try:
+                return get_schema(type(self)).validate(data, self)
+            except SchemaFallback:
+                pass
+        return super().run_validation(data)
+
+
+def without_compiled_schema(serializer_class):
+    """Subclass of serializer_class validated by DRF only, to compare results"""
+    return type(
+        serializer_class.__name__, (serializer_class,), {"use_compiled_schema": False}
+    )
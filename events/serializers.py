@@ -1,5 +1,5 @@
 import uuid
-from typing import Dict, List, Tuple, Union
+from typing import Dict, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
 from anonymizeip import anonymize_ip
@@ -10,8 +10,15 @@ from rest_framework import serializers
 from rest_framework.exceptions import PermissionDenied
 
 from environments.models import Environment
+from glitchtip import fast_json
 from glitchtip.serializers import FlexibleDateTimeField
-from issues.models import EventType, Issue
+from issues.grouping import (
+    cache_issue_id,
+    forget_issue_id,
+    get_cached_issue_id,
+    get_grouping_hash,
+)
+from issues.models import EventStatus, EventType, Issue
 from issues.serializers import BaseBreadcrumbsSerializer
 from issues.tasks import update_search_index_issue
 from releases.models import Release
@@ -27,7 +34,9 @@ from .fields import (
     GenericField,
     QueryStringField,
 )
+from .ingest_cache import get_environment_id, get_release_id
 from .models import Event, LogLevel
+from .schema import CompiledSchemaMixin, SchemaFallback, get_schema
 
 
 def replace(data: Union[str, dict, list], match: str, repl: str):
@@ -55,6 +64,9 @@ def sanitize_bad_postgres_json(data: Union[str, dict, list]):
     """
     Remove values which are not supported by the postgres JSONB data type
     """
+    # Encoding is much faster than walking the data, and escapes every NUL
+    if b"\\u0000" not in fast_json.dumps(data):
+        return data
     known_bads = ["\u0000"]
     for known_bad in known_bads:
         data = replace(data, known_bad, " ")
@@ -82,11 +94,23 @@ class BreadcrumbsSerializer(BaseBreadcrumbsSerializer):
 
 
 class BaseSerializer(serializers.Serializer):
+    def get_client_ip(self) -> Tuple[Optional[str], bool]:
+        """
+        Get the client IP from the request, or as recorded by the ingest view
+        when the event is stored asynchronously
+        """
+        if "client_ip" in self.context:
+            client_ip = self.context["client_ip"]
+            return client_ip, client_ip is not None
+        return get_client_ip(self.context["request"])
+
     def process_user(self, project, data):
         """Fetch user data from SDK event and request"""
         user = data.get("user", {})
-        if self.context and self.context.get("request"):
-            client_ip, is_routable = get_client_ip(self.context["request"])
+        if self.context and (
+            "client_ip" in self.context or self.context.get("request")
+        ):
+            client_ip, is_routable = self.get_client_ip()
             if user or is_routable:
                 if is_routable:
                     if project.should_scrub_ip_addresses:
@@ -95,7 +119,7 @@ class BaseSerializer(serializers.Serializer):
                 return user
 
 
-class SentrySDKEventSerializer(BaseSerializer):
+class SentrySDKEventSerializer(CompiledSchemaMixin, BaseSerializer):
     """Represents events coming from a OSS sentry SDK client"""
 
     breadcrumbs = serializers.JSONField(required=False)
@@ -111,21 +135,22 @@ class SentrySDKEventSerializer(BaseSerializer):
         required=False, allow_null=True, disallow_regex=r"^[^\n\r\f\/]*$"
     )
     _meta = serializers.JSONField(required=False)
+    fingerprint = serializers.JSONField(required=False)
 
     def get_environment(self, name: str, project):
-        environment, _ = Environment.objects.get_or_create(
-            name=name[: Environment._meta.get_field("name").max_length],
-            organization=project.organization,
+        name = name[: Environment._meta.get_field("name").max_length]
+        return Environment(
+            id=get_environment_id(project.organization_id, project.id, name),
+            name=name,
+            organization_id=project.organization_id,
         )
-        environment.projects.add(project)
-        return environment
 
     def get_release(self, version: str, project):
-        release, _ = Release.objects.get_or_create(
-            version=version, organization=project.organization
+        return Release(
+            id=get_release_id(project.organization_id, project.id, version),
+            version=version,
+            organization_id=project.organization_id,
         )
-        release.projects.add(project)
-        return release
 
 
 class FormattedMessageSerializer(serializers.Serializer):
@@ -198,6 +223,15 @@ class StoreDefaultSerializer(SentrySDKEventSerializer):
             value = {"values": value}
         if value.get("values") == []:
             return None
+        if self.use_compiled_schema:
+            try:
+                return {
+                    "values": get_schema(BreadcrumbsSerializer).validate_many(
+                        value.get("values")
+                    )
+                }
+            except SchemaFallback:
+                pass
         serializer = BreadcrumbsSerializer(data=value.get("values"), many=True)
         if serializer.is_valid():
             return {"values": serializer.validated_data}
@@ -289,7 +323,12 @@ class StoreDefaultSerializer(SentrySDKEventSerializer):
             if frame.get("filename") and self.is_url(frame["filename"]):
                 frame["filename"] = urlparse(frame["filename"]).path
 
-    def create(self, validated_data):
+    def prepare(self, validated_data) -> Tuple[Dict, Dict, Dict]:
+        """
+        Process event data into the values needed to store it, without writing
+        the issue or event. Used directly by batch ingest.
+        Returns issue lookup, issue defaults, and event params without the issue
+        """
         data = validated_data
         project = self.context.get("project")
 
@@ -335,90 +374,110 @@ class StoreDefaultSerializer(SentrySDKEventSerializer):
         contexts = self.annotate_contexts(data)
         data["contexts"] = contexts
 
+        defaults = {
+            "metadata": sanitize_bad_postgres_json(metadata),
+        }
+        if level:
+            defaults["level"] = level
+
+        if environment := data.get("environment"):
+            environment = self.get_environment(data["environment"], project)
+        tags = []
+        if environment:
+            tags.append(("environment", environment.name))
+        if release:
+            tags.append(("release", release.version))
+        tags = self.generate_tags(data, tags)
+        defaults["tags"] = {tag[0]: [tag[1]] for tag in tags}
+
+        defaults["title"] = sanitize_bad_postgres_chars(title)
+        defaults["culprit"] = sanitize_bad_postgres_chars(culprit)
+        defaults["type"] = self.type
+        fingerprint = data.get("fingerprint")
+        issue_lookup = {
+            "project_id": project.id,
+            "grouping_hash": get_grouping_hash(
+                self.type,
+                defaults["title"],
+                defaults["culprit"],
+                fingerprint if isinstance(fingerprint, list) else None,
+            ),
+        }
+
+        json_data = {
+            "breadcrumbs": breadcrumbs,
+            "contexts": contexts,
+            "culprit": culprit,
+            "exception": exception,
+            "logentry": self.get_logentry(data),
+            "metadata": metadata,
+            "message": self.get_message(data),
+            "modules": data.get("modules"),
+            "platform": data.get("platform", "other"),
+            "request": request,
+            "sdk": data.get("sdk"),
+            "title": title,
+            "type": self.type.label,
+        }
+
+        if environment:
+            json_data["environment"] = environment.name
+        if data.get("logentry"):
+            json_data["logentry"] = data.get("logentry")
+
+        extra = data.get("extra")
+        if extra:
+            json_data["extra"] = extra
+        user = self.process_user(project, data)
+        if user:
+            json_data["user"] = user
+
+        errors = None
+        handled_errors = self.context.get("handled_errors")
+        if handled_errors:
+            errors = []
+            for field_name, field_errors in handled_errors.items():
+                for error in field_errors:
+                    errors.append(
+                        {
+                            "reason": str(error),
+                            "type": error.code,
+                            "name": field_name,
+                            "value": error.value,
+                        }
+                    )
+
+        params = {
+            "event_id": data["event_id"],
+            "tags": {tag[0]: tag[1] for tag in tags},
+            "errors": errors,
+            "timestamp": data.get("timestamp"),
+            "data": sanitize_bad_postgres_json(json_data),
+            "release": release,
+        }
+        if level:
+            params["level"] = level
+        return issue_lookup, defaults, params
+
+    def store(self, validated_data, issue_lookup, defaults, params, issue_id=None):
+        """
+        Save the event, and its issue unless issue_id is given
+        Returns the event and the issue, None when issue_id is given
+        """
+        project = self.context.get("project")
+        issue = None
         with transaction.atomic():
             if not project.first_event:
-                project.first_event = data.get("timestamp")
+                project.first_event = validated_data.get("timestamp")
                 project.save(update_fields=["first_event"])
-            defaults = {
-                "metadata": sanitize_bad_postgres_json(metadata),
-            }
-            if level:
-                defaults["level"] = level
-
-            if environment := data.get("environment"):
-                environment = self.get_environment(data["environment"], project)
-            tags = []
-            if environment:
-                tags.append(("environment", environment.name))
-            if release:
-                tags.append(("release", release.version))
-            tags = self.generate_tags(data, tags)
-            defaults["tags"] = {tag[0]: [tag[1]] for tag in tags}
-
-            issue, _ = Issue.objects.get_or_create(
-                title=sanitize_bad_postgres_chars(title),
-                culprit=sanitize_bad_postgres_chars(culprit),
-                project_id=project.id,
-                type=self.type,
-                defaults=defaults,
-            )
 
-            json_data = {
-                "breadcrumbs": breadcrumbs,
-                "contexts": contexts,
-                "culprit": culprit,
-                "exception": exception,
-                "logentry": self.get_logentry(data),
-                "metadata": metadata,
-                "message": self.get_message(data),
-                "modules": data.get("modules"),
-                "platform": data.get("platform", "other"),
-                "request": request,
-                "sdk": data.get("sdk"),
-                "title": title,
-                "type": self.type.label,
-            }
-
-            if environment:
-                json_data["environment"] = environment.name
-            if data.get("logentry"):
-                json_data["logentry"] = data.get("logentry")
-
-            extra = data.get("extra")
-            if extra:
-                json_data["extra"] = extra
-            user = self.process_user(project, data)
-            if user:
-                json_data["user"] = user
-
-            errors = None
-            handled_errors = self.context.get("handled_errors")
-            if handled_errors:
-                errors = []
-                for field_name, field_errors in handled_errors.items():
-                    for error in field_errors:
-                        errors.append(
-                            {
-                                "reason": str(error),
-                                "type": error.code,
-                                "name": field_name,
-                                "value": error.value,
-                            }
-                        )
-
-            params = {
-                "event_id": data["event_id"],
-                "issue": issue,
-                "tags": {tag[0]: tag[1] for tag in tags},
-                "errors": errors,
-                "timestamp": data.get("timestamp"),
-                "data": sanitize_bad_postgres_json(json_data),
-                "release": release,
-            }
-            if level:
-                params["level"] = level
+            if issue_id is None:
+                issue, _ = Issue.objects.get_or_create(
+                    **issue_lookup, defaults=defaults
+                )
+                issue_id = issue.pk
             try:
-                event = Event.objects.create(**params)
+                event = Event.objects.create(issue_id=issue_id, **params)
             except IntegrityError as err:
                 # This except is more efficient than a query for exists().
                 if err.args and "event_id" in err.args[0]:
@@ -427,10 +486,34 @@ class StoreDefaultSerializer(SentrySDKEventSerializer):
                         % params["event_id"]
                     ) from err
                 raise err
+        return event, issue
 
-        issue.check_for_status_update()
+    def create(self, validated_data):
+        issue_lookup, defaults, params = self.prepare(validated_data)
+        key = (issue_lookup["project_id"], issue_lookup["grouping_hash"])
+        issue_id = get_cached_issue_id(key)
+        try:
+            event, issue = self.store(
+                validated_data, issue_lookup, defaults, params, issue_id
+            )
+        except IntegrityError:
+            if issue_id is None:
+                raise
+            # The cached issue was deleted since
+            forget_issue_id(key)
+            event, issue = self.store(validated_data, issue_lookup, defaults, params)
+
+        if issue is None:
+            # Another process may have resolved the cached issue
+            issue = Issue.objects.filter(
+                pk=event.issue_id, status=EventStatus.RESOLVED
+            ).first()
+        if issue:
+            issue.check_for_status_update()
+            if issue.status == EventStatus.UNRESOLVED:
+                cache_issue_id(key, issue.pk)
         # Expire after 1 hour - in case of major backup
-        update_search_index_issue(args=[issue.pk], countdown=10, expires=3600)
+        update_search_index_issue(args=[event.issue_id], countdown=10, expires=3600)
 
         return event
 
@@ -459,7 +542,11 @@ class StoreCSPReportSerializer(BaseSerializer):
         # This is done to support the hyphen
         self.fields.update({"csp-report": serializers.JSONField()})
 
-    def create(self, validated_data):
+    def prepare(self, validated_data) -> Tuple[Dict, Dict, Dict]:
+        """
+        Process the report into the values needed to store it, as
+        StoreDefaultSerializer.prepare does. Used directly by batch ingest.
+        """
         project = self.context.get("project")
         csp = validated_data["csp-report"]
         title = self.get_title(csp)
@@ -471,13 +558,16 @@ class StoreCSPReportSerializer(BaseSerializer):
             "uri": uri,
             "directive": directive,
         }
-        issue, _ = Issue.objects.get_or_create(
-            title=title,
-            culprit=culprit,
-            project_id=project.id,
-            type=EventType.CSP,
-            defaults={"metadata": metadata},
-        )
+        issue_lookup = {
+            "project_id": project.id,
+            "grouping_hash": get_grouping_hash(EventType.CSP, title, culprit),
+        }
+        defaults = {
+            "title": title,
+            "culprit": culprit,
+            "type": EventType.CSP,
+            "metadata": metadata,
+        }
         # Convert - to _
         normalized_csp = dict((k.replace("-", "_"), v) for k, v in csp.items())
         if "effective_directive" not in normalized_csp:
@@ -496,10 +586,14 @@ class StoreCSPReportSerializer(BaseSerializer):
             json_data["user"] = user
 
         params = {
-            "issue": issue,
             "data": json_data,
         }
-        return Event.objects.create(**params)
+        return issue_lookup, defaults, params
+
+    def create(self, validated_data):
+        issue_lookup, defaults, params = self.prepare(validated_data)
+        issue, _ = Issue.objects.get_or_create(**issue_lookup, defaults=defaults)
+        return Event.objects.create(issue=issue, **params)
 
     def get_effective_directive(self, data):
         """
@@ -526,6 +620,17 @@ class StoreCSPReportSerializer(BaseSerializer):
         return data.get("violated-directive")
 
 
-class EnvelopeHeaderSerializer(serializers.Serializer):
+class EnvelopeHeaderSerializer(CompiledSchemaMixin, serializers.Serializer):
     event_id = serializers.UUIDField(required=False)
     sent_at = FlexibleDateTimeField(required=False)
+
+
+def get_event_serializer_class(data=None):
+    """Determine event type and return serializer"""
+    if data is None:
+        data = []
+    if "exception" in data and data["exception"]:
+        return StoreErrorSerializer
+    if "platform" not in data:
+        return StoreCSPReportSerializer
+    return StoreDefaultSerializer
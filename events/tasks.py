@@ -0,0 +1,96 @@
+import logging
+
+from celery import shared_task
+from django.db.utils import IntegrityError, OperationalError
+from rest_framework import exceptions
+from sentry_sdk import capture_exception, set_level
+
+from difs.tasks import difs_run_resolve_stacktrace
+from organizations_ext.usage import release_usage, usage_period_from_values
+from performance.serializers import TransactionEventSerializer
+from projects.cache import get_project_auth, project_from_auth
+
+from .serializers import get_event_serializer_class
+
+logger = logging.getLogger(__name__)
+
+
+def store_event(data, project, context):
+    """
+    Validate and save an issue event
+    Raises ValidationError when the event is invalid
+    """
+    serializer = get_event_serializer_class(data)(
+        data=data, context={"project": project, **context}
+    )
+    serializer.is_valid(raise_exception=True)
+    event = serializer.save()
+    if event.data.get("exception") is not None and project.has_difs:
+        difs_run_resolve_stacktrace(event.event_id)
+    return event
+
+
+def store_transaction(data, project, context):
+    """
+    Validate and save a transaction event
+    Raises ValidationError when invalid and IntegrityError on duplicate event id
+    """
+    serializer = TransactionEventSerializer(
+        data=data, context={"project": project, **context}
+    )
+    serializer.is_valid(raise_exception=True)
+    return serializer.save()
+
+
+def get_ingest_project(project_id):
+    project_auth = get_project_auth(project_id)
+    if project_auth is None:
+        logger.warning("Project %s no longer exists, dropping event", project_id)
+        return None
+    return project_from_auth(project_auth)
+
+
+def release_ingest_usage(project_id: int, field: str, amount=1):
+    """Uncount items the ingest API accepted and counted, but weren't stored"""
+    project_auth = get_project_auth(project_id)
+    if project_auth is not None and amount:
+        release_usage(usage_period_from_values(project_auth), field, amount)
+
+
+def try_store_event(data, project, context):
+    """Store an event that was already accepted, logging instead of raising errors"""
+    try:
+        return store_event(data, project, context)
+    except exceptions.ValidationError as err:
+        set_level("warning")
+        capture_exception(err)
+        logger.warning("Invalid event %s", err.detail)
+    except exceptions.PermissionDenied:
+        logger.warning("Duplicate event id %s", data.get("event_id"))
+    release_ingest_usage(project.id, "events")
+    return None
+
+
+@shared_task(autoretry_for=(OperationalError,), retry_backoff=True)
+def ingest_event(project_id: int, data: dict, client_ip=None):
+    """Store an event that was accepted and queued by the ingest API"""
+    project = get_ingest_project(project_id)
+    if project is None:
+        return
+    try_store_event(data, project, {"client_ip": client_ip})
+
+
+@shared_task(autoretry_for=(OperationalError,), retry_backoff=True)
+def ingest_transaction(project_id: int, data: dict, client_ip=None):
+    """Store a transaction that was accepted and queued by the ingest API"""
+    project = get_ingest_project(project_id)
+    if project is None:
+        return
+    try:
+        store_transaction(data, project, {"client_ip": client_ip})
+    except exceptions.ValidationError:
+        logger.warning("Invalid envelope payload", exc_info=True)
+        release_ingest_usage(project_id, "transactions")
+    except IntegrityError:
+        logger.warning("Duplicate event id %s", data.get("event_id"))
+        release_ingest_usage(project_id, "transactions")
@@ -0,0 +1,121 @@
+import json
+import uuid
+from unittest.mock import patch
+
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+from kombu import Connection
+from model_bakery import baker
+
+from glitchtip import test_utils  # pylint: disable=unused-import
+from issues.models import EventStatus, EventType, Issue
+
+from ..batch import consume_event_batch, store_event_batch
+from ..models import Event
+from ..test_data.csp import mdn_sample_csp
+
+
+class BatchIngestTestCase(TestCase):
+    def setUp(self):
+        self.project = baker.make("projects.Project")
+        with open("events/test_data/py_hi_event.json") as json_file:
+            self.event = json.load(json_file)
+
+    def get_item(self, **kwargs):
+        data = {**self.event, "event_id": uuid.uuid4().hex, **kwargs}
+        return {"project_id": self.project.id, "data": data, "client_ip": "1.2.3.4"}
+
+    def test_store_event_batch(self):
+        items = [self.get_item() for _ in range(3)]
+        items.append(self.get_item(message="another issue"))
+        items.append(self.get_item(timestamp="not a date", level=["nope"]))
+        store_event_batch(items)
+        self.assertEqual(Event.objects.count(), 4)
+        self.assertEqual(Issue.objects.count(), 2)
+        self.assertEqual(Issue.objects.get(title="hi").event_set.count(), 3)
+        event = Event.objects.get(event_id=items[0]["data"]["event_id"])
+        self.assertEqual(event.data["user"]["ip_address"], "1.2.3.0")
+        self.project.refresh_from_db()
+        self.assertTrue(self.project.first_event)
+
+    def test_store_event_batch_existing_issue(self):
+        store_event_batch([self.get_item()])
+        issue = Issue.objects.get()
+        issue.status = EventStatus.RESOLVED
+        issue.save()
+
+        duplicate = self.get_item()
+        store_event_batch([duplicate, duplicate, self.get_item()])
+        self.assertEqual(Issue.objects.count(), 1)
+        self.assertEqual(Event.objects.count(), 3)
+        issue.refresh_from_db()
+        self.assertEqual(issue.status, EventStatus.UNRESOLVED)
+
+    def test_store_event_batch_cached_issue(self):
+        store_event_batch([self.get_item()])
+        # Resolved by another process, the issue id stays cached here
+        Issue.objects.update(status=EventStatus.RESOLVED)
+        store_event_batch([self.get_item()])
+        self.assertEqual(Issue.objects.get().status, EventStatus.UNRESOLVED)
+
+    def test_store_event_batch_duplicate(self):
+        item = self.get_item()
+        store_event_batch([item])
+        issue = Issue.objects.get()
+        issue.status = EventStatus.RESOLVED
+        issue.save()
+
+        # Resent events are ignored, they don't regress or reindex the issue
+        with patch("events.batch.update_search_index_issue") as mock_update:
+            store_event_batch([item])
+        mock_update.assert_not_called()
+        issue.refresh_from_db()
+        self.assertEqual(issue.status, EventStatus.RESOLVED)
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_store_event_batch_csp(self):
+        csp_item = {"project_id": self.project.id, "data": mdn_sample_csp}
+        # CSP reports are stored in the same bulk queries
+        with patch("events.batch.update_search_index_issue"):
+            with self.assertNumQueries(9):
+                store_event_batch([csp_item, csp_item, self.get_item()])
+        self.assertEqual(Event.objects.count(), 3)
+        self.assertEqual(Issue.objects.count(), 2)
+        self.assertEqual(Issue.objects.filter(type=EventType.CSP).count(), 1)
+
+    def test_consume_event_batch(self):
+        with Connection("memory://") as conn:
+            queue = conn.SimpleQueue("test-ingest")
+            for _ in range(3):
+                queue.put(self.get_item())
+            self.assertEqual(consume_event_batch(queue, 2, timeout=0.1), 2)
+            self.assertEqual(consume_event_batch(queue, 2, timeout=0.1), 1)
+            self.assertEqual(consume_event_batch(queue, 2, timeout=0.1), 0)
+            queue.close()
+        self.assertEqual(Event.objects.count(), 3)
+
+    def test_consume_event_batch_post_process_error(self):
+        with Connection("memory://") as conn:
+            queue = conn.SimpleQueue("test-ingest")
+            queue.put(self.get_item())
+            with patch(
+                "events.batch.update_search_index_issue", side_effect=OSError
+            ), patch("events.batch.try_store_event") as mock_try_store_event:
+                self.assertEqual(consume_event_batch(queue, 2, timeout=0.1), 1)
+            queue.close()
+        # Stored events aren't stored again one at a time
+        mock_try_store_event.assert_not_called()
+        self.assertEqual(Event.objects.count(), 1)
+
+    @override_settings(EVENT_STORE_ASYNC=True, EVENT_INGEST_BATCH_SIZE=100)
+    def test_store_api_queues_event(self):
+        key = self.project.projectkey_set.first()
+        url = (
+            reverse("event_store", args=[self.project.id])
+            + f"?sentry_key={key.public_key}"
+        )
+        with patch("events.views.queue_event") as mock_queue_event:
+            res = self.client.post(url, self.event, content_type="application/json")
+        self.assertEqual(res.status_code, 200)
+        mock_queue_event.assert_called_once()
+        self.assertEqual(mock_queue_event.call_args.args[0], self.project.id)
@@ -1,3 +1,4 @@
+import gzip
 import json
 import uuid
 
@@ -30,7 +31,13 @@ class EnvelopeStoreTestCase(APITestCase):
             if set_release:
                 json_data[0]["trace"]["release"] = set_release
                 json_data[2]["release"] = set_release
-            data = "\n".join([json.dumps(line) for line in json_data])
+            lines = [json.dumps(line) for line in json_data]
+            # Payloads were reformatted, update item lengths to match
+            for i, line in enumerate(json_data[:-1]):
+                if "length" in line:
+                    line["length"] = len(lines[i + 1].encode())
+                    lines[i] = json.dumps(line)
+            data = "\n".join(lines)
         return data
 
     def test_accept(self):
@@ -39,6 +46,15 @@ class EnvelopeStoreTestCase(APITestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(TransactionEvent.objects.exists())
 
+    @override_settings(EVENT_STORE_ASYNC=True)
+    def test_accept_async(self):
+        data = self.get_payload(
+            "events/test_data/transactions/django_simple.json", replace_id=True
+        )
+        res = self.client.generic("POST", self.url, data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(TransactionEvent.objects.get().event_id.hex, res.data["id"])
+
     def test_maintenance_freeze(self):
         data = self.get_payload("events/test_data/transactions/django_simple.json")
         with override_settings(MAINTENANCE_EVENT_FREEZE=True):
@@ -121,3 +137,94 @@ class EnvelopeStoreTestCase(APITestCase):
         self.client.generic("POST", self.url, data)
         res = self.client.generic("POST", self.url, data)
         self.assertEqual(res.status_code, 400)
+
+    def test_multiple_items(self):
+        attachment = b"binary\n\xff\x00 data"
+        event_id = uuid.uuid4().hex
+        transaction = self.get_payload(
+            "events/test_data/transactions/django_simple.json", replace_id=True
+        ).split("\n")
+        data = b"\n".join(
+            [
+                json.dumps({"event_id": event_id}).encode(),
+                json.dumps({"type": "event"}).encode(),
+                json.dumps(
+                    {"event_id": event_id, "platform": "python", "message": "hi"}
+                ).encode(),
+                json.dumps(
+                    {
+                        "type": "attachment",
+                        "length": len(attachment),
+                        "filename": "a.bin",
+                    }
+                ).encode(),
+                attachment,
+                transaction[1].encode(),
+                transaction[2].encode(),
+                json.dumps({"type": "session"}).encode(),
+                json.dumps({"sid": "x"}).encode(),
+            ]
+        )
+        res = self.client.generic(
+            "POST",
+            self.url,
+            data,
+            content_type="application/x-sentry-envelope",
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["id"], event_id)
+        self.assertTrue(Event.objects.filter(pk=event_id).exists())
+        self.assertTrue(TransactionEvent.objects.exists())
+
+    def test_item_length_mismatch(self):
+        data = "\n".join(
+            [
+                json.dumps({}),
+                json.dumps({"type": "event", "length": 100}),
+                json.dumps({"message": "hi"}),
+            ]
+        )
+        res = self.client.generic("POST", self.url, data)
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(Event.objects.exists())
+
+    def test_invalid_item_after_accepted(self):
+        event_id = uuid.uuid4().hex
+        event = [
+            json.dumps({"type": "event"}),
+            json.dumps(
+                {"event_id": event_id, "platform": "python", "message": "hi"}
+            ),
+        ]
+        data = "\n".join(
+            [json.dumps({})]
+            + event
+            + [json.dumps({"type": "transaction"}), json.dumps({"spans": []})]
+            + [json.dumps({"type": "event", "length": 100}), "{}"]
+        )
+        res = self.client.generic("POST", self.url, data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["id"], event_id)
+        self.assertTrue(Event.objects.filter(pk=event_id).exists())
+        self.assertFalse(TransactionEvent.objects.exists())
+
+        data = "\n".join(
+            [json.dumps({}), json.dumps({"type": "transaction"}), "[]"] + event
+        )
+        res = self.client.generic("POST", self.url, data)
+        self.assertEqual(res.status_code, 400)
+
+    def test_session_only(self):
+        data = "\n".join(
+            [json.dumps({}), json.dumps({"type": "session"}), json.dumps({"sid": "x"})]
+        )
+        res = self.client.generic("POST", self.url, data)
+        self.assertEqual(res.status_code, 501)
+
+    def test_gzip(self):
+        data = self.get_payload("events/test_data/transactions/django_simple.json")
+        res = self.client.generic(
+            "POST", self.url, gzip.compress(data.encode()), HTTP_CONTENT_ENCODING="gzip"
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(TransactionEvent.objects.exists())
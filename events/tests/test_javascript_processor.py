@@ -1,8 +1,12 @@
 import shutil
+import uuid
+from unittest.mock import patch
 from django.shortcuts import reverse
 from rest_framework.test import APITestCase
 from model_bakery import baker
+from symbolic import SourceMapView
 from glitchtip import test_utils  # pylint: disable=unused-import
+from ..event_processors.javascript import source_view_cache
 from ..models import Event
 
 
@@ -63,6 +67,7 @@ sample_event = {
 
 class JavaScriptProcessorTestCase(APITestCase):
     def setUp(self):
+        source_view_cache.clear()
         self.project = baker.make("projects.Project")
         self.organization = self.project.organization
         self.release = baker.make("releases.Release", organization=self.organization)
@@ -72,7 +77,7 @@ class JavaScriptProcessorTestCase(APITestCase):
             reverse("event_store", args=[self.project.id]) + "?sentry_key=" + key.hex
         )
 
-    def test_process_sourcemap(self):
+    def create_release_files(self):
         blob_bundle = baker.make("files.FileBlob", blob="uploads/file_blobs/bundle.js")
         blob_bundle_map = baker.make(
             "files.FileBlob", blob="uploads/file_blobs/bundle.js.map"
@@ -96,7 +101,59 @@ class JavaScriptProcessorTestCase(APITestCase):
             "./events/tests/test_data/bundle.js.map",
             "./uploads/file_blobs/bundle.js.map",
         )
+
+    def test_process_sourcemap(self):
+        self.create_release_files()
         data = sample_event | {"release": self.release.version}
 
         res = self.client.post(self.url, data, format="json")
         self.assertTrue(Event.objects.filter(release=self.release).exists())
+
+    def test_sourcemap_parsed_once(self):
+        self.create_release_files()
+        data = sample_event | {"release": self.release.version}
+        with patch(
+            "events.event_processors.javascript.SourceMapView.from_json_bytes",
+            wraps=SourceMapView.from_json_bytes,
+        ) as from_json_bytes:
+            self.client.post(self.url, data, format="json")
+            self.client.post(
+                self.url, data | {"event_id": uuid.uuid4().hex}, format="json"
+            )
+        # Three frames in two events use the same source map
+        self.assertEqual(from_json_bytes.call_count, 1)
+        self.assertEqual(Event.objects.filter(release=self.release).count(), 2)
+
+    def test_same_basename_in_release(self):
+        self.create_release_files()
+        self.release.releasefile_set.filter(file__name="bundle.js").update(
+            name="~/dist/bundle.js", sourcemap="~/dist/bundle.js.map"
+        )
+        self.release.releasefile_set.filter(file__name="bundle.js.map").update(
+            name="~/dist/bundle.js.map"
+        )
+        # Same file name in another directory, its blobs have no file on disk
+        for name in ["~/other/bundle.js", "~/other/bundle.js.map"]:
+            baker.make(
+                "releases.ReleaseFile",
+                release=self.release,
+                name=name,
+                file__name=name.rsplit("/", 1)[-1],
+                file__blob__blob="uploads/file_blobs/missing.js",
+            )
+        data = sample_event | {"release": self.release.version}
+        self.client.post(self.url, data, format="json")
+        event = Event.objects.get(release=self.release)
+        frame = event.data["exception"]["values"][0]["stacktrace"]["frames"][0]
+        self.assertEqual(
+            frame["filename"], "webpack://small-js-error-factory/./src/index.ts"
+        )
+
+    def test_artifact_manifest_cached(self):
+        self.create_release_files()
+        manifest = self.release.get_artifact_manifest()
+        self.assertEqual(len(manifest["artifacts"]), 2)
+        with self.assertNumQueries(0):
+            self.release.get_artifact_manifest()
+        baker.make("releases.ReleaseFile", release=self.release, file__blob__size=1)
+        self.assertEqual(len(self.release.get_artifact_manifest()["artifacts"]), 3)
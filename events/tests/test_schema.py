@@ -0,0 +1,105 @@
+import copy
+import json
+
+from django.test import SimpleTestCase
+
+from performance.serializers import TransactionEventSerializer
+
+from ..management.commands.validation_benchmark import (
+    get_serializer_class,
+    load_payloads,
+)
+from ..schema import SchemaFallback, get_schema, without_compiled_schema
+from ..serializers import StoreDefaultSerializer, StoreErrorSerializer
+
+
+class CompiledSchemaTestCase(SimpleTestCase):
+    def assertSameValidation(self, serializer_class, payload, fast=True):
+        """Assert the compiled schema validates payload exactly as DRF does"""
+        serializer = serializer_class(data=copy.deepcopy(payload), context={})
+        drf_serializer = without_compiled_schema(serializer_class)(
+            data=copy.deepcopy(payload), context={}
+        )
+        is_valid = drf_serializer.is_valid()
+        self.assertEqual(serializer.is_valid(), is_valid)
+        if is_valid:
+            validated_data = serializer.validated_data
+            drf_validated_data = drf_serializer.validated_data
+            # Event ids default to random ones
+            if "event_id" not in payload:
+                validated_data.pop("event_id")
+                drf_validated_data.pop("event_id")
+            self.assertEqual(validated_data, drf_validated_data)
+        else:
+            self.assertEqual(serializer.errors, drf_serializer.errors)
+        self.assertEqual(serializer.context, drf_serializer.context)
+        if fast:
+            get_schema(serializer_class).validate(
+                copy.deepcopy(payload), serializer_class(context={})
+            )
+        else:
+            with self.assertRaises(SchemaFallback):
+                get_schema(serializer_class).validate(
+                    copy.deepcopy(payload), serializer_class(context={})
+                )
+
+    def test_test_data(self):
+        payloads = load_payloads("events/test_data/incoming_events/*.json")
+        payloads += load_payloads("events/test_data/transactions/*.json")
+        for payload in payloads:
+            with self.subTest(payload=payload.get("event_id")):
+                self.assertSameValidation(get_serializer_class(payload), payload)
+
+    def test_fields(self):
+        with open("events/test_data/py_hi_event.json") as json_file:
+            event = json.load(json_file)
+        for change in [
+            {"release": 1.5, "server_name": "  host  ", "platform": 1},
+            {"environment": "production", "transaction": ""},
+            {"level": "log", "breadcrumbs": {"values": [{"category": "a"}]}},
+            {"breadcrumbs": [{"category": "a", "level": "log", "timestamp": 1}]},
+            {"breadcrumbs": {"values": []}},
+            # Invalid breadcrumbs are kept as sent
+            {"breadcrumbs": [{"level": "info"}]},
+            {"message": {"message": "%s %s", "params": ["a", "b"]}},
+            {"message": {"message": "{a}", "params": {"a": 1}}},
+            {"logentry": {"message": "%s", "params": ["a"]}},
+            {"timestamp": 1597940000.5, "event_id": 1},
+            {
+                "request": {
+                    "url": "/",
+                    "env": {"a": None, "b": 1},
+                    "headers": {"a": ["b"]},
+                    "query_string": "a=1&b=2",
+                }
+            },
+            {"request": {"query_string": [["a", "1"], ["b"]]}},
+            {"tags": {"a": 1, "b": None, "c": {"d": 1}, "e": True}},
+        ]:
+            with self.subTest(change=change):
+                self.assertSameValidation(StoreDefaultSerializer, event | change)
+
+    def test_fallback(self):
+        with open("events/test_data/py_error.json") as json_file:
+            event = json.load(json_file)
+        for change in [
+            {"environment": "a/b"},
+            {"environment": ""},
+            {"extra": None},
+            {"release": "a\x00b"},
+            {"request": "/"},
+            {"event_id": "not a uuid"},
+            {"timestamp": "yesterday"},
+        ]:
+            with self.subTest(change=change):
+                self.assertSameValidation(
+                    StoreErrorSerializer, event | change, fast=False
+                )
+
+    def test_spans(self):
+        transaction = load_payloads("events/test_data/transactions/fun.json")[0]
+        transaction["spans"][0]["tags"] = {"a": 1, "b": True}
+        transaction["spans"][1]["description"] = "a" * 3000
+        self.assertSameValidation(TransactionEventSerializer, transaction)
+        del transaction["spans"][0]["op"]
+        self.assertSameValidation(TransactionEventSerializer, transaction, fast=False)
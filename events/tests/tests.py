@@ -10,8 +10,10 @@ from rest_framework.test import APITestCase
 from environments.models import Environment
 from glitchtip import test_utils  # pylint: disable=unused-import
 from issues.models import EventStatus, Issue
+from releases.models import Release
 
 from ..models import Event, LogLevel
+from ..rate_limits import LocalTokenBuckets, RateLimit
 from ..test_data.csp import mdn_sample_csp
 
 
@@ -35,6 +37,34 @@ class EventStoreTestCase(APITestCase):
             res = self.client.post(self.url, data, format="json")
         self.assertEqual(res.status_code, 503)
 
+    @override_settings(EVENT_STORE_ASYNC=True)
+    def test_store_async(self):
+        with open("events/test_data/py_hi_event.json") as json_file:
+            data = json.load(json_file)
+        with patch("events.tasks.ingest_event.delay") as mock_delay:
+            res = self.client.post(self.url, data, format="json")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data["id"], data["event_id"])
+        self.assertFalse(Event.objects.exists())
+        mock_delay.assert_called_once()
+
+        # Eager celery runs the worker inline
+        res = self.client.post(self.url, data, format="json")
+        event = Event.objects.get()
+        self.assertEqual(event.event_id_hex, res.data["id"])
+
+    @override_settings(EVENT_STORE_ASYNC=True)
+    def test_store_async_invalid_event_id(self):
+        with open("events/test_data/py_hi_event.json") as json_file:
+            data = json.load(json_file)
+        data["event_id"] = "nope"
+        res = self.client.post(self.url, data, format="json")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(Event.objects.get().event_id_hex, res.data["id"])
+
+        res = self.client.post(self.url, [data], format="json")
+        self.assertEqual(res.status_code, 400)
+
     def test_store_duplicate(self):
         with open("events/test_data/py_hi_event.json") as json_file:
             data = json.load(json_file)
@@ -96,16 +126,42 @@ class EventStoreTestCase(APITestCase):
         issue.refresh_from_db()
         self.assertEqual(issue.status, EventStatus.UNRESOLVED)
 
+    def test_reopen_cached_issue(self):
+        with open("events/test_data/py_hi_event.json") as json_file:
+            data = json.load(json_file)
+        self.client.post(self.url, data, format="json")
+        # Resolved by another process, the issue id stays cached here
+        Issue.objects.update(status=EventStatus.RESOLVED)
+        data["event_id"] = "6600a066e64b4caf8ed7ec5af64ac4ba"
+        self.client.post(self.url, data, format="json")
+        self.assertEqual(Issue.objects.get().status, EventStatus.UNRESOLVED)
+
+    def test_fingerprint(self):
+        with open("events/test_data/py_hi_event.json") as json_file:
+            data = json.load(json_file)
+        data["fingerprint"] = ["{{ default }}", "checkout"]
+        self.client.post(self.url, data, format="json")
+        data["event_id"] = "6600a066e64b4caf8ed7ec5af64ac4ba"
+        data["message"] = "another message"
+        data["fingerprint"] = ["checkout"]
+        self.client.post(self.url, data, format="json")
+        data["event_id"] = "6600a066e64b4caf8ed7ec5af64ac4bb"
+        data["message"] = "yet another message"
+        self.client.post(self.url, data, format="json")
+        self.assertEqual(Issue.objects.count(), 2)
+        self.assertEqual(Event.objects.count(), 3)
+
     def test_performance(self):
         with open("events/test_data/py_hi_event.json") as json_file:
             data = json.load(json_file)
-        with self.assertNumQueries(15):
+        with self.assertNumQueries(11):
             res = self.client.post(self.url, data, format="json")
         self.assertEqual(res.status_code, 200)
 
-        # Second event should have less queries
+        # Second event should have less queries, its issue is only checked for
+        # a status change
         data["event_id"] = "6600a066e64b4caf8ed7ec5af64ac4bb"
-        with self.assertNumQueries(8):
+        with self.assertNumQueries(6):
             res = self.client.post(self.url, data, format="json")
         self.assertEqual(res.status_code, 200)
 
@@ -118,6 +174,94 @@ class EventStoreTestCase(APITestCase):
         res = self.client.post(self.url, data, format="json")
         self.assertEqual(res.status_code, 429)
 
+    def test_rate_limit_project_key(self):
+        self.projectkey.rate_limit_count = 2
+        self.projectkey.rate_limit_window = 60
+        self.projectkey.save()
+        with open("events/test_data/py_hi_event.json") as json_file:
+            data = json.load(json_file)
+        for event_id in [
+            "6600a066e64b4caf8ed7ec5af64ac4c1",
+            "6600a066e64b4caf8ed7ec5af64ac4c2",
+        ]:
+            data["event_id"] = event_id
+            res = self.client.post(self.url, data, format="json")
+            self.assertEqual(res.status_code, 200)
+
+        data["event_id"] = "6600a066e64b4caf8ed7ec5af64ac4c3"
+        res = self.client.post(self.url, data, format="json")
+        self.assertEqual(res.status_code, 429)
+        # One token refills every 30 seconds
+        self.assertEqual(res.headers["Retry-After"], "30")
+        self.assertEqual(res.headers["X-Sentry-Rate-Limits"], "30::key")
+        self.assertEqual(Event.objects.count(), 2)
+
+        # Other keys of the project have their own limit
+        projectkey = self.project.projectkey_set.create()
+        url = (
+            reverse("event_store", args=[self.project.id])
+            + f"?sentry_key={projectkey.public_key}"
+        )
+        res = self.client.post(url, data, format="json")
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(INGEST_PROJECT_RATE_LIMIT_COUNT=1)
+    def test_rate_limit_project(self):
+        with open("events/test_data/py_hi_event.json") as json_file:
+            data = json.load(json_file)
+        res = self.client.post(self.url, data, format="json")
+        self.assertEqual(res.status_code, 200)
+        data["event_id"] = "6600a066e64b4caf8ed7ec5af64ac4c4"
+        res = self.client.post(self.url, data, format="json")
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res.headers["X-Sentry-Rate-Limits"], "60::project")
+
+    def test_rate_limit_refill(self):
+        buckets = LocalTokenBuckets()
+        limits = [RateLimit("key", "key", 2, 60), RateLimit("project", "project", 10, 1)]
+        with patch("events.rate_limits.time.monotonic", return_value=1000):
+            self.assertEqual(buckets.take(limits), (0, 0))
+            self.assertEqual(buckets.take(limits), (0, 0))
+            self.assertEqual(buckets.take(limits), (1, 30000))
+        with patch("events.rate_limits.time.monotonic", return_value=1015):
+            self.assertEqual(buckets.take(limits), (1, 15000))
+        with patch("events.rate_limits.time.monotonic", return_value=1030):
+            self.assertEqual(buckets.take(limits), (0, 0))
+
+    def test_cached_project_auth(self):
+        with open("events/test_data/py_hi_event.json") as json_file:
+            data = json.load(json_file)
+        self.client.post(self.url, data, format="json")
+
+        # Bad keys are rejected from cache
+        url = (
+            reverse("event_store", args=[self.project.id])
+            + "?sentry_key=238df2aac6331578a16c14bcb3db5259"
+        )
+        self.client.post(url, data, format="json")
+        with self.assertNumQueries(0):
+            res = self.client.post(url, data, format="json")
+        self.assertEqual(res.status_code, 401)
+
+        # Changes to organization must invalidate the cache
+        organization = self.project.organization
+        organization.is_accepting_events = False
+        organization.save()
+        res = self.client.post(self.url, data, format="json")
+        self.assertEqual(res.status_code, 429)
+
+        # New keys are accepted immediately
+        projectkey = self.project.projectkey_set.create()
+        url = (
+            reverse("event_store", args=[self.project.id])
+            + f"?sentry_key={projectkey.public_key}"
+        )
+        organization.is_accepting_events = True
+        organization.save()
+        data["event_id"] = "6600a066e64b4caf8ed7ec5af64ac4bc"
+        res = self.client.post(url, data, format="json")
+        self.assertEqual(res.status_code, 200)
+
     def test_project_first_event(self):
         with open("events/test_data/py_error.json") as json_file:
             data = json.load(json_file)
@@ -137,7 +281,7 @@ class EventStoreTestCase(APITestCase):
         data["exception"]["values"][0]["stacktrace"]["frames"][0][
             "function"
         ] = "a\u0000a"
-        data["exception"]["values"][0]["value"] = "\x00\u0000"
+        data["message"] = "\x00\u0000"
         res = self.client.post(self.url, data, format="json")
         self.assertEqual(res.status_code, 200)
 
@@ -177,7 +321,8 @@ class EventStoreTestCase(APITestCase):
 
     def test_store_very_large_data(self):
         """
-        This test is expected to exceed the 1mb limit of a postgres tsvector
+        This event would exceed the 1mb limit of a postgres tsvector, if all of
+        its data was indexed
         """
         with open("events/test_data/py_hi_event.json") as json_file:
             data = json.load(json_file)
@@ -185,11 +330,9 @@ class EventStoreTestCase(APITestCase):
         data["platform"] = " ".join([str(random.random()) for _ in range(50000)])
         res = self.client.post(self.url, data, format="json")
         self.assertEqual(res.status_code, 200)
-        self.assertEqual(
-            Issue.objects.first().search_vector,
-            "",
-            "No tsvector is expected as it would exceed the Postgres limit",
-        )
+        search_vector = Issue.objects.first().search_vector
+        self.assertIn("'hi'", search_vector)
+        self.assertNotIn("0.", search_vector, "Only selected fields are indexed")
         data["event_id"] = "6600a066e64b4caf8ed7ec5af64ac4be"
         res = self.client.post(self.url, data, format="json")
         self.assertEqual(res.status_code, 200)
@@ -236,6 +379,31 @@ class EventStoreTestCase(APITestCase):
             dict(event_json.get("tags")).values(),
         )
 
+    def test_release_environment_projects(self):
+        with open("events/test_data/py_hi_event.json") as json_file:
+            data = json.load(json_file)
+        data["environment"] = "production"
+        self.client.post(self.url, data, format="json")
+        project = baker.make("projects.Project", organization=self.project.organization)
+        url = (
+            reverse("event_store", args=[project.id])
+            + f"?sentry_key={project.projectkey_set.first().public_key}"
+        )
+        self.client.post(url, data, format="json")
+        release = Release.objects.get()
+        self.assertEqual(release.projects.count(), 2)
+        environment = Environment.objects.get()
+        self.assertEqual(environment.name, "production")
+        self.assertEqual(environment.projects.count(), 2)
+
+        # Deleted releases are created again by the next event
+        release.delete()
+        data["event_id"] = "6600a066e64b4caf8ed7ec5af64ac4bb"
+        self.client.post(url, data, format="json")
+        release = Release.objects.get()
+        self.assertEqual(Event.objects.filter(release=release).count(), 1)
+        self.assertEqual(list(release.projects.all()), [project])
+
     def test_client_tags(self):
         with open("events/test_data/py_hi_event.json") as json_file:
             data = json.load(json_file)
@@ -274,7 +442,7 @@ class EventStoreTestCase(APITestCase):
         """Malformed exception values aren't 100% supported, but should stored anyway"""
         with open("events/test_data/py_error.json") as json_file:
             data = json.load(json_file)
-        data["exception"]["values"][0]["value"] = {"why is this": "any object?"}
+        data["message"] = {"why is this": "any object?"}
         res = self.client.post(self.url, data, format="json")
         self.assertEqual(res.status_code, 200)
 
@@ -6,34 +6,42 @@ import uuid
 from urllib.parse import urlparse
 
 from django.conf import settings
-from django.core.exceptions import SuspiciousOperation, ValidationError
-from django.db.models import Exists, OuterRef
+from django.core.exceptions import SuspiciousOperation
 from django.db.utils import IntegrityError
 from django.http import HttpResponse
 from django.test import RequestFactory
 from rest_framework import exceptions, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from ipware import get_client_ip
 from sentry_sdk import capture_exception, set_context, set_level
 
-from difs.models import DebugInformationFile
-from difs.tasks import difs_run_resolve_stacktrace
-from performance.serializers import TransactionEventSerializer
-from projects.models import Project
+from organizations_ext.usage import (
+    record_usage,
+    release_usage,
+    usage_period_from_values,
+)
+from projects.cache import get_project_auth, project_from_auth
 from sentry.utils.auth import parse_auth_header
 
+from .batch import queue_event
 from .negotiation import IgnoreClientContentNegotiation
-from .parsers import EnvelopeParser
-from .serializers import (
-    EnvelopeHeaderSerializer,
-    StoreCSPReportSerializer,
-    StoreDefaultSerializer,
-    StoreErrorSerializer,
-)
+from .parsers import Envelope, EnvelopeParser
+from .rate_limits import check_rate_limits, get_rate_limits
+from .serializers import EnvelopeHeaderSerializer, get_event_serializer_class
+from .tasks import ingest_event, ingest_transaction, store_event, store_transaction
 
 logger = logging.getLogger(__name__)
 
 
+class RateLimitExceeded(exceptions.Throttled):
+    """Throttled with the X-Sentry-Rate-Limits header, which SDKs back off on"""
+
+    def __init__(self, scope: str, wait: int):
+        super().__init__(wait=wait, detail="event rejected due to rate limit")
+        self.sentry_rate_limits = f"{wait}::{scope}"
+
+
 def test_event_view(request):
     """
     This view is used only to test event store performance
@@ -85,12 +93,8 @@ class BaseEventAPIView(APIView):
             result = parse_auth_header(request.META["HTTP_AUTHORIZATION"])
 
         if not result:
-            if (
-                isinstance(request.data, list)
-                and len(request.data)
-                and "dsn" in request.data[0]
-            ):
-                dsn = urlparse(request.data[0]["dsn"])
+            if isinstance(request.data, Envelope) and "dsn" in request.data.headers:
+                dsn = urlparse(request.data.headers["dsn"])
                 if username := dsn.username:
                     return username
             raise exceptions.NotAuthenticated(
@@ -101,50 +105,77 @@ class BaseEventAPIView(APIView):
 
     def get_project(self, request, project_id):
         sentry_key = BaseEventAPIView.auth_from_request(request)
-        difs_subquery = DebugInformationFile.objects.filter(project_id=OuterRef("pk"))
         try:
-            project = (
-                Project.objects.filter(id=project_id, projectkey__public_key=sentry_key)
-                .annotate(has_difs=Exists(difs_subquery))
-                .select_related("organization")
-                .only("id", "first_event", "organization__is_accepting_events")
-                .first()
-            )
-        except ValidationError as err:
+            public_key = uuid.UUID(sentry_key).hex
+        except (AttributeError, TypeError, ValueError) as err:
             raise exceptions.AuthenticationFailed({"error": "Invalid api key"}) from err
-        if not project:
-            if Project.objects.filter(id=project_id).exists():
-                raise exceptions.AuthenticationFailed({"error": "Invalid api key"})
+        project_auth = get_project_auth(project_id)
+        if not project_auth:
             raise exceptions.ValidationError("Invalid project_id: %s" % project_id)
+        if public_key not in project_auth["public_keys"]:
+            raise exceptions.AuthenticationFailed({"error": "Invalid api key"})
+        project = project_from_auth(project_auth)
         if not project.organization.is_accepting_events:
             raise exceptions.Throttled(detail="event rejected due to rate limit")
+        if limited := check_rate_limits(get_rate_limits(project_auth, public_key)):
+            raise RateLimitExceeded(limited.scope, limited.retry_after)
+        self.usage_period = usage_period_from_values(project_auth)
         return project
 
+    def check_quota(self, field: str):
+        """
+        Count an accepted item in the organization's usage, unless over quota
+        Items that turn out invalid or duplicate are uncounted once known
+        """
+        if not record_usage(self.usage_period, field, enforce_quota=True):
+            raise exceptions.Throttled(detail="event rejected due to quota")
+
+    def handle_exception(self, exc):
+        response = super().handle_exception(exc)
+        if isinstance(exc, RateLimitExceeded):
+            response["X-Sentry-Rate-Limits"] = exc.sentry_rate_limits
+        return response
+
     def get_event_serializer_class(self, data=None):
         """Determine event type and return serializer"""
-        if data is None:
-            data = []
-        if "exception" in data and data["exception"]:
-            return StoreErrorSerializer
-        if "platform" not in data:
-            return StoreCSPReportSerializer
-        return StoreDefaultSerializer
+        return get_event_serializer_class(data)
+
+    def enqueue(self, queue, data, project, field: str):
+        """
+        Accept an event to be stored later by a celery worker
+        Only cheap checks are done here, the worker runs full validation
+        """
+        if not isinstance(data, dict):
+            raise exceptions.ValidationError("Invalid event payload")
+        try:
+            event_id = uuid.UUID(str(data.get("event_id"))).hex
+        except ValueError:
+            event_id = uuid.uuid4().hex
+        data["event_id"] = event_id
+        self.check_quota(field)
+        client_ip, is_routable = get_client_ip(self.request)
+        queue(project.id, data, client_ip if is_routable else None)
+        return Response({"id": event_id})
 
     def process_event(self, data, request, project):
         set_context("incoming event", data)
-        serializer = self.get_event_serializer_class(data)(
-            data=data, context={"request": self.request, "project": project}
-        )
+        if settings.EVENT_STORE_ASYNC:
+            if settings.EVENT_INGEST_BATCH_SIZE:
+                return self.enqueue(queue_event, data, project, "events")
+            return self.enqueue(ingest_event.delay, data, project, "events")
+        self.check_quota("events")
         try:
-            serializer.is_valid(raise_exception=True)
+            event = store_event(data, project, {"request": self.request})
+        except exceptions.PermissionDenied:
+            # Duplicate event id
+            release_usage(self.usage_period, "events")
+            raise
         except exceptions.ValidationError as err:
+            release_usage(self.usage_period, "events")
             set_level("warning")
             capture_exception(err)
-            logger.warning("Invalid event %s", serializer.errors)
+            logger.warning("Invalid event %s", err.detail)
             return Response()
-        event = serializer.save()
-        if event.data.get("exception") is not None and project.has_difs:
-            difs_run_resolve_stacktrace(event.event_id)
         return Response({"id": event.event_id_hex})
 
 
@@ -174,9 +205,6 @@ class CSPStoreAPIView(EventStoreAPIView):
 class EnvelopeAPIView(BaseEventAPIView):
     parser_classes = [EnvelopeParser]
 
-    def get_serializer_class(self):
-        return TransactionEventSerializer
-
     def post(self, request, *args, **kwargs):
         if settings.MAINTENANCE_EVENT_FREEZE:
             return Response(
@@ -185,40 +213,77 @@ class EnvelopeAPIView(BaseEventAPIView):
                 },
                 status=status.HTTP_503_SERVICE_UNAVAILABLE,
             )
-        if settings.EVENT_STORE_DEBUG:
-            print(json.dumps(request.data))
+        # Authenticate and rate limit before reading items, only the envelope
+        # headers are parsed when the DSN isn't in the query string or headers
         project = self.get_project(request, kwargs.get("id"))
-
-        data = request.data
-        if len(data) < 2:
-            logger.warning("Envelope has no headers %s", data)
+        envelope = request.data
+        if not isinstance(envelope, Envelope):
             raise exceptions.ValidationError("Envelope has no headers")
-        event_header_serializer = EnvelopeHeaderSerializer(data=data.pop(0))
+        if settings.EVENT_STORE_DEBUG:
+            print(json.dumps(envelope.headers))
+
+        event_header_serializer = EnvelopeHeaderSerializer(data=envelope.headers)
         event_header_serializer.is_valid(raise_exception=True)
-        # Multi part envelopes are not yet supported
-        message_header = data.pop(0)
-        if message_header.get("type") == "transaction":
-            serializer = self.get_serializer_class()(
-                data=data.pop(0), context={"request": self.request, "project": project}
-            )
-            try:
-                serializer.is_valid(raise_exception=True)
-            except exceptions.ValidationError as err:
-                logger.warning("Invalid envelope payload", exc_info=True)
-                raise err
-            try:
-                event = serializer.save()
-            except IntegrityError as err:
-                logger.warning("Duplicate event id", exc_info=True)
-                raise exceptions.ValidationError("Duplicate event id") from err
-            return Response({"id": event.event_id_hex})
-        elif message_header.get("type") == "event":
-            event_data = data.pop(0)
-            return self.process_event(event_data, request, project)
-        elif message_header.get("type") == "session":
+
+        response = None
+        item_types = set()
+        # Items are read from the request as they are processed. Once an item
+        # is accepted, later errors must not fail the request, the client would
+        # send the accepted item again.
+        try:
+            for item_header, payload in envelope:
+                item_type = item_header.get("type")
+                item_types.add(item_type)
+                try:
+                    item_response = self.process_item(
+                        item_type, payload, request, project
+                    )
+                except exceptions.APIException:
+                    if response is None:
+                        raise
+                    logger.warning("Dropped envelope item", exc_info=True)
+                    continue
+                if response is None:
+                    response = item_response
+        except exceptions.ParseError:
+            if response is None:
+                raise
+            logger.warning("Dropped unreadable envelope items", exc_info=True)
+
+        if response is not None:
+            return response
+        if not item_types:
+            logger.warning("Envelope has no items %s", envelope.headers)
+            raise exceptions.ValidationError("Envelope has no items")
+        if "session" in item_types or "sessions" in item_types:
             return Response(
                 {"message": "Session events are not supported at this time."},
                 status=status.HTTP_501_NOT_IMPLEMENTED,
             )
-
         return Response(status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    def process_item(self, item_type, payload, request, project):
+        """Store an event or transaction item, returns None for other types"""
+        if item_type == "transaction":
+            return self.process_transaction(payload, project)
+        if item_type == "event":
+            return self.process_event(payload, request, project)
+        return None
+
+    def process_transaction(self, data, project):
+        if settings.EVENT_STORE_ASYNC:
+            return self.enqueue(
+                ingest_transaction.delay, data, project, "transactions"
+            )
+        self.check_quota("transactions")
+        try:
+            event = store_transaction(data, project, {"request": self.request})
+        except exceptions.ValidationError as err:
+            release_usage(self.usage_period, "transactions")
+            logger.warning("Invalid envelope payload", exc_info=True)
+            raise err
+        except IntegrityError as err:
+            release_usage(self.usage_period, "transactions")
+            logger.warning("Duplicate event id", exc_info=True)
+            raise exceptions.ValidationError("Duplicate event id") from err
+        return Response({"id": event.event_id_hex})
@@ -9,6 +9,8 @@ from django.core.cache import cache
 from django.core.files import File
 from django.db import transaction, IntegrityError
 from organizations_ext.models import Organization
+from organizations_ext.usage import record_organization_usage
+from releases.artifacts import find_sourcemap_url
 from releases.models import Release, ReleaseFile
 from sentry.utils.zip import safe_extract_zip
 from .models import File, FileBlob
@@ -106,6 +108,7 @@ def assemble_artifacts(organization, version, checksum, chunks):
     # Sentry would add dist to release here
 
     artifacts = manifest.get("files", {})
+    file_bytes = 0
     for rel_path, artifact in artifacts.items():
         artifact_url = artifact.get("url", rel_path)
         artifact_basename = artifact_url.rsplit("/", 1)[-1]
@@ -119,6 +122,7 @@ def assemble_artifacts(organization, version, checksum, chunks):
         full_path = path.join(scratchpad, rel_path)
         with open(full_path, "rb") as fp:
             file.putfile(fp)
+            sourcemap = find_sourcemap_url(artifact_url, file.headers, fp)
 
         kwargs = {
             "organization_id": organization.id,
@@ -128,13 +132,18 @@ def assemble_artifacts(organization, version, checksum, chunks):
         }
 
         release_file, created = ReleaseFile.objects.get_or_create(
-            release=release, name=artifact_url, defaults={"file": file}
+            release=release,
+            name=artifact_url,
+            defaults={"file": file, "sourcemap": sourcemap},
         )
         if not created:
             old_file = release_file.file
             release_file.file = file
-            release_file.save(update_fields=["file"])
+            release_file.sourcemap = sourcemap
+            release_file.save(update_fields=["file", "sourcemap"])
             old_file.delete()
+        file_bytes += file.size or 0
+    record_organization_usage("file_bytes", {organization.id: file_bytes})
 
     set_assemble_status(
         AssembleTask.ARTIFACTS, organization.pk, checksum, ChunkFileState.OK
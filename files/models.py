@@ -1,14 +1,38 @@
+import contextlib
+import os
+import shutil
 from hashlib import sha1
 import tempfile
 import mmap
 from concurrent.futures import ThreadPoolExecutor
 
 from django.core.files.base import File as FileObj
-from django.db import models, transaction
+from django.db import IntegrityError, models, transaction
 from glitchtip.base_models import CreatedModel
 from .exceptions import AssembleChecksumMismatch
 
 
+# Blobs from storage without local paths, such as S3, are downloaded here
+BLOB_CACHE_DIR = os.path.join(tempfile.gettempdir(), "glitchtip-blob-cache")
+BLOB_CACHE_MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+
+def _prune_blob_cache():
+    """Remove least recently used cached blobs over BLOB_CACHE_MAX_SIZE"""
+    entries = []
+    for entry in os.scandir(BLOB_CACHE_DIR):
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_atime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= BLOB_CACHE_MAX_SIZE:
+            break
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        total -= size
+
+
 def _get_size_and_checksum(fileobj):
     size = 0
     checksum = sha1()
@@ -44,13 +68,68 @@ class FileBlob(CreatedModel):
             else:
                 files_with_checksums.append((fileobj, None))
 
-        for file_with_checksum in files_with_checksums:
-            blob = cls()
-            blob_file = file_with_checksum[0]
-            blob.size = file_with_checksum[0].size
-            blob.checksum = file_with_checksum[1]
-            blob.blob.save(blob_file.name, blob_file)
-            blob.save()
+        # Skip blobs that already exist or repeat within the request
+        existing = set(
+            cls.objects.filter(
+                checksum__in=[checksum for _, checksum in files_with_checksums]
+            ).values_list("checksum", flat=True)
+        )
+        for blob_file, checksum in files_with_checksums:
+            if checksum in existing:
+                continue
+            existing.add(checksum)
+            blob = cls(size=blob_file.size, checksum=checksum)
+            blob.blob.save(blob_file.name, blob_file, save=False)
+            try:
+                with transaction.atomic():
+                    blob.save()
+            except IntegrityError:
+                # Uploaded concurrently by another request
+                blob.blob.delete(save=False)
+
+    @contextlib.contextmanager
+    def local_path(self):
+        """
+        Path to the blob on local disk, for libraries such as symbolic that
+        open files themselves. Filesystem storage is used directly, without
+        copying. Other storage is downloaded once to a cache keyed by checksum.
+        """
+        try:
+            path = self.blob.path
+        except NotImplementedError:
+            path = None
+        if path is not None:
+            yield path
+            return
+
+        os.makedirs(BLOB_CACHE_DIR, exist_ok=True)
+        cached_path = os.path.join(BLOB_CACHE_DIR, self.checksum)
+        # Other workers may prune the cache at any time. Each use gets a hard
+        # link in a directory of its own, which pruning and failures don't touch.
+        with tempfile.TemporaryDirectory(dir=BLOB_CACHE_DIR) as own_dir:
+            path = os.path.join(own_dir, self.checksum)
+            try:
+                os.link(cached_path, path)
+                os.utime(cached_path)
+            except FileNotFoundError:
+                with open(path, "wb") as output, self.blob.open("rb") as blob_file:
+                    shutil.copyfileobj(blob_file, output)
+                # Atomic, concurrent workers may download the same blob
+                os.link(path, path + ".cache")
+                os.replace(path + ".cache", cached_path)
+                _prune_blob_cache()
+            yield path
+
+    @contextlib.contextmanager
+    def open_mmap(self):
+        """Read only memory map of the blob, pages are loaded as accessed"""
+        with self.local_path() as path, open(path, "rb") as blob_file:
+            if os.fstat(blob_file.fileno()).st_size == 0:
+                # Empty files can't be memory mapped
+                yield b""
+                return
+            with mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
 
     @classmethod
     def from_file(cls, fileobj):
@@ -135,12 +214,16 @@ class File(CreatedModel):
 
             new_checksum = sha1(b"")
             offset = 0
+            indexes = []
             for blob in file_blobs:
-                FileBlobIndex.objects.create(file=self, blob=blob, offset=offset)
-                for chunk in blob.blob.chunks():
-                    new_checksum.update(chunk)
-                    tf.write(chunk)
+                indexes.append(FileBlobIndex(file=self, blob=blob, offset=offset))
+                # Stream each blob in order instead of reading it into memory
+                with blob.blob.open("rb") as blob_file:
+                    for chunk in blob_file.chunks():
+                        new_checksum.update(chunk)
+                        tf.write(chunk)
                 offset += blob.size
+            FileBlobIndex.objects.bulk_create(indexes)
 
             self.size = offset
             self.checksum = new_checksum.hexdigest()
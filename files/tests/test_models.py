@@ -0,0 +1,56 @@
+import os
+from unittest.mock import PropertyMock, patch
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from ..models import BLOB_CACHE_DIR, FileBlob
+
+
+class FileBlobLocalAccessTestCase(TestCase):
+    def setUp(self):
+        self.blob = FileBlob(checksum="0" * 40, size=5)
+        self.blob.blob.save("local-access-test", ContentFile(b"hello"), save=False)
+        self.addCleanup(self.blob.blob.delete, save=False)
+
+    def test_local_path_filesystem(self):
+        with self.blob.local_path() as path:
+            self.assertEqual(path, self.blob.blob.path)
+
+    def test_local_path_remote_storage(self):
+        # As storage without local paths, such as S3, raises
+        with patch(
+            "django.db.models.fields.files.FieldFile.path",
+            new_callable=PropertyMock,
+            side_effect=NotImplementedError,
+        ):
+            cached_path = os.path.join(BLOB_CACHE_DIR, "0" * 40)
+            self.addCleanup(os.remove, cached_path)
+            with self.blob.local_path() as path:
+                with open(path, "rb") as cached:
+                    self.assertEqual(cached.read(), b"hello")
+                # Pruned by another worker while in use
+                os.remove(cached_path)
+                with open(path, "rb") as cached:
+                    self.assertEqual(cached.read(), b"hello")
+            self.assertFalse(os.path.exists(path))
+            with self.blob.local_path() as path:
+                self.assertTrue(os.path.exists(cached_path))
+
+    def test_local_path_download_error(self):
+        os.makedirs(BLOB_CACHE_DIR, exist_ok=True)
+        cache_entries = set(os.listdir(BLOB_CACHE_DIR))
+        with patch(
+            "django.db.models.fields.files.FieldFile.path",
+            new_callable=PropertyMock,
+            side_effect=NotImplementedError,
+        ), patch("django.db.models.fields.files.FieldFile.open", side_effect=OSError):
+            with self.assertRaises(OSError):
+                with self.blob.local_path():
+                    pass
+        # No partial download is left behind
+        self.assertEqual(set(os.listdir(BLOB_CACHE_DIR)), cache_entries)
+
+    def test_open_mmap(self):
+        with self.blob.open_mmap() as mapped:
+            self.assertEqual(mapped[:], b"hello")
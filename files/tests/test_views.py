@@ -1,4 +1,7 @@
+import gzip
+from hashlib import sha1
 from io import BytesIO
+from unittest.mock import patch
 from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile
 from django.shortcuts import reverse
 from model_bakery import baker
@@ -30,6 +33,43 @@ class ChunkUploadAPITestCase(GlitchTipTestCase):
         res = self.client.post(self.url, data)
         self.assertEqual(res.status_code, 200)
 
+    def test_post_many_gzip_chunks(self):
+        contents = [b"first chunk", b"second chunk", b"first chunk"]
+        checksums = [sha1(content).hexdigest() for content in contents]
+        files = [
+            SimpleUploadedFile(checksum, gzip.compress(content))
+            for checksum, content in zip(checksums, contents)
+        ]
+        res = self.client.post(self.url, {"file_gzip": files})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(FileBlob.objects.count(), 2)
+        blob = FileBlob.objects.get(checksum=checksums[1])
+        self.assertEqual(blob.size, len(contents[1]))
+        with blob.blob.open("rb") as blob_file:
+            self.assertEqual(blob_file.read(), contents[1])
+
+    def test_post_skips_existing_chunks(self):
+        content = b"chunk"
+        checksum = sha1(content).hexdigest()
+        baker.make("files.FileBlob", checksum=checksum)
+        with patch("files.views.GzipChunk") as gzip_chunk:
+            res = self.client.post(
+                self.url,
+                {"file_gzip": SimpleUploadedFile(checksum, gzip.compress(content))},
+            )
+        self.assertEqual(res.status_code, 200)
+        gzip_chunk.assert_not_called()
+        self.assertEqual(FileBlob.objects.count(), 1)
+
+    def test_post_gzip_chunk_too_large(self):
+        with patch("files.views.CHUNK_UPLOAD_BLOB_SIZE", 10):
+            res = self.client.post(
+                self.url,
+                {"file_gzip": SimpleUploadedFile("large", gzip.compress(b"x" * 11))},
+            )
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(FileBlob.objects.exists())
+
 
 class ReleaseAssembleAPITests(GlitchTipTestCase):
     def setUp(self):
@@ -61,3 +101,7 @@ class ReleaseAssembleAPITests(GlitchTipTestCase):
         map_file = File.objects.get(name=map_filename)
         self.assertTrue(map_file)
         self.assertTrue(map_file.releasefile_set.filter(release=self.release).exists())
+        self.assertEqual(
+            File.objects.get(name=filename).releasefile_set.get().sourcemap,
+            "~/error-factory/" + map_filename,
+        )
@@ -1,8 +1,10 @@
 """ Port of sentry.api.endpoints.chunk.ChunkUploadEndpoint """
 import logging
-from io import BytesIO
+import tempfile
 from gzip import GzipFile
+from hashlib import sha1
 from django.conf import settings
+from django.core.files.base import File as FileObj
 from django.urls import reverse
 from django.shortcuts import get_object_or_404
 from rest_framework import views, status
@@ -11,12 +13,12 @@ from organizations_ext.models import Organization
 from .models import FileBlob
 from .permissions import ChunkUploadPermission
 
-# Force just one blob
-CHUNK_UPLOAD_BLOB_SIZE = 32 * 1024 * 1024  # 32MB
-MAX_CHUNKS_PER_REQUEST = 1
-MAX_REQUEST_SIZE = CHUNK_UPLOAD_BLOB_SIZE
-MAX_CONCURRENCY = 1
+CHUNK_UPLOAD_BLOB_SIZE = 8 * 1024 * 1024  # 8MB
+MAX_CHUNKS_PER_REQUEST = 64
+MAX_REQUEST_SIZE = 32 * 1024 * 1024  # 32MB
+MAX_CONCURRENCY = 8
 HASH_ALGORITHM = "sha1"
+CHUNK_READ_SIZE = 64 * 1024
 
 CHUNK_UPLOAD_ACCEPT = (
     "debug_files",  # DIF assemble
@@ -26,12 +28,42 @@ CHUNK_UPLOAD_ACCEPT = (
 )
 
 
-class GzipChunk(BytesIO):
+class ChunkTooLarge(IOError):
+    pass
+
+
+class GzipChunk(FileObj):
+    """
+    Gzip compressed chunk, decompressed and hashed piece by piece into a
+    temporary file. Stops early when the chunk is too large.
+    """
+
     def __init__(self, file):
-        data = GzipFile(fileobj=file, mode="rb").read()
-        self.size = len(data)
-        self.name = file.name
-        super().__init__(data)
+        output = tempfile.TemporaryFile()
+        checksum = sha1()
+        size = 0
+        with GzipFile(fileobj=file, mode="rb") as gzip_file:
+            while data := gzip_file.read(CHUNK_READ_SIZE):
+                size += len(data)
+                if size > CHUNK_UPLOAD_BLOB_SIZE:
+                    output.close()
+                    raise ChunkTooLarge("Chunk size too large")
+                checksum.update(data)
+                output.write(data)
+        output.seek(0)
+        super().__init__(output, name=file.name)
+        self.size = size
+        self.checksum = checksum.hexdigest()
+
+
+def get_chunk_checksum(chunk):
+    if isinstance(chunk, GzipChunk):
+        return chunk.checksum
+    checksum = sha1()
+    for data in chunk.chunks(CHUNK_READ_SIZE):
+        checksum.update(data)
+    chunk.seek(0)
+    return checksum.hexdigest()
 
 
 class ChunkUploadAPIView(views.APIView):
@@ -64,15 +96,42 @@ class ChunkUploadAPIView(views.APIView):
         )
         self.check_object_permissions(request, organization)
 
-        files = request.data.getlist("file")
-        files += [GzipChunk(chunk) for chunk in request.data.getlist("file_gzip")]
+        uploads = request.data.getlist("file")
+        gzip_uploads = request.data.getlist("file_gzip")
 
-        if len(files) == 0:
+        if len(uploads) + len(gzip_uploads) == 0:
             # No files uploaded is ok
             logger.info("chunkupload.end", extra={"status": status.HTTP_200_OK})
             return Response(status=status.HTTP_200_OK)
 
-        logger.info("chunkupload.post.files", extra={"len": len(files)})
+        logger.info(
+            "chunkupload.post.files", extra={"len": len(uploads) + len(gzip_uploads)}
+        )
+
+        if len(uploads) + len(gzip_uploads) > MAX_CHUNKS_PER_REQUEST:
+            logger.info(
+                "chunkupload.end", extra={"status": status.HTTP_400_BAD_REQUEST}
+            )
+            return Response(
+                {"error": "Too many chunks"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Chunks are named by their checksum, skip the ones already stored
+        existing = set(
+            FileBlob.objects.filter(
+                checksum__in=[chunk.name for chunk in uploads + gzip_uploads]
+            ).values_list("checksum", flat=True)
+        )
+        uploads = [chunk for chunk in uploads if chunk.name not in existing]
+        gzip_uploads = [chunk for chunk in gzip_uploads if chunk.name not in existing]
+
+        try:
+            files = uploads + [GzipChunk(chunk) for chunk in gzip_uploads]
+        except (OSError, EOFError) as err:
+            logger.info(
+                "chunkupload.end", extra={"status": status.HTTP_400_BAD_REQUEST}
+            )
+            return Response({"error": str(err)}, status=status.HTTP_400_BAD_REQUEST)
 
         # Validate file size
         checksums = []
@@ -87,7 +146,7 @@ class ChunkUploadAPIView(views.APIView):
                     {"error": "Chunk size too large"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            checksums.append(chunk.name)
+            checksums.append(get_chunk_checksum(chunk))
 
         if size > MAX_REQUEST_SIZE:
             logger.info(
@@ -97,14 +156,6 @@ class ChunkUploadAPIView(views.APIView):
                 {"error": "Request too large"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        if len(files) > MAX_CHUNKS_PER_REQUEST:
-            logger.info(
-                "chunkupload.end", extra={"status": status.HTTP_400_BAD_REQUEST}
-            )
-            return Response(
-                {"error": "Too many chunks"}, status=status.HTTP_400_BAD_REQUEST
-            )
-
         try:
             FileBlob.from_files(
                 zip(files, checksums), organization=organization, logger=logger
@@ -0,0 +1,87 @@
+"""
+Fast JSON decoding and encoding for large event payloads
+
+Uses orjson when it is installed and falls back to the standard library json.
+"""
+import json
+import re
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+_default = JSONEncoder().default
+UTF8 = {"utf-8", "utf8"}
+# orjson decodes integers beyond 64 bits as floats, losing precision. Numbers of
+# 19 or more digits, or strings containing them, are decoded by json instead.
+LONG_NUMBER = re.compile(r"\d{19}")
+LONG_NUMBER_BYTES = re.compile(rb"\d{19}")
+if orjson is not None:
+    # Datetimes are formatted by the default function, as JSONEncoder does
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def loads(data):
+    """Decode str or bytes JSON. Raises ValueError on invalid input."""
+    if orjson is not None:
+        long_number = LONG_NUMBER if isinstance(data, str) else LONG_NUMBER_BYTES
+        if not long_number.search(data):
+            return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """
+    Encode obj as compact UTF-8 JSON bytes
+    Supports the same types as Django REST framework's JSONEncoder
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # Such as integers over 64 bits, which orjson doesn't support
+            pass
+    return json.dumps(
+        obj, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser using the fast JSON decoder for UTF-8 request bodies"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or encoding.lower() not in UTF8:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return loads(stream.read())
+        except ValueError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer using the fast JSON encoder, except when indenting"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        # Escape as JSONRenderer does, so output is a strict javascript subset
+        return (
+            dumps(data)
+            .replace(b"\xe2\x80\xa8", b"\\u2028")
+            .replace(b"\xe2\x80\xa9", b"\\u2029")
+        )
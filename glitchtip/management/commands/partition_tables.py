@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from glitchtip.partitioning import (
+    PARTITION_DAYS_AHEAD,
+    PARTITION_MIN_DAYS_AHEAD,
+    PARTITIONED_TABLES,
+    convert_to_partitioned,
+    create_partitions,
+    get_days_ahead,
+    is_partitioned,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming daily partitions for partitioned tables. "
+        "With --convert, partition existing tables by created date. "
+        "With --check, fail when partitions are running out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "tables",
+            nargs="*",
+            help=f"Tables to manage, defaults to all of: {', '.join(PARTITIONED_TABLES)}",
+        )
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Convert regular tables to partitioned tables. Takes a brief exclusive lock.",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help=(
+                "Only check that partitioned tables have at least "
+                f"{PARTITION_MIN_DAYS_AHEAD} days of partitions ahead"
+            ),
+        )
+        parser.add_argument(
+            "--days-ahead",
+            type=int,
+            default=PARTITION_DAYS_AHEAD,
+            help="Number of days of partitions to create in advance",
+        )
+
+    def handle(self, *args, **options):
+        tables = options["tables"] or list(PARTITIONED_TABLES)
+        if unknown := set(tables) - set(PARTITIONED_TABLES):
+            raise CommandError(f"Unsupported tables: {', '.join(sorted(unknown))}")
+        if options["check"]:
+            self.check_days_ahead(tables)
+            return
+        for table in tables:
+            if not is_partitioned(table):
+                if not options["convert"]:
+                    self.stdout.write(f"{table} is not partitioned, skipping")
+                    continue
+                self.stdout.write(f"Converting {table}")
+                convert_to_partitioned(table, options["days_ahead"])
+            created = create_partitions(table, options["days_ahead"])
+            self.stdout.write(self.style.SUCCESS(f"{table}: {created} partitions"))
+
+    def check_days_ahead(self, tables):
+        running_out = []
+        for table in tables:
+            days_ahead = get_days_ahead(table)
+            if days_ahead is None:
+                continue
+            self.stdout.write(f"{table}: {days_ahead} days of partitions ahead")
+            if days_ahead < PARTITION_MIN_DAYS_AHEAD:
+                running_out.append(table)
+        if running_out:
+            raise CommandError(
+                f"Partitions are running out for: {', '.join(running_out)}. "
+                "Is the create_upcoming_partitions task running?"
+            )
@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models.fields.json import KeyTextTransform
+
+from . import fast_json
 
 
 class FromStringIntegerChoices(models.IntegerChoices):
@@ -7,3 +10,20 @@ class FromStringIntegerChoices(models.IntegerChoices):
         for status in cls:
             if status.label == string:
                 return status
+
+
+class FastJSONField(models.JSONField):
+    """JSONField that encodes and decodes with the fast JSON backend"""
+
+    def get_prep_value(self, value):
+        if value is None or self.encoder is not None:
+            return super().get_prep_value(value)
+        return fast_json.dumps(value).decode()
+
+    def from_db_value(self, value, expression, connection):
+        if not isinstance(value, str) or self.decoder is not None:
+            return super().from_db_value(value, expression, connection)
+        # Text extracted with ->> isn't JSON, but keeps this field as output_field
+        if isinstance(expression, KeyTextTransform):
+            return value
+        return fast_json.loads(value)
@@ -0,0 +1,462 @@
+"""
+Native Postgres range partitioning by created date for high volume tables
+
+Partitioning is opt in, see the partition_tables management command. Existing
+tables are converted without copying data: the old table becomes a "legacy"
+partition holding all rows up to the conversion date, and daily partitions are
+created after it. Retention then detaches and drops whole partitions instead of
+deleting rows.
+
+Postgres requires the partition key in every unique constraint, so the primary
+key becomes (pk, created), and foreign keys referencing the table are dropped.
+Event ids are sent by clients, and must stay unique across partitions. For
+those tables, a trigger records each id in a small unpartitioned "_ids" table,
+and rejects ids that it already holds with the same unique violation as the
+primary key. Within a transaction that calls skip_duplicate_ids(), duplicates
+are skipped instead, as ON CONFLICT DO NOTHING would.
+
+The create_upcoming_partitions task keeps a week of partitions ahead of time. A
+default partition catches rows beyond the last daily partition, so inserts don't
+fail when the task stops running, and create_partitions later moves them into
+their daily partition. Postgres can't detach partitions concurrently when there
+is a default partition, so expired partitions are detached with a brief
+exclusive lock. partition_tables --check reports tables running out of
+partitions.
+"""
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Tables that may be partitioned and their primary key column
+PARTITIONED_TABLES = {
+    "events_event": "event_id",
+    "performance_transactionevent": "event_id",
+    "performance_span": "id",
+    "uptime_monitorcheck": "id",
+}
+# Tables with client supplied ids, kept unique by a table of ids
+UNIQUE_ID_TABLES = ["events_event", "performance_transactionevent"]
+PARTITION_KEY = "created"
+PARTITION_DAYS_AHEAD = 7
+# partition_tables --check fails with fewer days of partitions ahead
+PARTITION_MIN_DAYS_AHEAD = 2
+SKIP_DUPLICATE_IDS_SETTING = "glitchtip.skip_duplicate_ids"
+
+UNIQUE_ID_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO {ids} ({pk}, {key}) VALUES (NEW.{pk}, NEW.{key})
+    ON CONFLICT DO NOTHING;
+    IF FOUND THEN
+        RETURN NEW;
+    END IF;
+    IF current_setting('{setting}', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    RAISE unique_violation
+    USING MESSAGE = 'duplicate key value violates unique constraint "{ids}_pkey"',
+    DETAIL = format('Key ({pk})=(%s) already exists.', NEW.{pk});
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+PARTITION_BOUND_RE = re.compile(r"TO \('([^']+)'\)")
+
+
+def qn(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def is_partitioned(table: str) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partitions(table: str) -> List[Tuple[str, Optional[datetime]]]:
+    """Partition names with their upper bound, which is None for the default"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+            """,
+            [table],
+        )
+        partitions = []
+        for name, bound in cursor.fetchall():
+            upper = None
+            if match := PARTITION_BOUND_RE.search(bound):
+                upper = datetime.fromisoformat(match.group(1))
+            partitions.append((name, upper))
+        return partitions
+
+
+def get_detach_pending(table: str) -> List[str]:
+    """Partitions that were interrupted while detaching concurrently"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+            AND pg_inherits.inhdetachpending
+            """,
+            [table],
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def get_partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def get_ids_table(table: str) -> str:
+    return f"{table}_ids"
+
+
+def get_unique_id_trigger(table: str) -> str:
+    return f"{table}_unique_id"[:63]
+
+
+def get_default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def get_days_ahead(table: str) -> Optional[int]:
+    """Whole days after today covered by daily partitions, None if unpartitioned"""
+    if not is_partitioned(table):
+        return None
+    uppers = [upper for _, upper in get_partitions(table) if upper]
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return max((max(uppers) - today).days - 1, 0) if uppers else 0
+
+
+def create_partition(table: str, start: datetime):
+    """
+    Create the daily partition starting at start, moving its rows out of the
+    default partition if any were inserted before it existed
+    """
+    name = get_partition_name(table, start)
+    default = get_default_partition_name(table)
+    end = start + timedelta(days=1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Blocks inserts into the default partition while its rows move
+        cursor.execute(f"LOCK TABLE {qn(default)} IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(
+            f"SELECT 1 FROM {qn(default)} "
+            f"WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s LIMIT 1",
+            [start, end],
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {qn(name)} "
+                f"PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)",
+                [start, end],
+            )
+            return
+        logger.warning("Moving rows of %s out of its default partition", name)
+        # Rows inserted by moving them don't run the triggers of the table
+        cursor.execute(
+            f"CREATE TABLE {qn(name)} (LIKE {qn(table)} "
+            "INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)"
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {qn(default)} "
+            f"WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *) "
+            f"INSERT INTO {qn(name)} SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+
+
+def create_partitions(table: str, days_ahead=PARTITION_DAYS_AHEAD) -> int:
+    """
+    Create the default partition, and missing daily partitions from the last
+    partition up to days_ahead
+    """
+    if not is_partitioned(table):
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {qn(get_default_partition_name(table))} "
+            f"PARTITION OF {qn(table)} DEFAULT"
+        )
+    uppers = [upper for _, upper in get_partitions(table) if upper]
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = max(uppers) if uppers else today
+    end = today + timedelta(days=days_ahead + 1)
+    created = 0
+    while start < end:
+        create_partition(table, start)
+        start += timedelta(days=1)
+        created += 1
+    return created
+
+
+def drop_expired_partitions(table: str, cutoff: datetime) -> int:
+    """
+    Detach and drop partitions where every row is older than cutoff, and forget
+    their ids. O(1) per partition.
+
+    Detaching locks the table briefly, as it has a default partition. Tables
+    without one, partitioned before it existed, are detached concurrently
+    outside of transactions.
+    """
+    if not is_partitioned(table):
+        return 0
+    partitions = get_partitions(table)
+    has_default = any(upper is None for _, upper in partitions)
+    concurrently = (
+        "" if has_default or connection.in_atomic_block else "CONCURRENTLY"
+    )
+    detach_pending = get_detach_pending(table)
+    dropped = 0
+    with connection.cursor() as cursor:
+        for name, upper in partitions:
+            if not upper or upper > cutoff:
+                continue
+            if name in detach_pending:
+                cursor.execute(
+                    f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)} FINALIZE"
+                )
+            else:
+                cursor.execute(
+                    f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)} "
+                    f"{concurrently}"
+                )
+            cursor.execute(f"DROP TABLE {qn(name)}")
+            dropped += 1
+        if table in UNIQUE_ID_TABLES:
+            cursor.execute(
+                f"DELETE FROM {qn(get_ids_table(table))} WHERE {PARTITION_KEY} < %s",
+                [cutoff],
+            )
+    return dropped
+
+
+def skip_duplicate_ids():
+    """
+    Skip inserting rows with duplicate ids into partitioned tables, until the end
+    of the current transaction, instead of raising IntegrityError
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config(%s, 'on', true)", [SKIP_DUPLICATE_IDS_SETTING]
+        )
+
+
+def create_unique_id_trigger(table: str):
+    """Record ids inserted into table in its ids table, rejecting duplicates"""
+    pk = PARTITIONED_TABLES[table]
+    trigger = get_unique_id_trigger(table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UNIQUE_ID_TRIGGER_SQL.format(
+                function=qn(trigger),
+                ids=get_ids_table(table),
+                pk=qn(pk),
+                key=PARTITION_KEY,
+                setting=SKIP_DUPLICATE_IDS_SETTING,
+            )
+        )
+        cursor.execute(f"DROP TRIGGER IF EXISTS {qn(trigger)} ON {qn(table)}")
+        cursor.execute(
+            f"CREATE TRIGGER {qn(trigger)} BEFORE INSERT ON {qn(table)} "
+            f"FOR EACH ROW EXECUTE FUNCTION {qn(trigger)}()"
+        )
+
+
+def create_ids_table(table: str):
+    """
+    Create the ids table and its trigger on the unpartitioned table, then copy
+    existing ids. Creating the trigger waits for running inserts, so that the
+    copy sees every row inserted before the trigger.
+    """
+    pk = PARTITIONED_TABLES[table]
+    ids = get_ids_table(table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {qn(ids)} ("
+            f"{qn(pk)} uuid PRIMARY KEY, {PARTITION_KEY} timestamptz NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {qn(ids + '_' + PARTITION_KEY)} "
+            f"ON {qn(ids)} ({PARTITION_KEY})"
+        )
+    create_unique_id_trigger(table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {qn(ids)} ({qn(pk)}, {PARTITION_KEY}) "
+            f"SELECT {qn(pk)}, {PARTITION_KEY} FROM {qn(table)} ON CONFLICT DO NOTHING"
+        )
+
+
+def convert_to_partitioned(
+    table: str, days_ahead=PARTITION_DAYS_AHEAD, concurrently=True
+):
+    """
+    Convert a regular table into one partitioned by created date
+
+    The existing table is attached as a partition for all rows created before
+    the day after tomorrow. Slow steps, building a unique index, copying ids,
+    and validating the range, happen before taking an exclusive lock.
+    """
+    pk = PARTITIONED_TABLES[table]
+    legacy = f"{table}_legacy"
+    cutoff = timezone.now().replace(
+        hour=0, minute=0, second=0, microsecond=0
+    ) + timedelta(days=2)
+    pk_index = f"{table}_pk_created"[:63]
+    check_name = f"{legacy}_created_range"[:63]
+
+    if table in UNIQUE_ID_TABLES:
+        create_ids_table(table)
+    with connection.cursor() as cursor:
+        # The partitioned primary key must include the partition key
+        cursor.execute(
+            f"CREATE UNIQUE INDEX {'CONCURRENTLY' if concurrently else ''} "
+            f"IF NOT EXISTS {qn(pk_index)} ON {qn(table)} ({qn(pk)}, {PARTITION_KEY})"
+        )
+        # Valid check constraints let the attach skip scanning the table
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} DROP CONSTRAINT IF EXISTS {qn(check_name)}"
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(check_name)} "
+            f"CHECK ({PARTITION_KEY} < %s) NOT VALID",
+            [cutoff],
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} VALIDATE CONSTRAINT {qn(check_name)}"
+        )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+        # Foreign keys can't reference partitioned tables without the partition key
+        cursor.execute(
+            "SELECT conname, conrelid::regclass::text FROM pg_constraint "
+            "WHERE confrelid = %s::regclass",
+            [table],
+        )
+        for constraint, referencing_table in cursor.fetchall():
+            cursor.execute(
+                f"ALTER TABLE {qn(referencing_table)} DROP CONSTRAINT {qn(constraint)}"
+            )
+
+        cursor.execute(
+            "SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid), indisunique "
+            "FROM pg_index WHERE indrelid = %s::regclass AND NOT indisprimary",
+            [table],
+        )
+        indexes = [
+            (name, definition)
+            for name, definition, is_unique in cursor.fetchall()
+            if name != pk_index and not is_unique
+        ]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('c', 'f') AND conname != %s",
+            [table, check_name],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute "
+            "WHERE attrelid = %s::regclass AND attname = %s",
+            [table, pk],
+        )
+        is_identity = bool(cursor.fetchone()[0])
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, pk])
+        sequence = cursor.fetchone()[0]
+
+        cursor.execute(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'p'",
+            [table],
+        )
+        pk_constraint = cursor.fetchone()[0]
+        # Other row triggers, such as the unindexed events trigger of events_event
+        cursor.execute(
+            "SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger "
+            "WHERE tgrelid = %s::regclass AND NOT tgisinternal AND tgname != %s",
+            [table, get_unique_id_trigger(table)],
+        )
+        triggers = cursor.fetchall()
+        for name, _ in triggers:
+            cursor.execute(f"DROP TRIGGER {qn(name)} ON {qn(table)}")
+
+        if table in UNIQUE_ID_TABLES:
+            # Replaced by the trigger of the partitioned table
+            cursor.execute(
+                f"DROP TRIGGER {qn(get_unique_id_trigger(table))} ON {qn(table)}"
+            )
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        # Reuse the (pk, created) index as primary key, so attaching doesn't
+        # build a new one while holding the lock
+        cursor.execute(
+            f"ALTER TABLE {qn(legacy)} DROP CONSTRAINT {qn(pk_constraint)}, "
+            f"ADD CONSTRAINT {qn(legacy + '_pkey')} PRIMARY KEY USING INDEX {qn(pk_index)}"
+        )
+        for name, _ in indexes:
+            cursor.execute(
+                f"ALTER INDEX {qn(name)} RENAME TO {qn((name[:56] + '_legacy'))}"
+            )
+        if is_identity:
+            # Partitions can't have their own identity, keep the sequence going
+            cursor.execute(f"SELECT last_value, is_called FROM {sequence}")
+            last_value, is_called = cursor.fetchone()
+            cursor.execute(f"ALTER TABLE {qn(legacy)} ALTER COLUMN {qn(pk)} DROP IDENTITY")
+            sequence = f"{table}_{pk}_seq"
+            cursor.execute(
+                f"CREATE SEQUENCE {qn(sequence)} START WITH %s",
+                [last_value + 1 if is_called else last_value],
+            )
+
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS "
+            f"INCLUDING STORAGE) PARTITION BY RANGE ({PARTITION_KEY})"
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ADD PRIMARY KEY ({qn(pk)}, {PARTITION_KEY})"
+        )
+        if sequence:
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ALTER COLUMN {qn(pk)} "
+                f"SET DEFAULT nextval('{sequence}')"
+            )
+            cursor.execute(
+                f"ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.{qn(pk)}"
+            )
+        for name, definition in indexes:
+            definition = definition.split(" USING ", 1)[1]
+            cursor.execute(f"CREATE INDEX {qn(name)} ON {qn(table)} USING {definition}")
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}")
+
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} "
+            "FOR VALUES FROM (MINVALUE) TO (%s)",
+            [cutoff],
+        )
+        if table in UNIQUE_ID_TABLES:
+            # Row triggers of the partitioned table apply to every partition
+            create_unique_id_trigger(table)
+        for _, definition in triggers:
+            cursor.execute(definition)
+        create_partitions(table, days_ahead)
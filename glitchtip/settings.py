@@ -101,6 +101,41 @@ MAINTENANCE_EVENT_FREEZE = env.bool("MAINTENANCE_EVENT_FREEZE", False)
 # For development purposes only, prints out inbound event store json
 EVENT_STORE_DEBUG = env.bool("EVENT_STORE_DEBUG", False)
 
+# Queue events for a celery worker to store instead of storing them during the request
+EVENT_STORE_ASYNC = env.bool("EVENT_STORE_ASYNC", False)
+# Optionally route queued events to dedicated workers, see bin/run-celery-ingest.sh
+EVENT_INGEST_QUEUE = env.str("EVENT_INGEST_QUEUE", None)
+# Queue events for the batch ingest worker (manage.py ingest_worker) instead of
+# one celery task per event. Sets the max events stored per batch.
+EVENT_INGEST_BATCH_SIZE = env.int("EVENT_INGEST_BATCH_SIZE", 0)
+
+# Token bucket limit of events per project, in addition to per DSN key limits set
+# on project keys. Allows bursts of COUNT events, refilling over WINDOW seconds.
+INGEST_PROJECT_RATE_LIMIT_COUNT = env.int("INGEST_PROJECT_RATE_LIMIT_COUNT", 0)
+INGEST_PROJECT_RATE_LIMIT_WINDOW = env.int("INGEST_PROJECT_RATE_LIMIT_WINDOW", 60)
+
+# Max concurrent uptime checks per worker process, in total and per target host
+UPTIME_CHECK_CONCURRENCY = env.int("UPTIME_CHECK_CONCURRENCY", 100)
+UPTIME_CHECK_CONCURRENCY_PER_HOST = env.int("UPTIME_CHECK_CONCURRENCY_PER_HOST", 6)
+# Run uptime checks in the long lived uptime worker (manage.py uptime_worker)
+# instead of dispatching celery tasks from beat
+UPTIME_CHECK_WORKER = env.bool("UPTIME_CHECK_WORKER", False)
+# Raw uptime checks are kept this long, older history uses hourly and daily
+# rollups. At least 48 hours, so that daily rollups include the whole day.
+UPTIME_CHECK_RETENTION_HOURS = env.int("UPTIME_CHECK_RETENTION_HOURS", 72)
+if UPTIME_CHECK_RETENTION_HOURS < 48:
+    raise ImproperlyConfigured("UPTIME_CHECK_RETENTION_HOURS must be at least 48")
+
+# Issue full-text search, see issues/search.py. Set to
+# issues.search.SQLiteSearchBackend for an embedded FTS5 index stored in
+# ISSUE_SEARCH_SQLITE_PATH, which must be on storage shared by web and workers.
+ISSUE_SEARCH_BACKEND = env.str(
+    "ISSUE_SEARCH_BACKEND", "issues.search.PostgresSearchBackend"
+)
+ISSUE_SEARCH_SQLITE_PATH = env.str(
+    "ISSUE_SEARCH_SQLITE_PATH", os.path.join(BASE_DIR, "issue_search.sqlite3")
+)
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/dev/howto/static-files/
 STATIC_URL = "/static/"
@@ -398,15 +433,31 @@ CELERY_BEAT_SCHEDULE = {
         "task": "glitchtip.uptime.tasks.cleanup_old_monitor_checks",
         "schedule": crontab(hour=6, minute=20),
     },
+    "uptime-rollup-checks": {
+        "task": "glitchtip.uptime.tasks.rollup_monitor_checks",
+        "schedule": crontab(minute=5),
+    },
     "cleanup-old-files": {
         "task": "files.tasks.cleanup_old_files",
         "schedule": crontab(hour=6, minute=30),
     },
+    "flush-organization-usage": {
+        "task": "organizations_ext.tasks.flush_organization_usage",
+        "schedule": 60,
+    },
+    "create-upcoming-partitions": {
+        "task": "glitchtip.tasks.create_upcoming_partitions",
+        "schedule": crontab(hour=5, minute=50),
+    },
     "uptime-dispatch-checks": {
         "task": "glitchtip.uptime.tasks.dispatch_checks",
         "schedule": timedelta(seconds=30),
     },
 }
+if UPTIME_CHECK_WORKER:
+    del CELERY_BEAT_SCHEDULE["uptime-dispatch-checks"]
+if EVENT_INGEST_QUEUE:
+    CELERY_TASK_ROUTES = {"events.tasks.ingest_*": {"queue": EVENT_INGEST_QUEUE}}
 
 
 if os.environ.get("CACHE_URL"):
@@ -586,7 +637,7 @@ AUTHENTICATION_BACKENDS = (
     "allauth.account.auth_backends.AuthenticationBackend",
 )
 
-DEFAULT_RENDERER_CLASSES = ("rest_framework.renderers.JSONRenderer",)
+DEFAULT_RENDERER_CLASSES = ("glitchtip.fast_json.FastJSONRenderer",)
 if DEBUG:
     DEFAULT_RENDERER_CLASSES = DEFAULT_RENDERER_CLASSES + (
         "rest_framework.renderers.BrowsableAPIRenderer",
@@ -599,6 +650,11 @@ REST_FRAMEWORK = {
     "ORDERING_PARAM": "sort",
     "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
     "DEFAULT_RENDERER_CLASSES": DEFAULT_RENDERER_CLASSES,
+    "DEFAULT_PARSER_CLASSES": (
+        "glitchtip.fast_json.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.SessionAuthentication",
         "glitchtip.authentication.BearerTokenAuthentication",
@@ -689,7 +745,7 @@ if BILLING_ENABLED:
     DJSTRIPE_WEBHOOK_SECRET = env.str("DJSTRIPE_WEBHOOK_SECRET", None)
     CELERY_BEAT_SCHEDULE["set-organization-throttle"] = {
         "task": "organizations_ext.tasks.set_organization_throttle",
-        "schedule": crontab(hour=7, minute=1),
+        "schedule": crontab(minute="*/10"),
     }
     CELERY_BEAT_SCHEDULE["warn-organization-throttle"] = {
         "task": "djstripe_ext.tasks.warn_organization_throttle",
@@ -3,6 +3,7 @@ from django.utils import timezone
 from model_bakery import baker
 
 from glitchtip.test_utils.test_case import GlitchTipTestCase
+from issues.tasks import update_search_index_all_issues
 
 
 class StatsV2APITestCase(GlitchTipTestCase):
@@ -22,3 +23,27 @@ class StatsV2APITestCase(GlitchTipTestCase):
         )
         self.assertEqual(res.status_code, 200)
 
+    def test_get_from_issue_stats(self):
+        baker.make("events.Event", issue__project=self.project, _quantity=2)
+        baker.make("events.Event", issue__project=self.project)
+        other_project = baker.make("projects.Project", organization=self.organization)
+        baker.make("events.Event", issue__project=other_project)
+        update_search_index_all_issues()
+        start = timezone.now() - timezone.timedelta(days=2)
+        end = timezone.now()
+        for interval in ["1h", "1d"]:
+            res = self.client.get(
+                self.url,
+                {
+                    "category": "error",
+                    "start": start,
+                    "end": end,
+                    "field": "sum(quantity)",
+                    "interval": interval,
+                    "project": self.project.pk,
+                },
+            )
+            self.assertEqual(
+                sum(res.data["groups"][0]["series"]["sum(quantity)"]), 3
+            )
+
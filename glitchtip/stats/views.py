@@ -21,6 +21,16 @@ WHERE issue.project_id IN %s
 GROUP BY gs.ts ORDER BY gs.ts;
 """
 
+# Hourly rollups, used for intervals of an hour or more
+ISSUE_STAT_TIME_SERIES_SQL = """
+SELECT gs.ts, COALESCE(SUM(stat.count), 0)
+FROM generate_series(%s, %s, %s::interval) gs (ts)
+LEFT JOIN issues_issuestat stat
+ON stat.date >= gs.ts AND stat.date < gs.ts + %s::interval
+AND stat.project_id IN %s
+GROUP BY gs.ts ORDER BY gs.ts;
+"""
+
 
 class StatsV2View(views.APIView):
     """
@@ -72,9 +82,15 @@ class StatsV2View(views.APIView):
 
         if category == "error":
             with connection.cursor() as cursor:
-                cursor.execute(
-                    EVENT_TIME_SERIES_SQL, [start, end, interval, project_ids],
-                )
+                if interval == "1m":
+                    cursor.execute(
+                        EVENT_TIME_SERIES_SQL, [start, end, interval, project_ids],
+                    )
+                else:
+                    cursor.execute(
+                        ISSUE_STAT_TIME_SERIES_SQL,
+                        [start, end, interval, interval, project_ids],
+                    )
                 series = cursor.fetchall()
         else:
             return Response(status=HTTP_400_BAD_REQUEST)
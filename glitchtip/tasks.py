@@ -0,0 +1,10 @@
+from celery import shared_task
+
+from .partitioning import PARTITIONED_TABLES, create_partitions
+
+
+@shared_task
+def create_upcoming_partitions():
+    """Create daily partitions ahead of time for tables that are partitioned"""
+    for table in PARTITIONED_TABLES:
+        create_partitions(table)
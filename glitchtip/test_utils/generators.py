@@ -1,5 +1,11 @@
 from model_bakery import baker
-from model_bakery.random_gen import gen_datetime, gen_integer, gen_related, gen_slug
+from model_bakery.random_gen import (
+    gen_datetime,
+    gen_integer,
+    gen_json,
+    gen_related,
+    gen_slug,
+)
 
 
 def currency_code():
@@ -12,3 +18,4 @@ baker.generators.add("djstripe.fields.StripeIdField", gen_slug)
 baker.generators.add("djstripe.fields.StripeDateTimeField", gen_datetime)
 baker.generators.add("djstripe.fields.StripeQuantumCurrencyAmountField", gen_integer)
 baker.generators.add("djstripe.fields.StripeForeignKey", gen_related)
+baker.generators.add("glitchtip.model_utils.FastJSONField", gen_json)
@@ -1,5 +1,33 @@
+import json
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
 from django.shortcuts import reverse
 from django.test import TestCase
+from django.utils.timezone import now
+from freezegun import freeze_time
+from model_bakery import baker
+from rest_framework.renderers import JSONRenderer
+
+from events.models import Event
+from glitchtip import test_utils  # pylint: disable=unused-import
+from issues.models import Issue
+from issues.tasks import cleanup_old_events
+
+from . import fast_json
+from .partitioning import (
+    convert_to_partitioned,
+    create_partitions,
+    get_days_ahead,
+    get_partitions,
+    is_partitioned,
+    skip_duplicate_ids,
+)
 
 
 class DocsTestCase(TestCase):
@@ -12,3 +40,99 @@ class DocsTestCase(TestCase):
         url = reverse("schema-redoc") + "?format=openapi"
         res = self.client.get(url)
         self.assertEqual(res.status_code, 200)
+
+
+class PartitioningTestCase(TestCase):
+    def test_partition_tables_command_skips_regular_tables(self):
+        out = StringIO()
+        call_command("partition_tables", "events_event", stdout=out)
+        self.assertIn("not partitioned", out.getvalue())
+        self.assertFalse(is_partitioned("events_event"))
+
+    def test_cleanup_drops_partitions(self):
+        old_event = baker.make("events.Event")
+        with connection.cursor() as cursor:
+            # Run deferred foreign key checks, altering the table requires it
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        convert_to_partitioned("events_event", concurrently=False)
+        self.assertTrue(is_partitioned("events_event"))
+        partitions = [name for name, _ in get_partitions("events_event")]
+        self.assertIn("events_event_legacy", partitions)
+        self.assertIn("events_event_default", partitions)
+
+        with freeze_time(now() + timedelta(days=5)):
+            new_event = baker.make("events.Event")
+            # Ids stay unique across partitions
+            with self.assertRaisesMessage(IntegrityError, "event_id"):
+                with transaction.atomic():
+                    baker.make("events.Event", event_id=old_event.event_id)
+            # Unless skipped, as in batch ingest
+            with transaction.atomic():
+                skip_duplicate_ids()
+                baker.make("events.Event", event_id=old_event.event_id)
+        self.assertEqual(Event.objects.count(), 2)
+        # New partitions keep recording unindexed events
+        Issue.update_index(new_event.issue_id)
+        self.assertEqual(Issue.objects.get(pk=new_event.issue_id).count, 1)
+
+        with freeze_time(
+            now() + timedelta(days=settings.GLITCHTIP_MAX_EVENT_LIFE_DAYS + 3)
+        ):
+            cleanup_old_events()
+        partitions = [name for name, _ in get_partitions("events_event")]
+        self.assertNotIn("events_event_legacy", partitions)
+        self.assertEqual(list(Event.objects.all()), [new_event])
+        self.assertFalse(Event.objects.filter(issue=old_event.issue).exists())
+        # Ids of dropped partitions are forgotten
+        with freeze_time(now() + timedelta(days=5)):
+            baker.make("events.Event", event_id=old_event.event_id)
+
+    def test_default_partition(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        convert_to_partitioned("events_event", days_ahead=2, concurrently=False)
+        self.assertEqual(get_days_ahead("events_event"), 2)
+
+        # Inserts don't fail when upcoming partitions weren't created
+        with freeze_time(now() + timedelta(days=5)):
+            event = baker.make("events.Event")
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM events_event_default")
+                self.assertEqual(cursor.fetchone(), (1,))
+            with self.assertRaisesMessage(CommandError, "events_event"):
+                call_command("partition_tables", "--check", stdout=StringIO())
+
+            create_partitions("events_event")
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM events_event_default")
+                self.assertEqual(cursor.fetchone(), (0,))
+            call_command("partition_tables", "--check", stdout=StringIO())
+        self.assertEqual(list(Event.objects.all()), [event])
+
+
+class FastJSONTestCase(TestCase):
+    def test_dumps_matches_json_renderer(self):
+        data = {
+            "date": now(),
+            "decimal": Decimal("1.5"),
+            "id": uuid.uuid4(),
+            "text": "caf\u00e9",
+            1: None,
+        }
+        self.assertEqual(
+            fast_json.loads(fast_json.dumps(data)),
+            json.loads(JSONRenderer().render(data)),
+        )
+
+    def test_dumps_big_integer(self):
+        self.assertEqual(fast_json.dumps({"big": 2**70}), b'{"big":%d}' % 2**70)
+
+    def test_loads_big_integer(self):
+        for data in [b'{"big": %d}' % 2**70, '{"big": %d}' % -(2**63 + 1)]:
+            with self.subTest(data=data):
+                self.assertEqual(fast_json.loads(data), json.loads(data))
+                self.assertIsInstance(fast_json.loads(data)["big"], int)
+
+    def test_render_escapes_line_separators(self):
+        rendered = fast_json.FastJSONRenderer().render({"text": "a\u2028b"})
+        self.assertEqual(rendered, b'{"text":"a\\u2028b"}')
@@ -42,21 +42,21 @@ class MonitorAdmin(admin.ModelAdmin):
     inlines = [MonitorCheckInlineAdmin]
 
     def get_queryset(self, request):
-        qs = self.model.objects.with_check_annotations()
+        qs = self.model.objects.all()
         ordering = self.get_ordering(request)
         if ordering:
             qs = qs.order_by(*ordering)
         return qs
 
     def is_up(self, obj):
-        return obj.latest_is_up
+        return obj.last_is_up
 
     is_up.boolean = True
 
     def time_since(self, obj):
-        if obj.last_change:
+        if obj.last_change_at:
             now = timezone.now()
-            return now - obj.last_change
+            return now - obj.last_change_at
 
     def heartbeat_endpoint(self, obj):
         if obj.endpoint_id:
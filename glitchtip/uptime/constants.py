@@ -17,3 +17,8 @@ class MonitorCheckReason(models.IntegerChoices):
     BODY = 3, _("Expected response not found")
     SSL = 4, _("SSL error")
     NETWORK = 5, _("Network error")
+
+
+class RollupPeriod(models.TextChoices):
+    HOUR = "hour"
+    DAY = "day"
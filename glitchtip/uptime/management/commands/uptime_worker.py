@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from glitchtip.uptime.tasks import run_due_checks
+from glitchtip.uptime.utils import CheckExecutor
+
+
+class Command(BaseCommand):
+    help = "Run uptime checks in one long lived process with pooled connections. Set UPTIME_CHECK_WORKER to stop beat from dispatching checks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.UPTIME_CHECK_CONCURRENCY,
+            help="Max concurrent checks",
+        )
+        parser.add_argument(
+            "--concurrency-per-host",
+            type=int,
+            default=settings.UPTIME_CHECK_CONCURRENCY_PER_HOST,
+            help="Max concurrent checks of the same host",
+        )
+        parser.add_argument(
+            "--tick",
+            type=float,
+            default=1.0,
+            help="Seconds between looking for due monitors",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Checking monitors with concurrency {options['concurrency']}")
+        with CheckExecutor(
+            options["concurrency"], options["concurrency_per_host"]
+        ) as executor:
+            while True:
+                run_due_checks(executor, options["tick"])
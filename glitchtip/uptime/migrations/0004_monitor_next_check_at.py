@@ -0,0 +1,28 @@
+# Generated by Django 4.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("uptime", "0003_auto_20211127_0159"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="monitor",
+            name="next_check_at",
+            field=models.DateTimeField(
+                db_index=True,
+                default=django.utils.timezone.now,
+                help_text="Time when the next check is dispatched",
+            ),
+        ),
+        # Spread existing monitors across their interval
+        migrations.RunSQL(
+            "UPDATE uptime_monitor SET next_check_at = now() + random() * interval",
+            migrations.RunSQL.noop,
+        ),
+    ]
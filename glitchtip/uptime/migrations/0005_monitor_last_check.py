@@ -0,0 +1,72 @@
+# Generated by Django 4.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("uptime", "0004_monitor_next_check_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="monitor",
+            name="last_check_at",
+            field=models.DateTimeField(
+                blank=True, help_text="Start time of the most recent check", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="monitor",
+            name="last_is_up",
+            field=models.BooleanField(
+                blank=True, help_text="Most recent check is_up result", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="monitor",
+            name="last_change_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Most recent check with a different is_up result than the last",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="monitor",
+            name="avg_response_time",
+            field=models.DurationField(
+                blank=True,
+                help_text="Exponentially weighted moving average of response times",
+                null=True,
+            ),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE uptime_monitor AS monitor
+            SET
+                last_check_at = latest.start_check,
+                last_is_up = latest.is_up,
+                last_change_at = (
+                    SELECT max(start_check) FROM uptime_monitorcheck
+                    WHERE monitor_id = monitor.id AND is_up != latest.is_up
+                ),
+                avg_response_time = (
+                    SELECT avg(response_time) FROM (
+                        SELECT response_time FROM uptime_monitorcheck
+                        WHERE monitor_id = monitor.id
+                        ORDER BY start_check DESC
+                        LIMIT 10
+                    ) AS recent
+                )
+            FROM (
+                SELECT DISTINCT ON (monitor_id) monitor_id, start_check, is_up
+                FROM uptime_monitorcheck
+                ORDER BY monitor_id, start_check DESC
+            ) AS latest
+            WHERE latest.monitor_id = monitor.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
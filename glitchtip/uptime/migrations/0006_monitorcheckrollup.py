@@ -0,0 +1,50 @@
+# Generated by Django 4.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("uptime", "0005_monitor_last_check"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonitorCheckRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")], max_length=4
+                    ),
+                ),
+                ("start", models.DateTimeField(help_text="Start of the hour or day")),
+                ("check_count", models.PositiveIntegerField()),
+                ("up_count", models.PositiveIntegerField()),
+                ("p50_response_time", models.DurationField(blank=True, null=True)),
+                ("p95_response_time", models.DurationField(blank=True, null=True)),
+                (
+                    "monitor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rollups",
+                        to="uptime.monitor",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("monitor", "period", "start")},
+            },
+        ),
+    ]
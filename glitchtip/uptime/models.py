@@ -1,37 +1,75 @@
+import random
 import uuid
 from datetime import timedelta
 
 from django.conf import settings
 from django.core.validators import MaxValueValidator
-from django.db import models
-from django.db.models import OuterRef, Subquery
+from django.db import connection, models
+from django.utils import timezone
 
 from glitchtip.base_models import CreatedModel
 
-from .constants import MonitorCheckReason, MonitorType
+from .constants import MonitorCheckReason, MonitorType, RollupPeriod
+
+
+# Weight of the newest response time in avg_response_time
+RESPONSE_TIME_AVERAGE_WEIGHT = 0.2
+
+# Checks older than a monitor's last check, such as late heartbeats with a start
+# time, may only move last_change_at
+UPDATE_CHECK_STATE_SQL = """
+UPDATE uptime_monitor AS monitor
+SET
+    last_change_at = CASE
+        WHEN result.start_check < monitor.last_check_at THEN
+            CASE
+                WHEN monitor.last_is_up != result.is_up
+                THEN greatest(monitor.last_change_at, result.start_check)
+                ELSE monitor.last_change_at
+            END
+        WHEN monitor.last_is_up != result.is_up THEN monitor.last_check_at
+        ELSE monitor.last_change_at
+    END,
+    last_is_up = CASE
+        WHEN result.start_check < monitor.last_check_at THEN monitor.last_is_up
+        ELSE result.is_up
+    END,
+    last_check_at = greatest(monitor.last_check_at, result.start_check),
+    avg_response_time = coalesce(
+        monitor.avg_response_time * %s + result.response_time * %s,
+        result.response_time,
+        monitor.avg_response_time
+    )
+FROM (VALUES {values}) AS result (monitor_id, is_up, start_check, response_time)
+WHERE monitor.id = result.monitor_id
+"""
+UPDATE_CHECK_STATE_VALUES = "(%s, %s::boolean, %s::timestamptz, %s::interval)"
 
 
 class MonitorManager(models.Manager):
-    def with_check_annotations(self):
+    def update_check_state(self, checks):
         """
-        Adds MonitorCheck annotations:
-        latest_is_up - Most recent check is_up result
-        last_change - Most recent check where is_up state changed
-        Example: Monitor state: { latest_is_up } since { last_change }
+        Update the latest check columns of monitors from new checks, in one
+        statement
         """
-        return self.annotate(
-            latest_is_up=Subquery(
-                MonitorCheck.objects.filter(monitor_id=OuterRef("id"))
-                .order_by("-start_check")
-                .values("is_up")[:1]
-            ),
-            last_change=Subquery(
-                MonitorCheck.objects.filter(monitor_id=OuterRef("id"))
-                .exclude(is_up=OuterRef("latest_is_up"))
-                .order_by("-start_check")
-                .values("start_check")[:1]
-            ),
-        )
+        checks = list(checks)
+        if not checks:
+            return
+        params = [1 - RESPONSE_TIME_AVERAGE_WEIGHT, RESPONSE_TIME_AVERAGE_WEIGHT]
+        for check in checks:
+            params += [
+                check.monitor_id,
+                check.is_up,
+                check.start_check,
+                check.response_time,
+            ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                UPDATE_CHECK_STATE_SQL.format(
+                    values=", ".join([UPDATE_CHECK_STATE_VALUES] * len(checks))
+                ),
+                params,
+            )
 
 
 class Monitor(CreatedModel):
@@ -67,6 +105,27 @@ class Monitor(CreatedModel):
         default=timedelta(minutes=1),
         validators=[MaxValueValidator(timedelta(hours=23, minutes=59, seconds=59))],
     )
+    next_check_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        help_text="Time when the next check is dispatched",
+    )
+    last_check_at = models.DateTimeField(
+        blank=True, null=True, help_text="Start time of the most recent check"
+    )
+    last_is_up = models.BooleanField(
+        blank=True, null=True, help_text="Most recent check is_up result"
+    )
+    last_change_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="Most recent check with a different is_up result than the last",
+    )
+    avg_response_time = models.DurationField(
+        blank=True,
+        null=True,
+        help_text="Exponentially weighted moving average of response times",
+    )
 
     objects = MonitorManager()
 
@@ -76,6 +135,10 @@ class Monitor(CreatedModel):
     def save(self, *args, **kwargs):
         if self.monitor_type == MonitorType.HEARTBEAT and not self.endpoint_id:
             self.endpoint_id = uuid.uuid4()
+        if self._state.adding:
+            # A random offset spreads checks of monitors created together
+            interval = self._meta.get_field("interval").to_python(self.interval)
+            self.next_check_at = timezone.now() + interval * random.random()
         super().save(*args, **kwargs)
         # pylint: disable=import-outside-toplevel
         from glitchtip.uptime.tasks import perform_checks
@@ -110,8 +173,40 @@ class MonitorCheck(CreatedModel):
     def __str__(self):
         return self.up_or_down
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            Monitor.objects.update_check_state([self])
+
     @property
     def up_or_down(self):
         if self.is_up:
             return "Up"
         return "Down"
+
+
+class MonitorCheckRollup(models.Model):
+    """
+    Uptime and response time percentiles of a monitor's checks per hour or day.
+    Raw checks are kept for UPTIME_CHECK_RETENTION_HOURS, rollups for longer.
+    """
+
+    monitor = models.ForeignKey(
+        Monitor, on_delete=models.CASCADE, related_name="rollups"
+    )
+    period = models.CharField(max_length=4, choices=RollupPeriod.choices)
+    start = models.DateTimeField(help_text="Start of the hour or day")
+    check_count = models.PositiveIntegerField()
+    up_count = models.PositiveIntegerField()
+    p50_response_time = models.DurationField(blank=True, null=True)
+    p95_response_time = models.DurationField(blank=True, null=True)
+
+    class Meta:
+        unique_together = (("monitor", "period", "start"),)
+
+    @property
+    def uptime(self):
+        """Percent of checks that were up"""
+        if self.check_count:
+            return 100 * self.up_count / self.check_count
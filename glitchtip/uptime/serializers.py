@@ -4,7 +4,8 @@ from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.fields import ChoiceField
 
-from .models import Monitor, MonitorCheck, MonitorType
+from .constants import RollupPeriod
+from .models import Monitor, MonitorCheck, MonitorCheckRollup, MonitorType
 
 
 class MonitorCheckSerializer(serializers.ModelSerializer):
@@ -17,6 +18,34 @@ class MonitorCheckSerializer(serializers.ModelSerializer):
         fields = ("isUp", "startCheck", "reason", "responseTime")
 
 
+class MonitorCheckRollupSerializer(serializers.ModelSerializer):
+    checkCount = serializers.IntegerField(source="check_count")
+    upCount = serializers.IntegerField(source="up_count")
+    uptime = serializers.FloatField()
+    p50ResponseTime = serializers.DurationField(source="p50_response_time")
+    p95ResponseTime = serializers.DurationField(source="p95_response_time")
+
+    class Meta:
+        model = MonitorCheckRollup
+        fields = (
+            "period",
+            "start",
+            "checkCount",
+            "upCount",
+            "uptime",
+            "p50ResponseTime",
+            "p95ResponseTime",
+        )
+
+
+class MonitorCheckRollupQuerySerializer(serializers.Serializer):
+    period = serializers.ChoiceField(
+        choices=RollupPeriod.choices, default=RollupPeriod.HOUR
+    )
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+
 class HeartBeatCheckSerializer(MonitorCheckSerializer):
     start_check = serializers.DateTimeField(
         default=timezone.now, help_text="Optional, set server check start time."
@@ -28,8 +57,8 @@ class HeartBeatCheckSerializer(MonitorCheckSerializer):
 
 
 class MonitorSerializer(serializers.ModelSerializer):
-    isUp = serializers.SerializerMethodField()
-    lastChange = serializers.SerializerMethodField()
+    isUp = serializers.BooleanField(source="last_is_up", read_only=True)
+    lastChange = serializers.DateTimeField(source="last_change_at", read_only=True)
     monitorType = ChoiceField(choices=MonitorType.choices, source="monitor_type")
     expectedStatus = serializers.IntegerField(source="expected_status")
     heartbeatEndpoint = serializers.SerializerMethodField()
@@ -37,15 +66,6 @@ class MonitorSerializer(serializers.ModelSerializer):
     envName = serializers.SerializerMethodField()
     checks = MonitorCheckSerializer(many=True, read_only=True)
 
-    def get_isUp(self, obj):
-        if hasattr(obj, "latest_is_up"):
-            return obj.latest_is_up
-
-    def get_lastChange(self, obj):
-        if hasattr(obj, "last_change"):
-            if obj.last_change:
-                return obj.last_change.isoformat().replace("+00:00", "Z")
-
     def get_heartbeatEndpoint(self, obj):
         if obj.endpoint_id:
             return settings.GLITCHTIP_URL.geturl() + reverse(
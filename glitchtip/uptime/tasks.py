@@ -1,21 +1,67 @@
-import asyncio
+import logging
+import time
+from collections import defaultdict
 from datetime import timedelta
-from typing import List
+from typing import Dict, List
 
 from celery import shared_task
 from django.conf import settings
-from django.db import transaction
-from django.db.models import DateTimeField, ExpressionWrapper, F, OuterRef, Q, Subquery
+from django.db import connection
+from django.db.models import Max
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
 from alerts.models import AlertRecipient
+from glitchtip.partitioning import drop_expired_partitions
+from organizations_ext.usage import (
+    annotate_usage_period,
+    record_usage,
+    usage_period_from_values,
+)
 
 from .email import MonitorEmail
-from .models import Monitor, MonitorCheck
-from .utils import fetch_all
+from .constants import RollupPeriod
+from .models import Monitor, MonitorCheck, MonitorCheckRollup
+from .utils import DEFAULT_TIMEOUT, CheckExecutor
 from .webhooks import send_uptime_as_webhook
 
+logger = logging.getLogger(__name__)
+
+
+# Claim a batch of due monitors and move each to its next slot. Slots keep the
+# monitor's offset within its interval, so checks stay spread out over time.
+# SKIP LOCKED lets concurrent dispatchers claim different monitors.
+CLAIM_DUE_MONITORS_SQL = """
+UPDATE uptime_monitor AS monitor
+SET next_check_at = monitor.next_check_at
+    + greatest(monitor.interval, interval '1 second')
+    * (
+        floor(
+            extract(epoch FROM %(now)s - monitor.next_check_at)
+            / extract(epoch FROM greatest(monitor.interval, interval '1 second'))
+        ) + 1
+    )
+WHERE monitor.id IN (
+    SELECT due.id
+    FROM uptime_monitor AS due
+    JOIN organizations_ext_organization AS organization
+        ON organization.id = due.organization_id
+    WHERE due.next_check_at <= %(now)s AND organization.is_accepting_events
+    ORDER BY due.next_check_at
+    LIMIT %(batch_size)s
+    FOR UPDATE OF due SKIP LOCKED
+)
+RETURNING monitor.id
+"""
+DISPATCH_BATCH_SIZE = 100
+MAX_PENDING_CHECKS_FACTOR = 10
+
+
+def claim_due_monitors(now, batch_size=DISPATCH_BATCH_SIZE) -> List[int]:
+    with connection.cursor() as cursor:
+        cursor.execute(CLAIM_DUE_MONITORS_SQL, {"now": now, "batch_size": batch_size})
+        return [monitor_id for monitor_id, in cursor.fetchall()]
+
 
 @shared_task
 def dispatch_checks():
@@ -23,75 +69,104 @@ def dispatch_checks():
     dispatch monitor checks tasks in batches, include start time for check
     """
     now = timezone.now()
-    latest_check = Subquery(
-        MonitorCheck.objects.filter(monitor_id=OuterRef("id"))
-        .order_by("-start_check")
-        .values("start_check")[:1]
-    )
-    # Use of atomic solves iterator() with pgbouncer InvalidCursorName issue
-    # https://docs.djangoproject.com/en/3.2/ref/databases/#transaction-pooling-server-side-cursors
-    with transaction.atomic():
-        monitor_ids = (
-            Monitor.objects.filter(organization__is_accepting_events=True)
-            .annotate(
-                last_min_check=ExpressionWrapper(
-                    now - F("interval"), output_field=DateTimeField()
-                ),
-                latest_check=latest_check,
-            )
-            .filter(Q(latest_check__lte=F("last_min_check")) | Q(latest_check=None))
-            .values_list("id", flat=True)
-        )
-        batch_size = 100
-        batch_ids = []
-        for i, monitor_id in enumerate(monitor_ids.iterator(), 1):
-            batch_ids.append(monitor_id)
-            if i % batch_size == 0:
-                perform_checks.apply_async(args=(batch_ids, now), expires=60)
-                batch_ids = []
-        if len(batch_ids) > 0:
-            perform_checks.delay(batch_ids, now)
-
+    while True:
+        batch_ids = claim_due_monitors(now)
+        if batch_ids:
+            perform_checks.apply_async(args=(batch_ids, now), expires=60)
+        if len(batch_ids) < DISPATCH_BATCH_SIZE:
+            break
 
-@shared_task
-def perform_checks(monitor_ids: List[int], now=None):
-    """
-    Performant check monitors and save results
 
-    1. Fetch all monitor data for ids
-    2. Async perform all checks
-    3. Save in bulk results
-    """
-    if now is None:
-        now = timezone.now()
+def get_monitors_to_check(monitor_ids: List[int], now) -> List[Dict]:
     # Convert queryset to raw list[dict] for asyncio operations
+    # Usage periods are fetched along, to count checks without more queries
     monitors = list(
-        Monitor.objects.with_check_annotations().filter(pk__in=monitor_ids).values()
+        annotate_usage_period(
+            Monitor.objects.filter(pk__in=monitor_ids), "organization_id"
+        ).values()
     )
-    results = asyncio.run(fetch_all(monitors))
+    for monitor in monitors:
+        monitor["start_check"] = now
+    return monitors
+
+
+def save_check_results(results: List[Dict]):
+    """Save finished checks in bulk and notify about monitors going up or down"""
     monitor_checks = MonitorCheck.objects.bulk_create(
         [
             MonitorCheck(
                 monitor_id=result["id"],
                 is_up=result["is_up"],
-                start_check=now,
+                start_check=result["start_check"],
                 reason=result.get("reason", None),
                 response_time=result.get("response_time", None),
             )
             for result in results
         ]
     )
+    Monitor.objects.update_check_state(monitor_checks)
+    results_by_organization = defaultdict(list)
+    for result in results:
+        results_by_organization[result["organization_id"]].append(result)
+    for organization_results in results_by_organization.values():
+        record_usage(
+            usage_period_from_values(organization_results[0]),
+            "uptime_checks",
+            len(organization_results),
+        )
     for i, result in enumerate(results):
-        if result["latest_is_up"] is True and result["is_up"] is False:
+        if result["last_is_up"] is True and result["is_up"] is False:
             send_monitor_notification.delay(
-                monitor_checks[i].pk, True, result["last_change"]
+                monitor_checks[i].pk, True, result["last_change_at"]
             )
-        elif result["latest_is_up"] is False and result["is_up"] is True:
+        elif result["last_is_up"] is False and result["is_up"] is True:
             send_monitor_notification.delay(
-                monitor_checks[i].pk, False, result["last_change"]
+                monitor_checks[i].pk, False, result["last_change_at"]
             )
 
 
+@shared_task
+def perform_checks(monitor_ids: List[int], now=None):
+    """
+    Performant check monitors and save results
+
+    1. Fetch all monitor data for ids
+    2. Async perform all checks
+    3. Save results in bulk as checks finish, slow hosts don't hold back others
+    """
+    if now is None:
+        now = timezone.now()
+    monitors = get_monitors_to_check(monitor_ids, now)
+    # Checks time out on their own, but may wait for a slot of their host first.
+    # Don't wait on them for longer than that can take.
+    rounds = -(-len(monitors) // settings.UPTIME_CHECK_CONCURRENCY_PER_HOST)
+    deadline = time.monotonic() + DEFAULT_TIMEOUT * (rounds + 1)
+    with CheckExecutor() as executor:
+        executor.submit(monitors)
+        while executor.pending and (remaining := deadline - time.monotonic()) > 0:
+            save_check_results(executor.get_results(timeout=remaining))
+        if executor.pending:
+            logger.warning("%s uptime checks didn't finish in time", executor.pending)
+
+
+def run_due_checks(executor: CheckExecutor, timeout=1.0):
+    """
+    Claim due monitors for the uptime worker, then save checks as they finish
+    for up to timeout seconds. Stops claiming while too many checks are pending.
+    """
+    now = timezone.now()
+    while executor.pending < executor.concurrency * MAX_PENDING_CHECKS_FACTOR:
+        monitor_ids = claim_due_monitors(now)
+        if monitor_ids:
+            executor.submit(get_monitors_to_check(monitor_ids, now))
+        if len(monitor_ids) < DISPATCH_BATCH_SIZE:
+            break
+    deadline = time.monotonic() + timeout
+    while (remaining := deadline - time.monotonic()) > 0:
+        if results := executor.get_results(timeout=remaining):
+            save_check_results(results)
+
+
 @shared_task
 def send_monitor_notification(monitor_check_id: int, went_down: bool, last_change: str):
     recipients = AlertRecipient.objects.filter(
@@ -110,10 +185,81 @@ def send_monitor_notification(monitor_check_id: int, went_down: bool, last_chang
             )
 
 
+ROLLUP_CHECKS_SQL = """
+INSERT INTO uptime_monitorcheckrollup (
+    monitor_id, period, start, check_count, up_count,
+    p50_response_time, p95_response_time
+)
+SELECT
+    monitor_id,
+    %(period)s,
+    date_trunc(%(period)s, start_check, 'UTC'),
+    count(*),
+    count(*) FILTER (WHERE is_up),
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY response_time),
+    percentile_cont(0.95) WITHIN GROUP (ORDER BY response_time)
+FROM uptime_monitorcheck
+WHERE start_check >= %(start)s AND start_check < %(end)s
+GROUP BY monitor_id, date_trunc(%(period)s, start_check, 'UTC')
+ON CONFLICT (monitor_id, period, start) DO UPDATE SET
+    check_count = EXCLUDED.check_count,
+    up_count = EXCLUDED.up_count,
+    p50_response_time = EXCLUDED.p50_response_time,
+    p95_response_time = EXCLUDED.p95_response_time
+"""
+# Recently finished periods are recomputed, to include late checks
+ROLLUP_LOOKBACK = {
+    RollupPeriod.HOUR: timedelta(hours=3),
+    RollupPeriod.DAY: timedelta(days=2),
+}
+
+
+def truncate_to_period(value, period: RollupPeriod):
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if period == RollupPeriod.DAY:
+        value = value.replace(hour=0)
+    return value
+
+
+@shared_task
+def rollup_monitor_checks():
+    """Compact raw checks of finished hours and days into rollups"""
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        for period, lookback in ROLLUP_LOOKBACK.items():
+            end = truncate_to_period(now, period)
+            cursor.execute(
+                ROLLUP_CHECKS_SQL,
+                {"period": period.value, "start": end - lookback, "end": end},
+            )
+
+
 @shared_task
 def cleanup_old_monitor_checks():
-    """Delete older checks and associated data"""
+    """
+    Delete raw checks older than UPTIME_CHECK_RETENTION_HOURS once rolled up
+    and rollups older than GLITCHTIP_MAX_EVENT_LIFE_DAYS
+    """
+    now = timezone.now()
     days = settings.GLITCHTIP_MAX_EVENT_LIFE_DAYS
-    qs = MonitorCheck.objects.filter(created__lt=timezone.now() - timedelta(days=days))
+    cutoff = now - timedelta(days=days)
+    raw_cutoff = cutoff
+    last_rollup = MonitorCheckRollup.objects.filter(period=RollupPeriod.DAY).aggregate(
+        Max("start")
+    )["start__max"]
+    if last_rollup:
+        # Keep raw checks that aren't in a daily rollup yet
+        raw_cutoff = max(
+            cutoff,
+            min(
+                now - timedelta(hours=settings.UPTIME_CHECK_RETENTION_HOURS),
+                last_rollup + timedelta(days=1),
+            ),
+        )
+    # Partitions are by created, which is never before start_check
+    drop_expired_partitions(MonitorCheck._meta.db_table, raw_cutoff)
+    # Rollups are by start_check, checks saved late are in them too
+    qs = MonitorCheck.objects.filter(start_check__lt=raw_cutoff)
     # pylint: disable=protected-access
     qs._raw_delete(qs.db)  # noqa
+    MonitorCheckRollup.objects.filter(start__lt=cutoff).delete()
@@ -148,6 +148,41 @@ class UptimeAPITestCase(GlitchTipTestCase):
         res = self.client.get(url)
         self.assertContains(res, "2021-09-19T15:39:31Z")
 
+    def test_monitor_rollups_list(self):
+        monitor = baker.make(
+            "uptime.Monitor",
+            organization=self.organization,
+            url="http://example.com",
+            monitor_type="Heartbeat",
+        )
+        baker.make(
+            "uptime.MonitorCheckRollup",
+            monitor=monitor,
+            period="day",
+            start="2021-09-19T00:00:00Z",
+            check_count=4,
+            up_count=3,
+        )
+        baker.make(
+            "uptime.MonitorCheckRollup",
+            monitor=monitor,
+            period="hour",
+            start="2021-09-19T00:00:00Z",
+        )
+        url = reverse(
+            "organization-monitor-rollups-list",
+            kwargs={
+                "organization_slug": self.organization.slug,
+                "monitor_pk": monitor.pk,
+            },
+        )
+        res = self.client.get(url, {"period": "day", "start": "2021-09-01T00:00:00Z"})
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]["uptime"], 75)
+
+        res = self.client.get(url, {"period": "week"})
+        self.assertEqual(res.status_code, 400)
+
     def test_monitor_update(self):
         monitor = baker.make(
             "uptime.Monitor",
@@ -1,4 +1,4 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from unittest import mock
 
 from django.conf import settings
@@ -8,8 +8,13 @@ from model_bakery import baker
 
 from glitchtip.test_utils.test_case import GlitchTipTestCase
 
-from ..models import MonitorCheck
-from ..tasks import cleanup_old_monitor_checks
+from ..constants import MonitorType, RollupPeriod
+from ..models import Monitor, MonitorCheck, MonitorCheckRollup
+from ..tasks import (
+    cleanup_old_monitor_checks,
+    dispatch_checks,
+    rollup_monitor_checks,
+)
 
 
 class TasksTestCase(GlitchTipTestCase):
@@ -24,3 +29,89 @@ class TasksTestCase(GlitchTipTestCase):
         ):
             cleanup_old_monitor_checks()
         self.assertEqual(MonitorCheck.objects.count(), 0)
+
+    @mock.patch("glitchtip.uptime.tasks.perform_checks.apply_async")
+    def test_dispatch_checks_next_check_at(self, perform_checks):
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        with freeze_time(start):
+            monitor = baker.make(
+                Monitor,
+                monitor_type=MonitorType.HEARTBEAT,
+                interval=timedelta(minutes=5),
+            )
+        # Spread within the first interval
+        offset = monitor.next_check_at - start
+        self.assertLess(offset, timedelta(minutes=5))
+
+        with freeze_time(start + timedelta(hours=1)):
+            dispatch_checks()
+            dispatch_checks()
+        perform_checks.assert_called_once()
+        self.assertEqual(perform_checks.call_args.kwargs["args"][0], [monitor.pk])
+        monitor.refresh_from_db()
+        # Missed slots are skipped, the monitor keeps its offset
+        self.assertEqual(monitor.next_check_at, start + timedelta(hours=1) + offset)
+
+    @mock.patch("glitchtip.uptime.tasks.perform_checks.run")
+    def test_monitor_check_state(self, _):
+        monitor = baker.make(Monitor, monitor_type=MonitorType.GET)
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        for minutes, is_up in [(0, True), (1, False), (2, False), (3, True)]:
+            baker.make(
+                MonitorCheck,
+                monitor=monitor,
+                is_up=is_up,
+                start_check=start + timedelta(minutes=minutes),
+                response_time=timedelta(seconds=1),
+            )
+        # Late check, older than the last one
+        baker.make(
+            MonitorCheck,
+            monitor=monitor,
+            is_up=True,
+            start_check=start - timedelta(minutes=1),
+            response_time=None,
+        )
+        monitor.refresh_from_db()
+        self.assertTrue(monitor.last_is_up)
+        self.assertEqual(monitor.last_check_at, start + timedelta(minutes=3))
+        self.assertEqual(monitor.last_change_at, start + timedelta(minutes=2))
+        self.assertEqual(monitor.avg_response_time, timedelta(seconds=1))
+
+    @mock.patch("glitchtip.uptime.tasks.perform_checks.run")
+    def test_rollup_and_cleanup_monitor_checks(self, _):
+        monitor = baker.make(Monitor, monitor_type=MonitorType.GET)
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        for minute in range(4):
+            with freeze_time(start + timedelta(minutes=minute)):
+                baker.make(
+                    MonitorCheck,
+                    monitor=monitor,
+                    is_up=minute != 3,
+                    start_check=now(),
+                    response_time=timedelta(milliseconds=100 * (minute + 1)),
+                )
+
+        with freeze_time(start + timedelta(hours=1, minutes=5)):
+            rollup_monitor_checks()
+        with freeze_time(start + timedelta(days=1, minutes=5)):
+            rollup_monitor_checks()
+        hour = MonitorCheckRollup.objects.get(period=RollupPeriod.HOUR)
+        self.assertEqual(hour.start, start)
+        self.assertEqual(hour.check_count, 4)
+        self.assertEqual(hour.uptime, 75)
+        self.assertEqual(hour.p50_response_time, timedelta(milliseconds=250))
+        day = MonitorCheckRollup.objects.get(period=RollupPeriod.DAY)
+        self.assertEqual(day.start, start)
+        self.assertEqual(day.up_count, 3)
+
+        with freeze_time(start + timedelta(days=2)):
+            cleanup_old_monitor_checks()
+        self.assertEqual(MonitorCheck.objects.count(), 4)
+        # Saved after its day was rolled up, and recomputed in the next rollup
+        with freeze_time(start + timedelta(days=1, hours=1)):
+            baker.make(MonitorCheck, monitor=monitor, start_check=start)
+        with freeze_time(start + timedelta(days=4)):
+            cleanup_old_monitor_checks()
+        self.assertFalse(MonitorCheck.objects.exists())
+        self.assertEqual(MonitorCheckRollup.objects.count(), 2)
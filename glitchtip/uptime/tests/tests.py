@@ -11,10 +11,10 @@ from glitchtip.test_utils.test_case import GlitchTipTestCase
 from organizations_ext.models import OrganizationUserRole
 from users.models import ProjectAlertStatus
 
-from ..constants import MonitorType
+from ..constants import MonitorCheckReason, MonitorType
 from ..models import Monitor, MonitorCheck
-from ..tasks import dispatch_checks
-from ..utils import fetch_all
+from ..tasks import dispatch_checks, run_due_checks
+from ..utils import CheckExecutor
 
 
 class UptimeTestCase(GlitchTipTestCase):
@@ -34,14 +34,76 @@ class UptimeTestCase(GlitchTipTestCase):
         self.assertEqual(mocked.call_count, 3)
 
     @aioresponses()
-    def test_fetch_all(self, mocked):
+    def test_check_executor(self, mocked):
         test_url = "https://example.com"
-        mocked.get(test_url, status=200)
+        # Also checked when created
+        mocked.get(test_url, status=200, repeat=True)
         mon1 = baker.make(Monitor, url=test_url, monitor_type=MonitorType.GET)
-        mocked.get(test_url, status=200)
         monitors = list(Monitor.objects.all().values())
-        results = asyncio.run(fetch_all(monitors))
+        with CheckExecutor() as executor:
+            executor.submit(monitors)
+            results = executor.get_results(timeout=5)
         self.assertEqual(results[0]["id"], mon1.pk)
+        self.assertTrue(results[0]["is_up"])
+        self.assertTrue(results[0]["response_time"])
+
+    def test_check_executor_per_host_limit(self):
+        running = {"example.com": 0, "example.org": 0}
+        max_running = dict(running)
+
+        async def fetch(session, monitor):
+            host = monitor["url"].split("/")[2]
+            running[host] += 1
+            max_running[host] = max(max_running[host], running[host])
+            await asyncio.sleep(0.01)
+            running[host] -= 1
+            monitor["is_up"] = True
+            return monitor
+
+        monitors = [
+            {"id": i, "url": f"https://example.{tld}/{i}"}
+            for i, tld in enumerate(["com", "org"] * 4)
+        ]
+        with mock.patch("glitchtip.uptime.utils.fetch", fetch):
+            with CheckExecutor(concurrency=10, concurrency_per_host=2) as executor:
+                executor.submit(monitors)
+                results = []
+                while executor.pending:
+                    results += executor.get_results(timeout=5)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(max_running, {"example.com": 2, "example.org": 2})
+
+    def test_check_executor_failures(self):
+        async def fetch(session, monitor):
+            await asyncio.sleep(60)
+
+        monitors = [
+            {"id": 1, "url": "http://[invalid"},
+            {"id": 2, "url": "https://example.com"},
+        ]
+        with mock.patch("glitchtip.uptime.utils.fetch", fetch):
+            with CheckExecutor() as executor:
+                executor.submit(monitors)
+                results = executor.get_results(timeout=5)
+                self.assertEqual([result["id"] for result in results], [1])
+            # Unfinished checks are cancelled on close, and still give results
+            results += executor.get_results(timeout=5)
+        self.assertEqual(executor.pending, 0)
+        self.assertEqual(
+            [result["reason"] for result in results], [MonitorCheckReason.UNKNOWN] * 2
+        )
+
+    @aioresponses()
+    def test_run_due_checks(self, mocked):
+        test_url = "https://example.com"
+        mocked.get(test_url, status=200)
+        with mock.patch("glitchtip.uptime.tasks.perform_checks.run"):
+            monitor = baker.make(Monitor, url=test_url, monitor_type=MonitorType.GET)
+        Monitor.objects.update(next_check_at=monitor.created)
+        with CheckExecutor() as executor:
+            run_due_checks(executor, timeout=0.5)
+            self.assertEqual(executor.pending, 0)
+        self.assertTrue(monitor.checks.filter(is_up=True).exists())
 
     @aioresponses()
     def test_monitor_checks_integration(self, mocked):
@@ -57,7 +119,7 @@ class UptimeTestCase(GlitchTipTestCase):
         self.assertEqual(mon.checks.count(), 1)
 
         with freeze_time("2020-01-02"):
-            with self.assertNumQueries(5):
+            with self.assertNumQueries(4):
                 dispatch_checks()
         self.assertEqual(mon.checks.count(), 2)
 
@@ -145,7 +207,7 @@ class UptimeTestCase(GlitchTipTestCase):
             )
 
         mocked.get(test_url, status=500)
-        with self.assertNumQueries(12):
+        with self.assertNumQueries(11):
             with freeze_time("2020-01-02"):
                 dispatch_checks()
             self.assertNotIn(user2.email, mail.outbox[0].to)
@@ -185,7 +247,7 @@ class UptimeTestCase(GlitchTipTestCase):
             )
 
         mocked.get(test_url, status=500)
-        with self.assertNumQueries(12):
+        with self.assertNumQueries(11):
             with freeze_time("2020-01-02"):
                 dispatch_checks()
             self.assertNotIn(user2.email, mail.outbox[0].to)
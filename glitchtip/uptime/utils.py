@@ -1,18 +1,36 @@
 import asyncio
+import logging
+import queue
+import threading
 import time
+from collections import defaultdict
 from datetime import timedelta
 from ssl import SSLError
+from typing import Dict, List
+from urllib.parse import urlsplit
 
 import aiohttp
 from aiohttp.client_exceptions import ClientConnectorError
 from django.conf import settings
+from prometheus_client import Histogram
 
 from .constants import MonitorCheckReason, MonitorType
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_TIMEOUT = 30
 DEFAULT_PING_TIMEOUT = 30
 DEFAULT_AIOHTTP_TIMEOUT = aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT)
 PING_AIOHTTP_TIMEOUT = aiohttp.ClientTimeout(total=DEFAULT_PING_TIMEOUT)
+DNS_CACHE_SECONDS = 300
+KEEPALIVE_SECONDS = 60
+
+UPTIME_CHECK_SECONDS = Histogram(
+    "glitchtip_uptime_check_seconds",
+    "Uptime check response time",
+    ["monitor_type"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
 
 
 async def process_response(monitor, response):
@@ -43,6 +61,7 @@ async def fetch(session, monitor):
             async with session.post(url, timeout=DEFAULT_AIOHTTP_TIMEOUT) as response:
                 await process_response(monitor, response)
         monitor["response_time"] = timedelta(seconds=time.monotonic() - start)
+        UPTIME_CHECK_SECONDS.labels(monitor["monitor_type"]).observe(time.monotonic() - start)
     except SSLError:
         monitor["reason"] = MonitorCheckReason.SSL
     except asyncio.TimeoutError:
@@ -54,11 +73,107 @@ async def fetch(session, monitor):
     return monitor
 
 
-async def fetch_all(monitors):
-    async with aiohttp.ClientSession(
-        headers={"User-Agent": "GlitchTip/" + settings.GLITCHTIP_VERSION}
-    ) as session:
-        results = await asyncio.gather(
-            *[fetch(session, monitor) for monitor in monitors], return_exceptions=True
+def create_session(
+    concurrency=settings.UPTIME_CHECK_CONCURRENCY,
+) -> aiohttp.ClientSession:
+    """Session with pooled keep-alive connections and cached DNS lookups"""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=concurrency,
+            ttl_dns_cache=DNS_CACHE_SECONDS,
+            keepalive_timeout=KEEPALIVE_SECONDS,
+        ),
+        headers={"User-Agent": "GlitchTip/" + settings.GLITCHTIP_VERSION},
+    )
+
+
+class CheckExecutor:
+    """
+    Runs uptime checks on an event loop in a background thread, reusing one
+    session. Concurrency is capped globally and per host, waiting for a slot
+    doesn't count towards the check timeout. Finished checks are available
+    from get_results in the order they complete.
+    """
+
+    def __init__(
+        self,
+        concurrency=settings.UPTIME_CHECK_CONCURRENCY,
+        concurrency_per_host=settings.UPTIME_CHECK_CONCURRENCY_PER_HOST,
+    ):
+        self.concurrency = concurrency
+        self.concurrency_per_host = concurrency_per_host
+        self.pending = 0
+        self._results: "queue.Queue[Dict]" = queue.Queue()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._session = self._run(self._start()).result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def _start(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._host_semaphores = defaultdict(
+            lambda: asyncio.Semaphore(self.concurrency_per_host)
         )
+        return create_session(self.concurrency)
+
+    async def _check(self, monitor):
+        # Every submitted check must produce a result, pending counts them
+        try:
+            host = urlsplit(monitor["url"]).hostname
+            async with self._semaphore, self._host_semaphores[host]:
+                await fetch(self._session, monitor)
+        except asyncio.CancelledError:
+            monitor["is_up"] = False
+            monitor["reason"] = MonitorCheckReason.UNKNOWN
+            raise
+        except Exception:  # pylint: disable=broad-except
+            logger.warning("Uptime check failed", exc_info=True)
+            monitor["is_up"] = False
+            monitor["reason"] = MonitorCheckReason.UNKNOWN
+        finally:
+            self._results.put(monitor)
+
+    def submit(self, monitors: List[Dict]):
+        for monitor in monitors:
+            self.pending += 1
+            self._run(self._check(monitor))
+
+    def get_results(self, max_results=100, timeout=None) -> List[Dict]:
+        """
+        Wait up to timeout for a finished check, then return it along with any
+        others already finished
+        """
+        results = []
+        try:
+            results.append(self._results.get(timeout=timeout))
+            while len(results) < max_results:
+                results.append(self._results.get_nowait())
+        except queue.Empty:
+            pass
+        self.pending -= len(results)
         return results
+
+    async def _stop(self):
+        checks = [
+            task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+        ]
+        for check in checks:
+            check.cancel()
+        await asyncio.gather(*checks, return_exceptions=True)
+        await self._session.close()
+
+    def close(self):
+        """Cancel unfinished checks and stop the event loop"""
+        self._run(self._stop()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -2,13 +2,16 @@ from django.db.models import OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework import exceptions, permissions, viewsets
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import CreateAPIView
 
 from organizations_ext.models import Organization
 
-from .models import Monitor, MonitorCheck
+from .models import Monitor, MonitorCheck, MonitorCheckRollup
 from .serializers import (
     HeartBeatCheckSerializer,
+    MonitorCheckRollupQuerySerializer,
+    MonitorCheckRollupSerializer,
     MonitorCheckSerializer,
     MonitorSerializer,
 )
@@ -21,19 +24,23 @@ class HeartBeatCheckView(CreateAPIView):
 
     def perform_create(self, serializer):
         monitor = get_object_or_404(
-            Monitor.objects.with_check_annotations(),
+            Monitor,
             organization__slug=self.kwargs.get("organization_slug"),
             endpoint_id=self.kwargs.get("endpoint_id"),
         )
         monitor_check = serializer.save(monitor=monitor, is_up=True)
-        if monitor.latest_is_up is False:
+        # The monitor is down if no heartbeat arrives within its interval
+        Monitor.objects.filter(pk=monitor.pk).update(
+            next_check_at=timezone.now() + monitor.interval
+        )
+        if monitor.last_is_up is False:
             send_monitor_notification.delay(
-                monitor_check.pk, False, monitor.last_change
+                monitor_check.pk, False, monitor.last_change_at
             )
 
 
 class MonitorViewSet(viewsets.ModelViewSet):
-    queryset = Monitor.objects.with_check_annotations()
+    queryset = Monitor.objects.all()
     serializer_class = MonitorSerializer
 
     def get_queryset(self):
@@ -89,3 +96,34 @@ class MonitorCheckViewSet(viewsets.ReadOnlyModelViewSet):
         if monitor_pk:
             queryset = queryset.filter(monitor__pk=monitor_pk)
         return queryset
+
+
+class MonitorCheckRollupViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Hourly or daily uptime and response time percentiles, for ranges longer
+    than raw checks are kept. Filter with period (hour or day), start, and end.
+    """
+
+    queryset = MonitorCheckRollup.objects.all()
+    serializer_class = MonitorCheckRollupSerializer
+    filter_backends = [OrderingFilter]
+    ordering = ["-start"]
+    ordering_fields = ["start"]
+
+    def get_queryset(self):
+        if not self.request.user.is_authenticated:
+            return self.queryset.none()
+
+        query = MonitorCheckRollupQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        queryset = self.queryset.filter(
+            monitor__organization__users=self.request.user,
+            monitor__organization__slug=self.kwargs.get("organization_slug"),
+            monitor__pk=self.kwargs.get("monitor_pk"),
+            period=query.validated_data["period"],
+        )
+        if start := query.validated_data.get("start"):
+            queryset = queryset.filter(start__gte=start)
+        if end := query.validated_data.get("end"):
+            queryset = queryset.filter(start__lt=end)
+        return queryset
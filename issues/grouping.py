@@ -0,0 +1,74 @@
+"""
+Issue grouping
+
+Events are grouped into issues by a 16 byte hash of their grouping components:
+issue type, title, and culprit, or the fingerprint sent by the SDK, in which
+"{{ default }}" stands for the default components. Issues are unique per
+project and grouping hash, which keeps the index narrow compared to indexing
+titles and culprits.
+
+Ingest keeps the issue ids of recently seen, unresolved issues in process
+memory to skip the issue lookup of frequent events. Entries expire quickly, as
+issues deleted by other processes aren't noticed until then. Issues may be
+resolved by other processes meanwhile, so events of cached issues still check
+that their issue isn't resolved.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+DEFAULT_FINGERPRINT = "{{default}}"
+LOCAL_ISSUE_CACHE_TIMEOUT = 5
+LOCAL_ISSUE_CACHE_SIZE = 10000
+
+# project_id, grouping hash
+GroupingKey = Tuple[int, bytes]
+
+_local_cache: "OrderedDict[GroupingKey, tuple]" = OrderedDict()
+# Threaded workers share the local cache, and reordering isn't thread safe
+_local_cache_lock = threading.Lock()
+
+
+def get_grouping_hash(
+    issue_type: int,
+    title: str,
+    culprit: Optional[str],
+    fingerprint: Optional[List] = None,
+) -> bytes:
+    components = [int(issue_type), title, culprit]
+    if fingerprint:
+        custom_components = []
+        for part in fingerprint:
+            if str(part).replace(" ", "") == DEFAULT_FINGERPRINT:
+                custom_components += components
+            else:
+                custom_components.append(str(part))
+        components = custom_components
+    return hashlib.blake2b(
+        json.dumps(components, ensure_ascii=False).encode(), digest_size=16
+    ).digest()
+
+
+def get_cached_issue_id(key: GroupingKey) -> Optional[int]:
+    with _local_cache_lock:
+        cached = _local_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+def cache_issue_id(key: GroupingKey, issue_id: int):
+    """Only cache unresolved issues, events of others may change their status"""
+    with _local_cache_lock:
+        _local_cache[key] = (time.monotonic() + LOCAL_ISSUE_CACHE_TIMEOUT, issue_id)
+        _local_cache.move_to_end(key)
+        while len(_local_cache) > LOCAL_ISSUE_CACHE_SIZE:
+            _local_cache.popitem(last=False)
+
+
+def forget_issue_id(key: GroupingKey):
+    with _local_cache_lock:
+        _local_cache.pop(key, None)
@@ -6,6 +6,7 @@ from django.core.management.base import BaseCommand
 from django.shortcuts import reverse
 from django.test import RequestFactory
 
+from events.batch import store_event_batch
 from events.models import Event
 from events.test_data.event_generator import get_seeded_benchmark_events
 from events.views import EventStoreAPIView
@@ -16,6 +17,13 @@ from projects.models import Project
 class Command(BaseCommand):
     help = "Time (for performance) ingesting fake events, including celery processing."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch",
+            action="store_true",
+            help="Store events as the batch ingest worker does, instead of per request",
+        )
+
     def handle(self, *args, **options):
         settings.CELERY_TASK_ALWAYS_EAGER = True
         slug = "benchark-test-jfhr3e3jlek8eewmksde"
@@ -35,18 +43,32 @@ class Command(BaseCommand):
             + key.public_key_hex
         )
 
-        factory = RequestFactory()
         quantity = 300
-        requests = [
-            factory.post(url, data=json.dumps(event), content_type="application/json")
-            for event in get_seeded_benchmark_events(quantity=quantity)
-        ]
-        view = EventStoreAPIView.as_view()
-
-        start = timer()
-        for request in requests:
-            view(request, id=project_id)
-        end = timer()
+        events = get_seeded_benchmark_events(quantity=quantity)
+        if options["batch"]:
+            batch_size = 100
+            items = [
+                {"project_id": project_id, "data": event, "client_ip": None}
+                for event in events
+            ]
+            start = timer()
+            for i in range(0, quantity, batch_size):
+                store_event_batch(items[i : i + batch_size])
+            end = timer()
+        else:
+            factory = RequestFactory()
+            requests = [
+                factory.post(
+                    url, data=json.dumps(event), content_type="application/json"
+                )
+                for event in events
+            ]
+            view = EventStoreAPIView.as_view()
+
+            start = timer()
+            for request in requests:
+                view(request, id=project_id)
+            end = timer()
         print(end - start)
         assert Event.objects.filter(issue__project=project).count() == quantity
         project.issue_set.all().delete()
@@ -4,7 +4,8 @@ from model_bakery.random_gen import gen_json, gen_slug
 
 from events.models import Event
 from events.test_data import event_generator
-from issues.models import Issue
+from issues.grouping import get_grouping_hash
+from issues.models import EventType, Issue
 from issues.tasks import update_search_index_issue
 from organizations_ext.models import Organization
 from projects.models import Project
@@ -34,10 +35,9 @@ class Command(BaseCommand):
         culprit = issue_data.get("culprit")
         metadata = issue_data.get("metadata")
         issue, _ = Issue.objects.get_or_create(
-            title=title,
-            culprit=culprit,
-            metadata=metadata,
             project=project,
+            grouping_hash=get_grouping_hash(EventType.DEFAULT, title, culprit),
+            defaults={"title": title, "culprit": culprit, "metadata": metadata},
         )
 
         quantity = options["quantity"]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-18 04:28
+
+from django.db import migrations, models
+from .sql.functions import INCREMENTAL_UPDATE_ISSUE_INDEX, REBUILD_ISSUE_INDEX
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('issues', '0007_auto_20220715_2048'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='index_watermark',
+            field=models.DateTimeField(editable=False, help_text='Created date of the newest event aggregated by update_index', null=True),
+        ),
+        migrations.RunSQL(REBUILD_ISSUE_INDEX),
+        migrations.RunSQL(INCREMENTAL_UPDATE_ISSUE_INDEX),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.13 on 2026-10-18 04:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+from .sql.functions import BACKFILL_ISSUE_STATS, REBUILD_ISSUE_STATS, UPDATE_ISSUE_STATS
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0008_alter_projectkey_created'),
+        ('issues', '0008_issue_index_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IssueStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(help_text='Start of the hour')),
+                ('count', models.PositiveIntegerField()),
+                ('issue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='issues.issue')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='projects.project')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='issuestat',
+            index=models.Index(fields=['project', 'date'], name='issues_issu_project_8b5d24_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='issuestat',
+            unique_together={('issue', 'date')},
+        ),
+        migrations.RunSQL(UPDATE_ISSUE_STATS),
+        migrations.RunSQL(REBUILD_ISSUE_STATS),
+        migrations.RunSQL(BACKFILL_ISSUE_STATS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1 on 2026-10-18 12:00
+
+from django.db import migrations
+from .sql.functions import (
+    BACKFILL_ISSUE_SEARCH_VECTOR,
+    GENERATE_ISSUE_SEARCH_VECTOR,
+    ISSUE_EVENT_SEARCH_TEXT,
+    WEIGHTED_REBUILD_ISSUE_INDEX,
+    WEIGHTED_UPDATE_ISSUE_INDEX,
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("issues", "0009_issuestat"),
+    ]
+
+    operations = [
+        migrations.RunSQL(GENERATE_ISSUE_SEARCH_VECTOR),
+        migrations.RunSQL(ISSUE_EVENT_SEARCH_TEXT),
+        migrations.RunSQL(WEIGHTED_REBUILD_ISSUE_INDEX),
+        migrations.RunSQL(WEIGHTED_UPDATE_ISSUE_INDEX),
+        migrations.RunSQL(BACKFILL_ISSUE_SEARCH_VECTOR, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.1 on 2026-10-18 12:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Don't lock the issue table while building indexes
+    atomic = False
+
+    dependencies = [
+        ("issues", "0010_weighted_search_vector"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="issue",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tags"], name="issue_tags_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="issue",
+            index=models.Index(
+                fields=["project", "status", "-last_seen"],
+                name="issue_project_status_idx",
+            ),
+        ),
+    ]
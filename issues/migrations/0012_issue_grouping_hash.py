@@ -0,0 +1,143 @@
+# Generated by Django 4.1 on 2026-10-18 12:00
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+BACKFILL_BATCH_SIZE = 5000
+
+UPDATE_GROUPING_HASH_SQL = """
+UPDATE issues_issue SET grouping_hash = batch.grouping_hash
+FROM (VALUES {values}) AS batch (id, grouping_hash)
+WHERE issues_issue.id = batch.id
+"""
+# Once the unique index exists, issues that would duplicate a hash stay null
+UPDATE_UNIQUE_GROUPING_HASH_SQL = (
+    UPDATE_GROUPING_HASH_SQL
+    + """AND NOT EXISTS (
+    SELECT 1 FROM issues_issue AS other
+    WHERE other.project_id = issues_issue.project_id
+    AND other.grouping_hash = batch.grouping_hash
+)
+"""
+)
+
+# Issues with a null culprit weren't unique, keep the oldest of such duplicates
+# grouped. Others keep their events but won't get new ones.
+DEDUPLICATE_GROUPING_HASH_SQL = """
+UPDATE issues_issue SET grouping_hash = NULL
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (
+            PARTITION BY project_id, grouping_hash ORDER BY id
+        ) AS position
+        FROM issues_issue
+        WHERE grouping_hash IS NOT NULL
+    ) AS issue
+    WHERE position > 1
+)
+"""
+
+
+def get_grouping_hash(issue_type, title, culprit):
+    """issues.grouping.get_grouping_hash as of this migration, without fingerprints"""
+    return hashlib.blake2b(
+        json.dumps([int(issue_type), title, culprit], ensure_ascii=False).encode(),
+        digest_size=16,
+    ).digest()
+
+
+def backfill_grouping_hash(apps, schema_editor, unique=False):
+    """Hash existing issues in batches, each committed on its own"""
+    Issue = apps.get_model("issues", "Issue")
+    sql = UPDATE_UNIQUE_GROUPING_HASH_SQL if unique else UPDATE_GROUPING_HASH_SQL
+    last_id = 0
+    while True:
+        batch = list(
+            Issue.objects.filter(pk__gt=last_id, grouping_hash__isnull=True)
+            .order_by("pk")
+            .values_list("pk", "project_id", "type", "title", "culprit")[
+                :BACKFILL_BATCH_SIZE
+            ]
+        )
+        if not batch:
+            break
+        params = []
+        keys = set()
+        for issue_id, project_id, issue_type, title, culprit in batch:
+            grouping_hash = get_grouping_hash(issue_type, title, culprit)
+            # Duplicates within a batch aren't seen by NOT EXISTS
+            if unique and (project_id, grouping_hash) in keys:
+                continue
+            keys.add((project_id, grouping_hash))
+            params += [issue_id, grouping_hash]
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                sql.format(values=", ".join(["(%s, %s::bytea)"] * (len(params) // 2))),
+                params,
+            )
+        last_id = batch[-1][0]
+
+
+def backfill_new_grouping_hash(apps, schema_editor):
+    """Hash issues that running workers created during the first backfill"""
+    backfill_grouping_hash(apps, schema_editor, unique=True)
+
+
+class Migration(migrations.Migration):
+    # Backfill in batches and build the index without locking the issue table.
+    # Workers running the previous version create issues without a hash, those
+    # created until the index is built are hashed afterwards. Stop ingest until
+    # the new version runs, or later issues of old workers stay without a hash
+    # and their events are grouped into new issues.
+    atomic = False
+
+    dependencies = [
+        ("issues", "0011_issue_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="issue",
+            name="grouping_hash",
+            field=models.BinaryField(
+                editable=False,
+                help_text="Hash of the components events are grouped by, see grouping.py",
+                max_length=16,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(backfill_grouping_hash, migrations.RunPython.noop),
+        migrations.RunSQL(DEDUPLICATE_GROUPING_HASH_SQL, migrations.RunSQL.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    "CREATE UNIQUE INDEX CONCURRENTLY issue_project_grouping_hash_uniq "
+                    "ON issues_issue (project_id, grouping_hash)",
+                    "DROP INDEX IF EXISTS issue_project_grouping_hash_uniq",
+                ),
+                migrations.RunSQL(
+                    "ALTER TABLE issues_issue ADD CONSTRAINT "
+                    "issue_project_grouping_hash_uniq UNIQUE USING INDEX "
+                    "issue_project_grouping_hash_uniq",
+                    "ALTER TABLE issues_issue DROP CONSTRAINT "
+                    "issue_project_grouping_hash_uniq",
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="issue",
+                    constraint=models.UniqueConstraint(
+                        fields=("project", "grouping_hash"),
+                        name="issue_project_grouping_hash_uniq",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_new_grouping_hash, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="issue",
+            unique_together={("project", "short_id")},
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+from .sql.functions import (
+    DROP_UNINDEXED_EVENT_TABLE,
+    INDEXED_REBUILD_ISSUE_INDEX,
+    INDEXED_UPDATE_ISSUE_INDEX,
+    REBUILD_ISSUE_STATS,
+    UNINDEXED_EVENT_TABLE,
+    UPDATE_ISSUE_STATS,
+    WEIGHTED_REBUILD_ISSUE_INDEX,
+    WEIGHTED_UPDATE_ISSUE_INDEX,
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0005_event_data_fast_json"),
+        ("issues", "0012_issue_grouping_hash"),
+    ]
+
+    # One transaction, so that no event is counted by both procedures
+    operations = [
+        migrations.RunSQL(UNINDEXED_EVENT_TABLE, DROP_UNINDEXED_EVENT_TABLE),
+        migrations.RunSQL(
+            INDEXED_UPDATE_ISSUE_INDEX,
+            UPDATE_ISSUE_STATS + WEIGHTED_UPDATE_ISSUE_INDEX,
+        ),
+        migrations.RunSQL(
+            INDEXED_REBUILD_ISSUE_INDEX,
+            REBUILD_ISSUE_STATS + WEIGHTED_REBUILD_ISSUE_INDEX,
+        ),
+    ]
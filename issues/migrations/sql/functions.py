@@ -46,3 +46,455 @@ FROM event_agg, event_vector, event_tags
 WHERE issues_issue.id = update_issue_id;
 $$;
 """
+
+REBUILD_ISSUE_INDEX = """
+DROP PROCEDURE IF EXISTS rebuild_issue_index;
+CREATE OR REPLACE PROCEDURE rebuild_issue_index(update_issue_id integer)
+LANGUAGE SQL
+AS $$
+WITH event_agg as (
+    SELECT COUNT(events_event.event_id) as new_count,
+    MAX(events_event.created) as new_last_seen,
+    MAX(events_event.level) as new_level
+    FROM events_event
+    WHERE events_event.issue_id=update_issue_id
+), event_vector as (
+    SELECT strip(COALESCE(generate_issue_tsvector(data), '') || COALESCE(issues_issue.search_vector, '')) as vector
+    FROM events_event
+    LEFT JOIN issues_issue on issues_issue.id = events_event.issue_id
+    WHERE events_event.issue_id=update_issue_id
+    limit 1
+), event_tags as (
+  SELECT jsonb_object_agg(y.key, y.values) as new_tags FROM (
+    SELECT (a).key, array_agg(distinct(a).value) as values
+    FROM (
+      SELECT each(tags) as a
+      FROM events_event
+      WHERE events_event.issue_id=update_issue_id
+    ) t GROUP by key
+  ) y
+)
+UPDATE issues_issue
+SET
+  count = event_agg.new_count,
+  last_seen = event_agg.new_last_seen,
+  level = event_agg.new_level,
+  search_vector = CASE WHEN search_vector is null or length(search_vector) < 100000 THEN event_vector.vector ELSE search_vector END,
+  tags = CASE WHEN event_Tags.new_tags is not null THEN event_tags.new_tags ELSE tags END,
+  index_watermark = event_agg.new_last_seen
+FROM event_agg, event_vector, event_tags
+WHERE issues_issue.id = update_issue_id;
+$$;
+"""
+
+# Only aggregates events created after the issue's index_watermark
+# Falls back to all events when the issue was never indexed
+INCREMENTAL_UPDATE_ISSUE_INDEX = """
+DROP PROCEDURE IF EXISTS update_issue_index;
+CREATE OR REPLACE PROCEDURE update_issue_index(update_issue_id integer)
+LANGUAGE SQL
+AS $$
+WITH new_events as (
+    SELECT events_event.created, events_event.level, events_event.data, events_event.tags
+    FROM events_event
+    JOIN issues_issue on issues_issue.id = events_event.issue_id
+    WHERE events_event.issue_id=update_issue_id
+    AND (issues_issue.index_watermark is null OR events_event.created > issues_issue.index_watermark)
+), event_agg as (
+    SELECT COUNT(*) as new_count,
+    MAX(new_events.created) as new_last_seen,
+    MAX(new_events.level) as new_level
+    FROM new_events
+), event_vector as (
+    SELECT generate_issue_tsvector(data) as vector
+    FROM new_events
+    limit 1
+), event_tags as (
+  SELECT jsonb_object_agg(y.key, y.values) as new_tags FROM (
+    SELECT key, array_agg(distinct value) as values
+    FROM (
+      SELECT (a).key, (a).value
+      FROM (SELECT each(tags) as a FROM new_events) new_event_tags
+      UNION ALL
+      SELECT issue_tags.key, jsonb_array_elements_text(issue_tags.value)
+      FROM issues_issue, jsonb_each(issues_issue.tags) issue_tags
+      WHERE issues_issue.id=update_issue_id
+      AND issues_issue.index_watermark is not null
+      AND jsonb_typeof(issue_tags.value) = 'array'
+    ) t GROUP by key
+  ) y
+)
+UPDATE issues_issue
+SET
+  count = CASE WHEN index_watermark is null THEN 0 ELSE count END + event_agg.new_count,
+  last_seen = CASE WHEN index_watermark is null THEN event_agg.new_last_seen ELSE GREATEST(last_seen, event_agg.new_last_seen) END,
+  level = CASE WHEN index_watermark is null THEN event_agg.new_level ELSE GREATEST(level, event_agg.new_level) END,
+  search_vector = CASE WHEN search_vector is null or length(search_vector) < 100000 THEN strip(COALESCE(event_vector.vector, '') || COALESCE(search_vector, '')) ELSE search_vector END,
+  tags = CASE WHEN event_tags.new_tags is not null THEN event_tags.new_tags ELSE tags END,
+  index_watermark = event_agg.new_last_seen
+FROM event_agg
+LEFT JOIN event_vector on true, event_tags
+WHERE issues_issue.id = update_issue_id
+AND event_agg.new_count > 0;
+$$;
+"""
+
+# Must be called before update_issue_index, which moves the watermark
+UPDATE_ISSUE_STATS = """
+DROP PROCEDURE IF EXISTS update_issue_stats;
+CREATE OR REPLACE PROCEDURE update_issue_stats(update_issue_id integer)
+LANGUAGE SQL
+AS $$
+INSERT INTO issues_issuestat (issue_id, project_id, date, count)
+SELECT events_event.issue_id, issues_issue.project_id, date_trunc('hour', events_event.created), COUNT(*)
+FROM events_event
+JOIN issues_issue on issues_issue.id = events_event.issue_id
+WHERE events_event.issue_id=update_issue_id
+AND (issues_issue.index_watermark is null OR events_event.created > issues_issue.index_watermark)
+GROUP BY 1, 2, 3
+ON CONFLICT (issue_id, date) DO UPDATE SET count = issues_issuestat.count + EXCLUDED.count;
+$$;
+"""
+
+REBUILD_ISSUE_STATS = """
+DROP PROCEDURE IF EXISTS rebuild_issue_stats;
+CREATE OR REPLACE PROCEDURE rebuild_issue_stats(update_issue_id integer)
+LANGUAGE SQL
+AS $$
+DELETE FROM issues_issuestat WHERE issue_id=update_issue_id;
+INSERT INTO issues_issuestat (issue_id, project_id, date, count)
+SELECT events_event.issue_id, issues_issue.project_id, date_trunc('hour', events_event.created), COUNT(*)
+FROM events_event
+JOIN issues_issue on issues_issue.id = events_event.issue_id
+WHERE events_event.issue_id=update_issue_id
+GROUP BY 1, 2, 3;
+$$;
+"""
+
+# Populate stats from existing events and move watermarks past them
+BACKFILL_ISSUE_STATS = """
+INSERT INTO issues_issuestat (issue_id, project_id, date, count)
+SELECT events_event.issue_id, issues_issue.project_id, date_trunc('hour', events_event.created), COUNT(*)
+FROM events_event
+JOIN issues_issue on issues_issue.id = events_event.issue_id
+GROUP BY 1, 2, 3;
+
+UPDATE issues_issue
+SET count = event_agg.new_count, index_watermark = event_agg.new_watermark
+FROM (
+    SELECT issue_id, COUNT(*) as new_count, MAX(created) as new_watermark
+    FROM events_event
+    GROUP BY issue_id
+) event_agg
+WHERE issues_issue.id = event_agg.issue_id;
+"""
+
+# Search vector of selected issue fields, weighted by relevance:
+# A title, B culprit and exception, D tag values
+# Event messages are added as C by update_issue_index, see ISSUE_EVENT_SEARCH_TEXT
+GENERATE_ISSUE_SEARCH_VECTOR = """
+CREATE OR REPLACE FUNCTION generate_issue_search_vector(title text, culprit text, metadata jsonb, tags jsonb) RETURNS tsvector AS $$
+BEGIN
+    RETURN setweight(to_tsvector(COALESCE(title, '')), 'A')
+        || setweight(to_tsvector(concat_ws(' ', culprit, metadata->>'type', metadata->>'value', metadata->>'function')), 'B')
+        || setweight(COALESCE(jsonb_to_tsvector(tags, '["string"]'), ''), 'D');
+    EXCEPTION WHEN program_limit_exceeded THEN
+    RETURN setweight(to_tsvector(COALESCE(title, '')), 'A');
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Searchable text of one event, its message and exception values
+ISSUE_EVENT_SEARCH_TEXT = """
+CREATE OR REPLACE FUNCTION issue_event_search_text(data jsonb) RETURNS text AS $$
+SELECT left(concat_ws(' ',
+    NULLIF(data->>'message', ''),
+    data->'logentry'->>'formatted',
+    (
+        SELECT string_agg(concat_ws(' ', exception->>'type', exception->>'value'), ' ')
+        FROM jsonb_array_elements(
+            CASE WHEN jsonb_typeof(data->'exception'->'values') = 'array' THEN data->'exception'->'values' END
+        ) exception
+    )
+), 10000);
+$$ LANGUAGE SQL IMMUTABLE;
+"""
+
+# Rebuilds the C weighted messages from the issue's latest events
+WEIGHTED_REBUILD_ISSUE_INDEX = """
+DROP PROCEDURE IF EXISTS rebuild_issue_index;
+CREATE OR REPLACE PROCEDURE rebuild_issue_index(update_issue_id integer)
+LANGUAGE SQL
+AS $$
+WITH event_agg as (
+    SELECT COUNT(events_event.event_id) as new_count,
+    MAX(events_event.created) as new_last_seen,
+    MAX(events_event.level) as new_level
+    FROM events_event
+    WHERE events_event.issue_id=update_issue_id
+), event_vector as (
+    SELECT setweight(to_tsvector(string_agg(DISTINCT event_text, ' ')), 'C') as vector
+    FROM (
+        SELECT issue_event_search_text(data) as event_text
+        FROM events_event
+        WHERE events_event.issue_id=update_issue_id
+        ORDER BY events_event.created DESC
+        LIMIT 100
+    ) latest_events
+), event_tags as (
+  SELECT jsonb_object_agg(y.key, y.values) as new_tags FROM (
+    SELECT (a).key, array_agg(distinct(a).value) as values
+    FROM (
+      SELECT each(tags) as a
+      FROM events_event
+      WHERE events_event.issue_id=update_issue_id
+    ) t GROUP by key
+  ) y
+)
+UPDATE issues_issue
+SET
+  count = event_agg.new_count,
+  last_seen = event_agg.new_last_seen,
+  level = event_agg.new_level,
+  search_vector = generate_issue_search_vector(title, culprit, metadata, COALESCE(event_tags.new_tags, tags)) || COALESCE(event_vector.vector, ''),
+  tags = CASE WHEN event_Tags.new_tags is not null THEN event_tags.new_tags ELSE tags END,
+  index_watermark = event_agg.new_last_seen
+FROM event_agg, event_vector, event_tags
+WHERE issues_issue.id = update_issue_id
+AND event_agg.new_count > 0;
+$$;
+"""
+
+# Regenerates the weighted issue fields and appends the messages of new events
+# to the C weighted lexemes kept from previous updates, up to 10000 lexemes
+WEIGHTED_UPDATE_ISSUE_INDEX = """
+DROP PROCEDURE IF EXISTS update_issue_index;
+CREATE OR REPLACE PROCEDURE update_issue_index(update_issue_id integer)
+LANGUAGE SQL
+AS $$
+WITH new_events as (
+    SELECT events_event.created, events_event.level, events_event.data, events_event.tags
+    FROM events_event
+    JOIN issues_issue on issues_issue.id = events_event.issue_id
+    WHERE events_event.issue_id=update_issue_id
+    AND (issues_issue.index_watermark is null OR events_event.created > issues_issue.index_watermark)
+), event_agg as (
+    SELECT COUNT(*) as new_count,
+    MAX(new_events.created) as new_last_seen,
+    MAX(new_events.level) as new_level
+    FROM new_events
+), event_vector as (
+    SELECT setweight(to_tsvector(string_agg(DISTINCT event_text, ' ')), 'C') as vector
+    FROM (
+        SELECT issue_event_search_text(data) as event_text
+        FROM new_events
+        ORDER BY new_events.created DESC
+        LIMIT 10
+    ) latest_events
+), event_tags as (
+  SELECT jsonb_object_agg(y.key, y.values) as new_tags FROM (
+    SELECT key, array_agg(distinct value) as values
+    FROM (
+      SELECT (a).key, (a).value
+      FROM (SELECT each(tags) as a FROM new_events) new_event_tags
+      UNION ALL
+      SELECT issue_tags.key, jsonb_array_elements_text(issue_tags.value)
+      FROM issues_issue, jsonb_each(issues_issue.tags) issue_tags
+      WHERE issues_issue.id=update_issue_id
+      AND issues_issue.index_watermark is not null
+      AND jsonb_typeof(issue_tags.value) = 'array'
+    ) t GROUP by key
+  ) y
+)
+UPDATE issues_issue
+SET
+  count = CASE WHEN index_watermark is null THEN 0 ELSE count END + event_agg.new_count,
+  last_seen = CASE WHEN index_watermark is null THEN event_agg.new_last_seen ELSE GREATEST(last_seen, event_agg.new_last_seen) END,
+  level = CASE WHEN index_watermark is null THEN event_agg.new_level ELSE GREATEST(level, event_agg.new_level) END,
+  search_vector = generate_issue_search_vector(title, culprit, metadata, COALESCE(event_tags.new_tags, tags))
+    || CASE WHEN length(ts_filter(COALESCE(search_vector, ''), '{c}')) < 10000
+      THEN ts_filter(COALESCE(search_vector, ''), '{c}') || COALESCE(event_vector.vector, '')
+      ELSE ts_filter(search_vector, '{c}') END,
+  tags = CASE WHEN event_tags.new_tags is not null THEN event_tags.new_tags ELSE tags END,
+  index_watermark = event_agg.new_last_seen
+FROM event_agg, event_vector, event_tags
+WHERE issues_issue.id = update_issue_id
+AND event_agg.new_count > 0;
+$$;
+"""
+
+# Weighted fields for existing issues, messages are added as new events arrive
+BACKFILL_ISSUE_SEARCH_VECTOR = """
+UPDATE issues_issue
+SET search_vector = generate_issue_search_vector(title, culprit, metadata, tags);
+"""
+
+# Consumes the issue's unindexed events and aggregates them, in one statement so
+# that stats and aggregations count the same events. Unlike a created date
+# watermark, this counts events that commit after newer events were indexed.
+INDEXED_UPDATE_ISSUE_INDEX = """
+DROP PROCEDURE IF EXISTS update_issue_stats;
+DROP PROCEDURE IF EXISTS update_issue_index;
+CREATE OR REPLACE PROCEDURE update_issue_index(update_issue_id integer)
+LANGUAGE SQL
+AS $$
+WITH unindexed_events as (
+    DELETE FROM issues_unindexedevent
+    WHERE issues_unindexedevent.issue_id=update_issue_id
+    RETURNING issues_unindexedevent.event_id, issues_unindexedevent.created
+), new_events as (
+    SELECT events_event.created, events_event.level, events_event.data, events_event.tags
+    FROM unindexed_events
+    JOIN events_event on events_event.event_id = unindexed_events.event_id
+    AND events_event.created = unindexed_events.created
+    WHERE events_event.issue_id=update_issue_id
+), event_stats as (
+    INSERT INTO issues_issuestat (issue_id, project_id, date, count)
+    SELECT issues_issue.id, issues_issue.project_id, date_trunc('hour', new_events.created), COUNT(*)
+    FROM new_events
+    JOIN issues_issue on issues_issue.id = update_issue_id
+    GROUP BY 1, 2, 3
+    ON CONFLICT (issue_id, date) DO UPDATE SET count = issues_issuestat.count + EXCLUDED.count
+), event_agg as (
+    SELECT COUNT(*) as new_count,
+    MAX(new_events.created) as new_last_seen,
+    MAX(new_events.level) as new_level
+    FROM new_events
+), event_vector as (
+    SELECT setweight(to_tsvector(string_agg(DISTINCT event_text, ' ')), 'C') as vector
+    FROM (
+        SELECT issue_event_search_text(data) as event_text
+        FROM new_events
+        ORDER BY new_events.created DESC
+        LIMIT 10
+    ) latest_events
+), event_tags as (
+  SELECT jsonb_object_agg(y.key, y.values) as new_tags FROM (
+    SELECT key, array_agg(distinct value) as values
+    FROM (
+      SELECT (a).key, (a).value
+      FROM (SELECT each(tags) as a FROM new_events) new_event_tags
+      UNION ALL
+      SELECT issue_tags.key, jsonb_array_elements_text(issue_tags.value)
+      FROM issues_issue, jsonb_each(issues_issue.tags) issue_tags
+      WHERE issues_issue.id=update_issue_id
+      AND issues_issue.index_watermark is not null
+      AND jsonb_typeof(issue_tags.value) = 'array'
+    ) t GROUP by key
+  ) y
+)
+UPDATE issues_issue
+SET
+  count = CASE WHEN index_watermark is null THEN 0 ELSE count END + event_agg.new_count,
+  last_seen = CASE WHEN index_watermark is null THEN event_agg.new_last_seen ELSE GREATEST(last_seen, event_agg.new_last_seen) END,
+  level = CASE WHEN index_watermark is null THEN event_agg.new_level ELSE GREATEST(level, event_agg.new_level) END,
+  search_vector = generate_issue_search_vector(title, culprit, metadata, COALESCE(event_tags.new_tags, tags))
+    || CASE WHEN length(ts_filter(COALESCE(search_vector, ''), '{c}')) < 10000
+      THEN ts_filter(COALESCE(search_vector, ''), '{c}') || COALESCE(event_vector.vector, '')
+      ELSE ts_filter(search_vector, '{c}') END,
+  tags = CASE WHEN event_tags.new_tags is not null THEN event_tags.new_tags ELSE tags END,
+  index_watermark = GREATEST(index_watermark, event_agg.new_last_seen)
+FROM event_agg, event_vector, event_tags
+WHERE issues_issue.id = update_issue_id
+AND event_agg.new_count > 0;
+$$;
+"""
+
+# Recomputes stats and aggregations from all events, and forgets unindexed ones
+INDEXED_REBUILD_ISSUE_INDEX = """
+DROP PROCEDURE IF EXISTS rebuild_issue_stats;
+DROP PROCEDURE IF EXISTS rebuild_issue_index;
+CREATE OR REPLACE PROCEDURE rebuild_issue_index(update_issue_id integer)
+LANGUAGE SQL
+AS $$
+WITH indexed_events as (
+    DELETE FROM issues_unindexedevent
+    WHERE issues_unindexedevent.issue_id=update_issue_id
+), new_stats as (
+    SELECT date_trunc('hour', events_event.created) as date, COUNT(*) as count
+    FROM events_event
+    WHERE events_event.issue_id=update_issue_id
+    GROUP BY 1
+), upserted_stats as (
+    INSERT INTO issues_issuestat (issue_id, project_id, date, count)
+    SELECT issues_issue.id, issues_issue.project_id, new_stats.date, new_stats.count
+    FROM new_stats
+    JOIN issues_issue on issues_issue.id = update_issue_id
+    ON CONFLICT (issue_id, date) DO UPDATE SET count = EXCLUDED.count
+), removed_stats as (
+    DELETE FROM issues_issuestat
+    WHERE issues_issuestat.issue_id=update_issue_id
+    AND issues_issuestat.date NOT IN (SELECT date FROM new_stats)
+), event_agg as (
+    SELECT COUNT(events_event.event_id) as new_count,
+    MAX(events_event.created) as new_last_seen,
+    MAX(events_event.level) as new_level
+    FROM events_event
+    WHERE events_event.issue_id=update_issue_id
+), event_vector as (
+    SELECT setweight(to_tsvector(string_agg(DISTINCT event_text, ' ')), 'C') as vector
+    FROM (
+        SELECT issue_event_search_text(data) as event_text
+        FROM events_event
+        WHERE events_event.issue_id=update_issue_id
+        ORDER BY events_event.created DESC
+        LIMIT 100
+    ) latest_events
+), event_tags as (
+  SELECT jsonb_object_agg(y.key, y.values) as new_tags FROM (
+    SELECT (a).key, array_agg(distinct(a).value) as values
+    FROM (
+      SELECT each(tags) as a
+      FROM events_event
+      WHERE events_event.issue_id=update_issue_id
+    ) t GROUP by key
+  ) y
+)
+UPDATE issues_issue
+SET
+  count = event_agg.new_count,
+  last_seen = event_agg.new_last_seen,
+  level = event_agg.new_level,
+  search_vector = generate_issue_search_vector(title, culprit, metadata, COALESCE(event_tags.new_tags, tags)) || COALESCE(event_vector.vector, ''),
+  tags = CASE WHEN event_Tags.new_tags is not null THEN event_tags.new_tags ELSE tags END,
+  index_watermark = event_agg.new_last_seen
+FROM event_agg, event_vector, event_tags
+WHERE issues_issue.id = update_issue_id
+AND event_agg.new_count > 0;
+$$;
+"""
+
+# Ids of events that update_issue_index didn't aggregate yet, recorded by a
+# trigger, so that events rows are never updated. Starts with the events that
+# the created date watermark didn't count yet.
+UNINDEXED_EVENT_TABLE = """
+CREATE TABLE issues_unindexedevent (
+    issue_id integer NOT NULL,
+    event_id uuid NOT NULL,
+    created timestamp with time zone NOT NULL
+);
+CREATE INDEX issues_unindexedevent_issue_id ON issues_unindexedevent (issue_id);
+
+CREATE OR REPLACE FUNCTION record_unindexed_event() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO issues_unindexedevent (issue_id, event_id, created)
+    VALUES (NEW.issue_id, NEW.event_id, NEW.created);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER events_event_unindexed AFTER INSERT ON events_event
+FOR EACH ROW EXECUTE FUNCTION record_unindexed_event();
+
+INSERT INTO issues_unindexedevent (issue_id, event_id, created)
+SELECT events_event.issue_id, events_event.event_id, events_event.created
+FROM events_event
+JOIN issues_issue on issues_issue.id = events_event.issue_id
+WHERE issues_issue.index_watermark is null OR events_event.created > issues_issue.index_watermark;
+"""
+
+DROP_UNINDEXED_EVENT_TABLE = """
+DROP TRIGGER IF EXISTS events_event_unindexed ON events_event;
+DROP FUNCTION IF EXISTS record_unindexed_event;
+DROP TABLE IF EXISTS issues_unindexedevent;
+"""
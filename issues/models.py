@@ -7,6 +7,7 @@ from events.models import LogLevel
 from glitchtip.base_models import CreatedModel
 from glitchtip.model_utils import FromStringIntegerChoices
 
+from .grouping import forget_issue_id
 from .utils import base32_encode
 
 
@@ -53,13 +54,35 @@ class Issue(CreatedModel):
     search_vector = SearchVectorField(null=True, editable=False)
     count = models.PositiveIntegerField(default=1, editable=False)
     last_seen = models.DateTimeField(auto_now_add=True, db_index=True)
+    grouping_hash = models.BinaryField(
+        max_length=16,
+        null=True,
+        editable=False,
+        help_text="Hash of the components events are grouped by, see grouping.py",
+    )
+    index_watermark = models.DateTimeField(
+        null=True,
+        editable=False,
+        help_text="Created date of the newest event aggregated by update_index",
+    )
 
     class Meta:
-        unique_together = (
-            ("title", "culprit", "project", "type"),
-            ("project", "short_id"),
-        )
-        indexes = [GinIndex(fields=["search_vector"], name="search_vector_idx")]
+        unique_together = (("project", "short_id"),)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["project", "grouping_hash"],
+                name="issue_project_grouping_hash_uniq",
+            ),
+        ]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="search_vector_idx"),
+            # Used by the issue search query language, see issues/query.py
+            GinIndex(fields=["tags"], name="issue_tags_idx"),
+            models.Index(
+                fields=["project", "status", "-last_seen"],
+                name="issue_project_status_idx",
+            ),
+        ]
 
     def event(self):
         return self.event_set.first()
@@ -67,6 +90,12 @@ class Issue(CreatedModel):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The status may have changed, look it up again with the next event
+        if self.grouping_hash:
+            forget_issue_id((self.project_id, bytes(self.grouping_hash)))
+
     def check_for_status_update(self):
         """
         Determine if issue should regress back to unresolved
@@ -102,7 +131,32 @@ class Issue(CreatedModel):
     @classmethod
     def update_index(cls, issue_id: int):
         """
-        Update search index/tag aggregations
+        Update search index/tag aggregations and stats with events that weren't
+        indexed yet
         """
         with connection.cursor() as cursor:
             cursor.execute("CALL update_issue_index(%s)", [issue_id])
+
+    @classmethod
+    def rebuild_index(cls, issue_id: int):
+        """
+        Recompute search index/tag aggregations from all events. Slow, use for repair.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("CALL rebuild_issue_index(%s)", [issue_id])
+
+
+class IssueStat(models.Model):
+    """
+    Count of events per issue per hour. Used for stats and billing event counts
+    instead of counting events. Populated when issue indexes are updated.
+    """
+
+    issue = models.ForeignKey(Issue, on_delete=models.CASCADE)
+    project = models.ForeignKey("projects.Project", on_delete=models.CASCADE)
+    date = models.DateTimeField(help_text="Start of the hour")
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = (("issue", "date"),)
+        indexes = [models.Index(fields=["project", "date"])]
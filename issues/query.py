@@ -0,0 +1,239 @@
+"""
+Issue search query language
+
+Compiles the issue list query parameter into a Q filter and free text, which
+is passed on to the search backend. Terms are ANDed unless joined by OR.
+
+- is:unresolved, is:resolved, is:ignored
+- level:error, level:>=warning
+- has:browser
+- timesSeen:>10, timesSeen:<=100
+- lastSeen:-24h (within the last day), lastSeen:+7d (older than a week),
+  firstSeen:>2023-01-31, lastSeen:<2023-01-31T12:00:00Z
+- Any other key:value is a tag, such as browser.name:"Mobile Safari"
+- NOT, or a ! or - prefix, negates a term: !is:resolved -has:user
+- AND, OR, and parentheses: (level:error OR level:fatal) browser.name:Firefox
+- Anything else is free text, which can't be negated or used within OR
+
+Filters are kept to expressions that the issue indexes support: tag filters
+use containment (@>) and key existence (?) for the GIN index on tags, status
+and last_seen are covered by a btree index on (project, status, last_seen).
+"""
+import re
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from typing import List, Optional
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from events.models import LogLevel
+
+from .models import EventStatus
+
+TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|((?:[^\s()"]+|"(?:[^"\\]|\\.)*")+))')
+TERM_RE = re.compile(r"^(?P<negate>[!-])?(?P<key>[\w.\-@]+):(?P<value>.*)$")
+COMPARISON_RE = re.compile(r"^(?P<op>>=|<=|>|<|=)?(?P<value>.*)$")
+RELATIVE_TIME_RE = re.compile(r"^(?P<sign>[-+])?(?P<amount>\d+)(?P<unit>[smhdw])$")
+RELATIVE_TIME_UNITS = {
+    "s": "seconds",
+    "m": "minutes",
+    "h": "hours",
+    "d": "days",
+    "w": "weeks",
+}
+COMPARISON_LOOKUPS = {">": "gt", ">=": "gte", "<": "lt", "<=": "lte", "=": "exact"}
+
+DATE_FIELDS = {"lastSeen": "last_seen", "firstSeen": "created"}
+NUMBER_FIELDS = {"timesSeen": "count"}
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+@dataclass
+class IssueQuery:
+    filter: Q
+    text: str
+
+
+def tokenize(query: str) -> List[str]:
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = TOKEN_RE.match(query, position)
+        if not match or match.end() == position:
+            raise QuerySyntaxError(f"Unexpected character at {position}: {query}")
+        tokens.append(next(group for group in match.groups() if group))
+        position = match.end()
+    return tokens
+
+
+def unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+class QueryParser:
+    """
+    Recursive descent parser producing nested tuples:
+    ("or", [nodes]), ("and", [nodes]), ("not", node), ("term", key, value),
+    and ("text", words)
+    """
+
+    def __init__(self, query: str):
+        self.tokens = tokenize(query)
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def pop(self) -> str:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            return ("and", [])
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise QuerySyntaxError(f"Unexpected {self.peek()}")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == "OR":
+            self.pop()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek() not in (None, ")", "OR"):
+            if self.peek() == "AND":
+                self.pop()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_not(self):
+        if self.peek() == "NOT":
+            self.pop()
+            return ("not", self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.peek()
+        if token is None or token in (")", "AND", "OR"):
+            raise QuerySyntaxError(f"Expected a term, got {token or 'end of query'}")
+        self.pop()
+        if token == "(":
+            node = self.parse_or()
+            if self.peek() != ")":
+                raise QuerySyntaxError("Missing closing parenthesis")
+            self.pop()
+            return node
+        if match := TERM_RE.match(token):
+            node = ("term", match.group("key"), unquote(match.group("value")))
+            return ("not", node) if match.group("negate") else node
+        if token.startswith("!"):
+            return ("not", ("text", unquote(token[1:])))
+        return ("text", unquote(token))
+
+
+def parse_datetime_value(value: str):
+    """
+    Returns datetime and the default comparison, which is "date" for dates
+    without time that match the whole day
+    """
+    if match := RELATIVE_TIME_RE.match(value):
+        delta = timedelta(
+            **{RELATIVE_TIME_UNITS[match.group("unit")]: int(match.group("amount"))}
+        )
+        return timezone.now() - delta, "<=" if match.group("sign") == "+" else ">="
+    try:
+        if result := parse_datetime(value):
+            if timezone.is_naive(result):
+                result = timezone.make_aware(result, dt_timezone.utc)
+            return result, "="
+        if result := parse_date(value):
+            return datetime.combine(result, time.min, dt_timezone.utc), "date"
+    except ValueError:
+        pass
+    raise QuerySyntaxError(f"Invalid date {value}")
+
+
+def compile_term(key: str, value: str) -> Q:
+    if key == "is":
+        status = EventStatus.from_string(value)
+        if status is None:
+            raise QuerySyntaxError(f"Invalid status {value}")
+        return Q(status=status)
+    if key == "has":
+        return Q(tags__has_key=value)
+    if key in DATE_FIELDS:
+        op, value = COMPARISON_RE.match(value).groups()
+        date, default_op = parse_datetime_value(value)
+        field = DATE_FIELDS[key]
+        if default_op == "date":
+            # Compare with the start or end of the day instead of using __date,
+            # which can't use the index
+            next_day = date + timedelta(days=1)
+            if op in (None, "="):
+                return Q(**{f"{field}__gte": date, f"{field}__lt": next_day})
+            if op in (">", "<="):
+                date = next_day
+            return Q(**{f"{field}__{'gte' if op[0] == '>' else 'lt'}": date})
+        return Q(**{f"{field}__{COMPARISON_LOOKUPS[op or default_op]}": date})
+    if key in NUMBER_FIELDS:
+        op, value = COMPARISON_RE.match(value).groups()
+        try:
+            number = int(value)
+        except ValueError as err:
+            raise QuerySyntaxError(f"Invalid number {value}") from err
+        return Q(**{f"{NUMBER_FIELDS[key]}__{COMPARISON_LOOKUPS[op or '=']}": number})
+    if key == "level":
+        op, value = COMPARISON_RE.match(value).groups()
+        if value not in LogLevel.labels:
+            raise QuerySyntaxError(f"Invalid level {value}")
+        level = LogLevel.from_string(value)
+        return Q(**{f"level__{COMPARISON_LOOKUPS[op or '=']}": level})
+    return Q(tags__contains={key: [value]})
+
+
+def compile_node(node, text: Optional[List[str]]) -> Q:
+    """
+    Compile a parsed node into Q. Free text is appended to text, which is None
+    where free text isn't allowed.
+    """
+    kind = node[0]
+    if kind == "term":
+        return compile_term(node[1], node[2])
+    if kind == "text":
+        if text is None:
+            raise QuerySyntaxError("Free text can't be negated or used with OR")
+        text.append(node[1])
+        return Q()
+    if kind == "not":
+        return ~compile_node(node[1], None)
+    if kind == "and":
+        result = Q()
+        for child in node[1]:
+            result &= compile_node(child, text)
+        return result
+    result = Q()
+    for child in node[1]:
+        result |= compile_node(child, None)
+    return result
+
+
+def compile_issue_query(query: str) -> IssueQuery:
+    text: List[str] = []
+    issue_filter = compile_node(QueryParser(query).parse(), text)
+    return IssueQuery(filter=issue_filter, text=" ".join(text))
@@ -0,0 +1,196 @@
+"""
+Issue full-text search backends
+
+The backend is set by ISSUE_SEARCH_BACKEND. Backends are given the search words
+of an issue list query and filter the issue queryset, annotating each issue with
+a relevance score. They are fed incrementally by update_search_index_issue,
+which runs after events are stored.
+
+PostgresSearchBackend uses Issue.search_vector, which update_issue_index fills
+from selected fields with weights, see migration 0010.
+SQLiteSearchBackend keeps an embedded FTS5 index in a local file, for
+deployments that would rather keep search load out of Postgres.
+"""
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Iterable
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.fields.json import KeyTextTransform
+from django.utils.module_loading import import_string
+
+from events.models import Event
+
+from .models import Issue
+
+# Most relevant issues returned by backends that don't search in Postgres
+MAX_SEARCH_RESULTS = 1000
+# Max length of event messages kept per issue in the embedded index
+MAX_MESSAGE_LENGTH = 10000
+
+
+class SearchBackend:
+    def index_issue(self, issue_id: int):
+        """Index changes of an issue and its events since the last call"""
+
+    def rebuild_issue(self, issue_id: int):
+        """Index an issue from scratch"""
+        self.index_issue(issue_id)
+
+    def search(self, queryset, query: str):
+        """Filter issues matching query, annotated with relevance"""
+        raise NotImplementedError
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Issue.search_vector is kept up to date by Issue.update_index"""
+
+    # Weights of D, C, B, and A lexemes: tags, messages, culprit, and title
+    weights = [0.1, 0.2, 0.4, 1.0]
+
+    def search(self, queryset, query: str):
+        search_query = SearchQuery(query)
+        return queryset.filter(search_vector=search_query).annotate(
+            relevance=SearchRank(
+                F("search_vector"), search_query, weights=self.weights
+            )
+        )
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    Embedded SQLite FTS5 index, one row per issue with the issue id as rowid
+
+    Deleted issues are not removed from the index, they're excluded by the
+    issue queryset.
+    """
+
+    # bm25 weights of title, culprit, exception, message, tags, and project_id
+    weights = (10.0, 5.0, 5.0, 2.0, 1.0, 0.0)
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.ISSUE_SEARCH_SQLITE_PATH
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """sqlite connections can't be shared across threads"""
+        if not hasattr(self._local, "connection"):
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS issue_search USING fts5("
+                "title, culprit, exception, message, tags, project_id UNINDEXED)"
+            )
+            self._local.connection = conn
+        return self._local.connection
+
+    def _get_event_messages(self, issue_id: int, limit: int) -> Iterable[str]:
+        events = (
+            Event.objects.filter(issue_id=issue_id)
+            .order_by("-created")
+            .annotate(
+                message=KeyTextTransform("message", "data"),
+                exception_value=KeyTextTransform(
+                    "value", KeyTextTransform("metadata", "data")
+                ),
+            )
+            .values_list("message", "exception_value")[:limit]
+        )
+        for message, exception_value in events:
+            if text := " ".join(filter(None, (message, exception_value))):
+                yield text
+
+    def _index(self, issue_id: int, message: str, messages: Iterable[str]):
+        issue = (
+            Issue.objects.filter(pk=issue_id)
+            .values("title", "culprit", "metadata", "tags", "project_id")
+            .first()
+        )
+        if not issue:
+            return
+        for new_message in messages:
+            if new_message not in message:
+                message = f"{message}\n{new_message}"
+        metadata = issue["metadata"] or {}
+        tags = " ".join(
+            str(value)
+            for values in (issue["tags"] or {}).values()
+            for value in (values if isinstance(values, list) else [values])
+        )
+        with self.connection as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO issue_search "
+                "(rowid, title, culprit, exception, message, tags, project_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    issue_id,
+                    issue["title"],
+                    issue["culprit"] or "",
+                    " ".join(
+                        str(metadata[key])
+                        for key in ("type", "value", "function")
+                        if metadata.get(key)
+                    ),
+                    message[-MAX_MESSAGE_LENGTH:].strip(),
+                    tags,
+                    issue["project_id"],
+                ),
+            )
+
+    def index_issue(self, issue_id: int):
+        row = self.connection.execute(
+            "SELECT message FROM issue_search WHERE rowid = ?", (issue_id,)
+        ).fetchone()
+        message = row[0] if row else ""
+        self._index(issue_id, message, self._get_event_messages(issue_id, 10))
+
+    def rebuild_issue(self, issue_id: int):
+        self._index(issue_id, "", self._get_event_messages(issue_id, 100))
+
+    @staticmethod
+    def _match_expression(query: str) -> str:
+        """All words of query, quoted so that FTS5 syntax isn't interpreted"""
+        return " ".join(
+            '"{}"'.format(word.replace('"', '""')) for word in query.split()
+        )
+
+    def search(self, queryset, query: str):
+        match = self._match_expression(query)
+        if not match:
+            return queryset.annotate(relevance=Value(0.0, FloatField()))
+        project_ids = list(
+            queryset.order_by().values_list("project_id", flat=True).distinct()
+        )
+        if not project_ids:
+            return queryset.none()
+        rows = self.connection.execute(
+            "SELECT rowid, bm25(issue_search, {weights}) as score "
+            "FROM issue_search WHERE issue_search MATCH ? "
+            "AND project_id IN ({projects}) ORDER BY score LIMIT ?".format(
+                weights=", ".join(str(weight) for weight in self.weights),
+                projects=", ".join("?" * len(project_ids)),
+            ),
+            (match, *project_ids, MAX_SEARCH_RESULTS),
+        ).fetchall()
+        if not rows:
+            return queryset.none()
+        # bm25 scores are negative, lower is more relevant
+        return queryset.filter(pk__in=[issue_id for issue_id, _ in rows]).annotate(
+            relevance=Case(
+                *[When(pk=issue_id, then=Value(-score)) for issue_id, score in rows],
+                output_field=FloatField(),
+            )
+        )
+
+
+@lru_cache
+def _load_search_backend(path: str) -> SearchBackend:
+    return import_string(path)()
+
+
+def get_search_backend() -> SearchBackend:
+    return _load_search_backend(settings.ISSUE_SEARCH_BACKEND)
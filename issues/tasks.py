@@ -1,17 +1,46 @@
 from datetime import timedelta
 from django.utils.timezone import now
 from django.conf import settings
+from django.db import connection
 from celery import shared_task
 from events.models import Event
 from glitchtip.debounced_celery_task import debounced_task, debounced_wrap
+from glitchtip.partitioning import drop_expired_partitions
 from .models import Issue
+from .search import get_search_backend
+
+# Stats count the indexed events of each hour, expire them with their events
+DECREMENT_ISSUE_COUNTS_SQL = """
+WITH expired AS (
+    DELETE FROM issues_issuestat
+    WHERE date < %s
+    RETURNING issue_id, count
+)
+UPDATE issues_issue
+SET count = GREATEST(issues_issue.count - deleted.count, 0)
+FROM (
+    SELECT issue_id, SUM(count) as count FROM expired GROUP BY issue_id
+) deleted
+WHERE issues_issue.id = deleted.issue_id
+"""
+# Expired events that were never indexed
+DELETE_UNINDEXED_EVENTS_SQL = "DELETE FROM issues_unindexedevent WHERE created < %s"
 
 
 @shared_task
 def cleanup_old_events():
     """Delete older events and associated data"""
     days = settings.GLITCHTIP_MAX_EVENT_LIFE_DAYS
-    qs = Event.objects.filter(created__lt=now() - timedelta(days=days))
+    # Rounded up to the hour, so that expired stats count the expired events
+    cutoff = now() - timedelta(days=days) + timedelta(hours=1)
+    cutoff = cutoff.replace(minute=0, second=0, microsecond=0)
+    # Issue counts are updated incrementally, remove expired events from them
+    with connection.cursor() as cursor:
+        cursor.execute(DECREMENT_ISSUE_COUNTS_SQL, [cutoff])
+        cursor.execute(DELETE_UNINDEXED_EVENTS_SQL, [cutoff])
+    # When partitioned, drop whole days and delete only the remainder
+    drop_expired_partitions(Event._meta.db_table, cutoff)
+    qs = Event.objects.filter(created__lt=cutoff)
     # Fast bulk delete - see https://code.djangoproject.com/ticket/9519
     qs._raw_delete(qs.db)
     # Do not optimize Issue with raw_delete as it has FK references to it.
@@ -20,9 +49,18 @@ def cleanup_old_events():
 
 @shared_task
 def update_search_index_all_issues():
-    """Very slow, force reindex of all issues"""
+    """Very slow, force reindex of all issues from all of their events"""
+    search_backend = get_search_backend()
     for issue_pk in Issue.objects.all().values_list("pk", flat=True):
-        Issue.update_index(issue_pk)
+        Issue.rebuild_index(issue_pk)
+        search_backend.rebuild_issue(issue_pk)
+
+
+@shared_task
+def rebuild_search_index_issue(issue_id: int):
+    """Repair one issue's search index/tags, counting all of its events"""
+    Issue.rebuild_index(issue_id)
+    get_search_backend().rebuild_issue(issue_id)
 
 
 @debounced_task(lambda x, *a, **k: x)
@@ -35,3 +73,4 @@ def update_search_index_issue(issue_id: int):
     Usage: update_search_index_issue(args=[issue_id], countdown=10)
     """
     Issue.update_index(issue_id)
+    get_search_backend().index_issue(issue_id)
@@ -0,0 +1,60 @@
+from django.test import SimpleTestCase
+from model_bakery import baker
+from rest_framework.test import APITestCase
+
+from ..grouping import (
+    cache_issue_id,
+    get_cached_issue_id,
+    get_grouping_hash,
+)
+from ..models import EventStatus, EventType
+
+
+class GroupingHashTestCase(SimpleTestCase):
+    def test_grouping_hash(self):
+        grouping_hash = get_grouping_hash(EventType.ERROR, "Error", "app.views")
+        self.assertEqual(len(grouping_hash), 16)
+        self.assertEqual(
+            grouping_hash, get_grouping_hash(EventType.ERROR, "Error", "app.views")
+        )
+        self.assertNotEqual(
+            grouping_hash, get_grouping_hash(EventType.CSP, "Error", "app.views")
+        )
+        self.assertNotEqual(
+            get_grouping_hash(EventType.ERROR, "Error", None),
+            get_grouping_hash(EventType.ERROR, "Error", ""),
+        )
+
+    def test_fingerprint(self):
+        grouping_hash = get_grouping_hash(EventType.ERROR, "Error", "app.views")
+        self.assertEqual(
+            get_grouping_hash(
+                EventType.ERROR, "Error", "app.views", ["{{ default }}"]
+            ),
+            grouping_hash,
+        )
+        self.assertNotEqual(
+            get_grouping_hash(
+                EventType.ERROR, "Error", "app.views", ["{{default}}", "db"]
+            ),
+            grouping_hash,
+        )
+        self.assertEqual(
+            get_grouping_hash(EventType.ERROR, "Error", "app.views", ["db"]),
+            get_grouping_hash(EventType.CSP, "Other", None, ["db"]),
+        )
+
+
+class IssueCacheTestCase(APITestCase):
+    def test_resolved_issue_not_cached(self):
+        issue = baker.make(
+            "issues.Issue",
+            grouping_hash=get_grouping_hash(EventType.ERROR, "Error", None),
+        )
+        key = (issue.project_id, bytes(issue.grouping_hash))
+        cache_issue_id(key, issue.pk)
+        self.assertEqual(get_cached_issue_id(key), issue.pk)
+
+        issue.status = EventStatus.RESOLVED
+        issue.save()
+        self.assertIsNone(get_cached_issue_id(key))
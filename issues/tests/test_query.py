@@ -0,0 +1,162 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from model_bakery import baker
+
+from events.models import LogLevel
+from glitchtip.test_utils.test_case import GlitchTipTestCase
+from issues.models import EventStatus, Issue
+from ..query import QuerySyntaxError, compile_issue_query
+from ..search import get_search_backend
+
+
+class IssueQueryTestCase(TestCase):
+    def setUp(self):
+        self.project = baker.make("projects.Project")
+        now = timezone.now()
+        self.old_error = baker.make(
+            "issues.Issue",
+            project=self.project,
+            level=LogLevel.ERROR,
+            count=50,
+            last_seen=now - timedelta(days=3),
+            tags={"browser.name": ["Firefox", "Chrome"]},
+        )
+        self.new_warning = baker.make(
+            "issues.Issue",
+            project=self.project,
+            level=LogLevel.WARNING,
+            status=EventStatus.RESOLVED,
+            count=2,
+            last_seen=now,
+            tags={"browser.name": ["Mobile Safari"], "os.name": ["iOS"]},
+        )
+        self.new_info = baker.make(
+            "issues.Issue",
+            project=self.project,
+            level=LogLevel.INFO,
+            count=5,
+            last_seen=now - timedelta(hours=1),
+        )
+
+    def assertQueryMatches(self, query, issues):
+        compiled = compile_issue_query(query)
+        self.assertEqual(compiled.text, "")
+        self.assertEqual(set(Issue.objects.filter(compiled.filter)), set(issues), query)
+
+    def test_query(self):
+        self.assertQueryMatches("", [self.old_error, self.new_warning, self.new_info])
+        self.assertQueryMatches("is:unresolved", [self.old_error, self.new_info])
+        self.assertQueryMatches("!is:unresolved", [self.new_warning])
+        self.assertQueryMatches("level:error", [self.old_error])
+        self.assertQueryMatches("level:>=warning", [self.old_error, self.new_warning])
+        self.assertQueryMatches("timesSeen:>2", [self.old_error, self.new_info])
+        self.assertQueryMatches("timesSeen:<=5 -has:os.name", [self.new_info])
+        self.assertQueryMatches("lastSeen:-24h", [self.new_warning, self.new_info])
+        self.assertQueryMatches("lastSeen:+2d", [self.old_error])
+        self.assertQueryMatches(
+            f"lastSeen:<{timezone.now().date().isoformat()}", [self.old_error]
+        )
+        self.assertQueryMatches('browser.name:"Mobile Safari"', [self.new_warning])
+        self.assertQueryMatches(
+            "browser.name:Firefox browser.name:Chrome", [self.old_error]
+        )
+        self.assertQueryMatches("browser.name:Firefox AND browser.name:Safari", [])
+        self.assertQueryMatches(
+            "browser.name:Firefox OR os.name:iOS", [self.old_error, self.new_warning]
+        )
+        self.assertQueryMatches(
+            "NOT (level:error OR level:warning) is:unresolved", [self.new_info]
+        )
+
+    def test_free_text(self):
+        compiled = compile_issue_query('is:unresolved apple "sauce jar" level:error')
+        self.assertEqual(compiled.text, "apple sauce jar")
+        self.assertEqual(list(Issue.objects.filter(compiled.filter)), [self.old_error])
+
+    def test_invalid_query(self):
+        for query in [
+            "is:bananas",
+            "level:loud",
+            "timesSeen:>many",
+            "lastSeen:yesterday",
+            "(level:error",
+            "level:error)",
+            "level:error OR",
+            "apple OR level:error",
+            "NOT apple",
+            '"unclosed',
+        ]:
+            with self.assertRaises(QuerySyntaxError, msg=query):
+                compile_issue_query(query)
+
+
+class IssueQueryPlanTestCase(TestCase):
+    """Common issue list queries must be able to use an index"""
+
+    def setUp(self):
+        self.project = baker.make("projects.Project")
+        baker.make("issues.Issue", project=self.project, _quantity=10)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE issues_issue")
+
+    def get_queryset(self, query: str):
+        compiled = compile_issue_query(query)
+        qs = Issue.objects.filter(compiled.filter)
+        if compiled.text:
+            qs = get_search_backend().search(qs, compiled.text)
+        return qs
+
+    def get_plan(self, qs) -> str:
+        with connection.cursor() as cursor:
+            # Tables are tiny in tests, make the planner prefer any usable index
+            cursor.execute("SET enable_seqscan = off")
+        try:
+            return qs.explain()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_seqscan")
+
+    def test_query_plans(self):
+        for query, indexes in [
+            ("is:unresolved", ["issue_project_status_idx"]),
+            (
+                "is:unresolved lastSeen:-24h",
+                ["issue_project_status_idx", "issues_issue_last_seen"],
+            ),
+            ("browser.name:Firefox", ["issue_tags_idx"]),
+            ("has:browser.name", ["issue_tags_idx"]),
+            ("apple sauce", ["search_vector_idx"]),
+        ]:
+            # A page of the issue list, which may use last_seen for unselective
+            # filters
+            qs = self.get_queryset(query).filter(project=self.project)
+            plan = self.get_plan(qs.order_by("-last_seen")[:25])
+            self.assertNotIn("Seq Scan on issues_issue", plan, query)
+            # The filter by itself must be able to use its index
+            plan = self.get_plan(self.get_queryset(query))
+            self.assertNotIn("Seq Scan on issues_issue", plan, query)
+            self.assertTrue(any(index in plan for index in indexes), plan)
+
+
+class IssueQueryAPITestCase(GlitchTipTestCase):
+    def setUp(self):
+        self.create_user_and_project()
+        self.url = reverse("issue-list")
+
+    def test_query(self):
+        issue = baker.make("issues.Issue", project=self.project, level=LogLevel.ERROR)
+        other_issue = baker.make(
+            "issues.Issue", project=self.project, level=LogLevel.INFO
+        )
+        res = self.client.get(self.url, {"query": "is:unresolved level:error"})
+        self.assertEqual([row["id"] for row in res.data], [str(issue.id)])
+        res = self.client.get(self.url, {"query": "NOT level:error"})
+        self.assertEqual([row["id"] for row in res.data], [str(other_issue.id)])
+
+    def test_invalid_query(self):
+        res = self.client.get(self.url, {"query": "level:error OR"})
+        self.assertEqual(res.status_code, 400)
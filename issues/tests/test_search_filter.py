@@ -1,12 +1,16 @@
 import datetime
+import os
+import tempfile
 
+from django.test import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from freezegun import freeze_time
 from model_bakery import baker
 from glitchtip.test_utils.test_case import GlitchTipTestCase
 from issues.tasks import update_search_index_all_issues
-from ..tasks import update_search_index_all_issues
+from ..search import _load_search_backend
+from ..tasks import update_search_index_all_issues, update_search_index_issue
 
 
 class FilterTestCase(GlitchTipTestCase):
@@ -210,10 +214,10 @@ class SearchTestCase(GlitchTipTestCase):
 
     def test_search(self):
         event = baker.make(
-            "events.Event", issue__project=self.project, data={"name": "apple sauce"}
+            "events.Event", issue__project=self.project, data={"message": "apple sauce"}
         )
         event2 = baker.make(
-            "events.Event", issue=event.issue, data={"name": "apple sauce"}
+            "events.Event", issue=event.issue, data={"message": "apple sauce"}
         )
         other_event = baker.make("events.Event", issue__project=self.project)
         update_search_index_all_issues()
@@ -238,3 +242,65 @@ class SearchTestCase(GlitchTipTestCase):
         self.assertContains(res, "matchingEventId")
         self.assertContains(res, event2.event_id.hex)
         self.assertEqual(res.headers.get("X-Sentry-Direct-Hit"), "1")
+
+    def test_search_relevance(self):
+        """Matches in the title rank above matches in event messages"""
+        title_event = baker.make(
+            "events.Event",
+            issue__project=self.project,
+            issue__title="Apple sauce is missing",
+            data={"message": "Apple sauce is missing"},
+        )
+        message_event = baker.make(
+            "events.Event",
+            issue__project=self.project,
+            issue__title="Pear",
+            data={"message": "apple sauce"},
+        )
+        baker.make(
+            "events.Event",
+            issue__project=self.project,
+            data={"platform": "apple sauce"},
+        )
+        update_search_index_all_issues()
+
+        res = self.client.get(self.url + "?query=apple sauce&sort=-relevance")
+        self.assertEqual(
+            [issue["id"] for issue in res.data],
+            [str(title_event.issue_id), str(message_event.issue_id)],
+        )
+
+        res = self.client.get(self.url + "?sort=-relevance")
+        self.assertEqual(len(res.data), 3)
+
+    def test_sqlite_search_backend(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, override_settings(
+            ISSUE_SEARCH_BACKEND="issues.search.SQLiteSearchBackend",
+            ISSUE_SEARCH_SQLITE_PATH=os.path.join(tmp_dir, "search.sqlite3"),
+        ):
+            _load_search_backend.cache_clear()
+            self.addCleanup(_load_search_backend.cache_clear)
+            event = baker.make(
+                "events.Event",
+                issue__project=self.project,
+                issue__title="Pear",
+                data={"message": "apple sauce"},
+            )
+            other_event = baker.make(
+                "events.Event",
+                issue__project__organization__name="Other",
+                data={"message": "apple sauce"},
+            )
+            update_search_index_issue(args=[event.issue_id])
+            update_search_index_issue(args=[other_event.issue_id])
+
+            res = self.client.get(self.url + "?query=is:unresolved apple sauce")
+            self.assertEqual([issue["id"] for issue in res.data], [str(event.issue_id)])
+
+            # New events are added incrementally
+            baker.make("events.Event", issue=event.issue, data={"message": "banana"})
+            update_search_index_issue(args=[event.issue_id])
+            res = self.client.get(self.url + "?query=banana")
+            self.assertEqual([issue["id"] for issue in res.data], [str(event.issue_id)])
+            res = self.client.get(self.url + "?query=apple")
+            self.assertEqual(len(res.data), 1)
@@ -1,11 +1,13 @@
 from datetime import timedelta
 from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
 from django.test import TestCase
 from django.utils.timezone import now
 from model_bakery import baker
 from freezegun import freeze_time
 from events.models import Event
-from issues.models import Issue
+from issues.models import Issue, IssueStat
 from ..tasks import cleanup_old_events
 
 
@@ -32,3 +34,94 @@ class TasksTestCase(TestCase):
         ):
             cleanup_old_events()
             self.assertEqual(Event.objects.count(), 0)
+
+    def test_cleanup_old_events_issue_count(self):
+        issue = baker.make("issues.Issue")
+        baker.make("events.Event", issue=issue, _quantity=2)
+        with freeze_time(now() + timedelta(days=2)):
+            baker.make("events.Event", issue=issue)
+        Issue.update_index(issue.pk)
+
+        with freeze_time(
+            now() + timedelta(days=settings.GLITCHTIP_MAX_EVENT_LIFE_DAYS, hours=1)
+        ):
+            cleanup_old_events()
+        issue.refresh_from_db()
+        self.assertEqual(issue.count, 1)
+
+
+class IssueIndexTestCase(TestCase):
+    def test_update_index_incremental(self):
+        issue = baker.make("issues.Issue", level=1)
+        baker.make("events.Event", issue=issue, level=2, tags={"foo": "a"})
+        baker.make("events.Event", issue=issue, level=1, tags={"foo": "b"})
+        Issue.update_index(issue.pk)
+        issue.refresh_from_db()
+        self.assertEqual(issue.count, 2)
+        self.assertEqual(issue.level, 2)
+        self.assertEqual(sorted(issue.tags["foo"]), ["a", "b"])
+        watermark = issue.index_watermark
+        self.assertTrue(watermark)
+
+        # No new events, nothing is counted twice
+        Issue.update_index(issue.pk)
+        issue.refresh_from_db()
+        self.assertEqual(issue.count, 2)
+
+        with freeze_time(watermark + timedelta(seconds=1)):
+            event = baker.make(
+                "events.Event", issue=issue, level=1, tags={"foo": "c", "bar": "d"}
+            )
+        Issue.update_index(issue.pk)
+        issue.refresh_from_db()
+        self.assertEqual(issue.count, 3)
+        self.assertEqual(issue.level, 2)
+        self.assertEqual(issue.last_seen, event.created)
+        self.assertEqual(issue.index_watermark, event.created)
+        self.assertEqual(sorted(issue.tags["foo"]), ["a", "b", "c"])
+        self.assertEqual(issue.tags["bar"], ["d"])
+
+    def test_update_index_late_commit(self):
+        issue = baker.make("issues.Issue")
+        baker.make("events.Event", issue=issue)
+        Issue.update_index(issue.pk)
+        issue.refresh_from_db()
+        watermark = issue.index_watermark
+
+        # Created before the last update, but committed after it
+        with freeze_time(watermark - timedelta(seconds=1)):
+            baker.make("events.Event", issue=issue, tags={"foo": "late"})
+        Issue.update_index(issue.pk)
+        issue.refresh_from_db()
+        self.assertEqual(issue.count, 2)
+        self.assertEqual(issue.tags["foo"], ["late"])
+        self.assertEqual(issue.index_watermark, watermark)
+        self.assertEqual(
+            IssueStat.objects.filter(issue=issue).aggregate(Sum("count")),
+            {"count__sum": 2},
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM issues_unindexedevent")
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_rebuild_index(self):
+        issue = baker.make("issues.Issue")
+        baker.make("events.Event", issue=issue, tags={"foo": "a"}, _quantity=3)
+        Issue.update_index(issue.pk)
+        Issue.objects.filter(pk=issue.pk).update(count=100, tags={"lost": ["x"]})
+
+        IssueStat.objects.filter(issue=issue).update(count=100)
+        baker.make("events.Event", issue=issue, tags={"foo": "b"})
+
+        Issue.rebuild_index(issue.pk)
+        issue.refresh_from_db()
+        self.assertEqual(issue.count, 4)
+        self.assertEqual(issue.tags, {"foo": ["a", "b"]})
+        self.assertEqual(
+            IssueStat.objects.filter(issue=issue).aggregate(Sum("count")),
+            {"count__sum": 4},
+        )
+        # Rebuilt events aren't counted again
+        Issue.update_index(issue.pk)
+        issue.refresh_from_db()
+        self.assertEqual(issue.count, 4)
@@ -1,21 +1,24 @@
-import shlex
 import uuid
 
 from django.db import connection
+from django.db.models import FloatField, Value
 from django.db.models.expressions import RawSQL
 from django.http import HttpResponseNotFound
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins, views, viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 
 from events.models import Event
 
 from .filters import IssueFilter
+from .grouping import forget_issue_id
 from .models import EventStatus, Issue
 from .permissions import EventPermission, IssuePermission
+from .query import QuerySyntaxError, compile_issue_query
+from .search import get_search_backend
 from .serializers import EventDetailSerializer, EventSerializer, IssueSerializer
 
 
@@ -37,6 +40,8 @@ class IssueViewSet(
 
     - id (int) — a list of IDs of the issues to be removed.  This parameter shall be repeated for each issue.
     - query (string) — querystring for structured search. Example: "is:unresolved" searches for status=unresolved.
+      Terms may be combined with AND, OR, NOT, and parentheses. Supports comparisons such as timesSeen:>10
+      and lastSeen:-24h, and tags such as browser.name:Firefox.
     """
 
     queryset = Issue.objects.all()
@@ -45,7 +50,7 @@ class IssueViewSet(
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     permission_classes = [IssuePermission]
     ordering = ["-last_seen"]
-    ordering_fields = ["last_seen", "created", "count", "priority"]
+    ordering_fields = ["last_seen", "created", "count", "priority", "relevance"]
     page_size_query_param = "limit"
 
     def _get_queryset_base(self):
@@ -87,25 +92,13 @@ class IssueViewSet(
     def get_queryset(self):
         qs = self._get_queryset_base()
 
-        queries = shlex.split(self.request.GET.get("query", ""))
-        # First look for structured queries
-        for i, query in enumerate(queries):
-            query_part = query.split(":", 1)
-            if len(query_part) == 2:
-                query_name, query_value = query_part
-                query_value = query_value.strip('"')
-
-                if query_name == "is":
-                    qs = qs.filter(status=EventStatus.from_string(query_value))
-                elif query_name == "has":
-                    qs = qs.filter(tags__has_key=query_value)
-                else:
-                    qs = qs.filter(tags__contains={query_name: [query_value]})
-            if len(query_part) == 1:
-                search_query = " ".join(queries[i:])
-                qs = qs.filter(search_vector=search_query)
-                # Search queries must be at end of query string, finished when parsing
-                break
+        try:
+            query = compile_issue_query(self.request.GET.get("query", ""))
+        except QuerySyntaxError as err:
+            raise ValidationError(str(err)) from err
+        qs = qs.filter(query.filter)
+        if query.text:
+            qs = get_search_backend().search(qs, query.text)
 
         if str(self.request.query_params.get("sort")).endswith("priority"):
             # Raw SQL must be added when sorting by priority
@@ -115,6 +108,11 @@ class IssueViewSet(
                     "LOG10(count) + EXTRACT(EPOCH FROM last_seen)/300000", ()
                 )
             )
+        if not query.text and str(self.request.query_params.get("sort")).endswith(
+            "relevance"
+        ):
+            # Relevance is annotated by search backends
+            qs = qs.annotate(relevance=Value(0.0, output_field=FloatField()))
 
         qs = (
             qs.select_related("project")
@@ -130,6 +128,10 @@ class IssueViewSet(
         if ids:
             queryset = queryset.filter(id__in=ids)
         status = EventStatus.from_string(request.data.get("status"))
+        for key in queryset.filter(grouping_hash__isnull=False).values_list(
+            "project_id", "grouping_hash"
+        ):
+            forget_issue_id((key[0], bytes(key[1])))
         queryset.update(status=status)
         return Response({"status": status.label})
 
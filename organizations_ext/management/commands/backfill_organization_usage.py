@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from organizations_ext.models import Organization
+from organizations_ext.usage import (
+    flush_usage,
+    get_usage_periods,
+    reset_usage_counters,
+    save_usage,
+)
+from projects.cache import invalidate_organization_project_auth
+
+
+class Command(BaseCommand):
+    help = "Count current billing period usage from stored rows. Run once when upgrading to usage counted at ingest."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Organizations to count per query",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.BILLING_ENABLED:
+            self.stdout.write("Billing is not enabled, usage starts at ingest")
+            return
+        flush_usage()
+        batch_size = options["batch_size"]
+        organization_ids = list(
+            Organization.objects.order_by("pk").values_list("pk", flat=True)
+        )
+        for i in range(0, len(organization_ids), batch_size):
+            batch_ids = organization_ids[i : i + batch_size]
+            periods = get_usage_periods(batch_ids)
+            rows = {}
+            for organization in Organization.objects.with_counted_events().filter(
+                pk__in=batch_ids, djstripe_customers__subscriptions__status="active"
+            ):
+                rows[organization.pk] = (
+                    organization.pk,
+                    periods[organization.pk].start,
+                    {
+                        "events": organization.issue_event_count,
+                        "transactions": organization.transaction_count,
+                        "uptime_checks": organization.uptime_check_event_count,
+                        "file_bytes": organization.file_size * 1000000,
+                    },
+                )
+            save_usage(list(rows.values()))
+            # Seed counters again from the backfilled usage
+            reset_usage_counters(periods.values())
+            invalidate_organization_project_auth(*batch_ids)
+            self.stdout.write(f"Counted usage of {len(rows)} organizations")
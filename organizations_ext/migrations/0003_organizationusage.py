@@ -0,0 +1,30 @@
+# Generated by Django 4.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations_ext', '0002_organizationinvitation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateTimeField(help_text='Start of the billing period, or of the month without one')),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('transactions', models.PositiveIntegerField(default=0)),
+                ('uptime_checks', models.PositiveIntegerField(default=0)),
+                ('file_bytes', models.PositiveBigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='organizations_ext.organization')),
+            ],
+            options={
+                'unique_together': {('organization', 'period_start')},
+            },
+        ),
+    ]
@@ -16,6 +16,8 @@ from organizations.managers import OrgManager
 from organizations.signals import user_added
 from sql_util.utils import SubqueryCount, SubquerySum
 
+from projects.cache import invalidate_organization_project_auth
+
 # Defines which scopes belong to which role
 # Credit to sentry/conf/server.py
 ROLES = (
@@ -133,7 +135,42 @@ class OrganizationUserRole(models.IntegerChoices):
 
 class OrganizationManager(OrgManager):
     def with_event_counts(self, current_period=True):
+        """
+        Annotate usage from OrganizationUsage, of the current billing period
+        when billing is enabled
+        """
+        usage_filter = Q()
+        if current_period and settings.BILLING_ENABLED:
+            usage_filter = Q(
+                period_start__gte=OuterRef(
+                    "djstripe_customers__subscriptions__current_period_start"
+                ),
+                period_start__lt=OuterRef(
+                    "djstripe_customers__subscriptions__current_period_end"
+                ),
+            )
+
+        def usage_sum(field: str):
+            return Coalesce(SubquerySum(f"usage__{field}", filter=usage_filter), 0)
+
+        return self.annotate(
+            issue_event_count=usage_sum("events"),
+            transaction_count=usage_sum("transactions"),
+            uptime_check_event_count=usage_sum("uptime_checks"),
+            file_size=usage_sum("file_bytes") / 1000000,
+            total_event_count=F("issue_event_count")
+            + F("transaction_count")
+            + F("uptime_check_event_count")
+            + F("file_size"),
+        )
+
+    def with_counted_events(self, current_period=True):
+        """
+        Annotate usage by counting stored rows, which is slow. Only used to
+        backfill OrganizationUsage.
+        """
         subscription_filter = Q()
+        issue_stat_filter = Q()
         if current_period and settings.BILLING_ENABLED:
             subscription_filter = Q(
                 created__gte=OuterRef(
@@ -143,10 +180,20 @@ class OrganizationManager(OrgManager):
                     "djstripe_customers__subscriptions__current_period_end"
                 ),
             )
+            # Hourly rollups count in the period their hour starts in
+            issue_stat_filter = Q(
+                date__gte=OuterRef(
+                    "djstripe_customers__subscriptions__current_period_start"
+                ),
+                date__lt=OuterRef(
+                    "djstripe_customers__subscriptions__current_period_end"
+                ),
+            )
 
         queryset = self.annotate(
-            issue_event_count=SubqueryCount(
-                "projects__issue__event", filter=subscription_filter
+            issue_event_count=Coalesce(
+                SubquerySum("projects__issuestat__count", filter=issue_stat_filter),
+                0,
             ),
             transaction_count=SubqueryCount(
                 "projects__transactiongroup__transactionevent",
@@ -202,6 +249,16 @@ class Organization(SharedBaseModel, OrganizationBase):
 
     objects = OrganizationManager()
 
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        super().save(*args, **kwargs)
+        if not is_new:
+            invalidate_organization_project_auth(self.pk)
+
+    def delete(self, *args, **kwargs):
+        invalidate_organization_project_auth(self.pk)
+        return super().delete(*args, **kwargs)
+
     def slugify_function(self, content):
         reserved_words = [
             "login",
@@ -262,6 +319,28 @@ class Organization(SharedBaseModel, OrganizationBase):
         return org_user.get_scopes()
 
 
+class OrganizationUsage(models.Model):
+    """
+    Events ingested by an organization in a billing period. Counted in redis
+    as they are ingested and flushed here periodically, see usage.py
+    """
+
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="usage"
+    )
+    period_start = models.DateTimeField(
+        help_text="Start of the billing period, or of the month without one"
+    )
+    events = models.PositiveIntegerField(default=0)
+    transactions = models.PositiveIntegerField(default=0)
+    uptime_checks = models.PositiveIntegerField(default=0)
+    file_bytes = models.PositiveBigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (("organization", "period_start"),)
+
+
 class OrganizationUser(SharedBaseModel, OrganizationUserBase):
     user = models.ForeignKey(
         "users.User",
@@ -1,7 +1,9 @@
 from django.conf import settings
 from celery import shared_task
+from projects.cache import invalidate_organization_project_auth
 from .models import Organization
 from .email import MetQuotaEmail, InvitationEmail
+from .usage import flush_usage
 
 
 def get_free_tier_organizations_with_event_count():
@@ -20,22 +22,37 @@ def set_organization_throttle():
         free_tier_organizations = get_free_tier_organizations_with_event_count()
 
         orgs_over_quota = free_tier_organizations.filter(
-            is_accepting_events=True, total_event_count__gt=events_max
+            is_accepting_events=True, total_event_count__gte=events_max
         ).select_related("owner__organization_user")
+        throttled_ids = []
         for org in orgs_over_quota:
             send_email_met_quota.delay(org.pk)
-        orgs_over_quota.update(is_accepting_events=False)
-
-        free_tier_organizations.filter(
-            is_accepting_events=False, total_event_count__lte=events_max
-        ).update(is_accepting_events=True)
+            throttled_ids.append(org.pk)
+        Organization.objects.filter(pk__in=throttled_ids).update(
+            is_accepting_events=False
+        )
 
+        unthrottled_ids = list(
+            free_tier_organizations.filter(
+                is_accepting_events=False, total_event_count__lt=events_max
+            ).values_list("pk", flat=True)
+        )
         # paid accounts should always be active at this time
-        Organization.objects.filter(
+        unthrottled_ids += Organization.objects.filter(
             is_accepting_events=False,
             djstripe_customers__subscriptions__plan__amount__gt=0,
             djstripe_customers__subscriptions__status="active",
-        ).update(is_accepting_events=True)
+        ).values_list("pk", flat=True)
+        Organization.objects.filter(pk__in=unthrottled_ids).update(
+            is_accepting_events=True
+        )
+        invalidate_organization_project_auth(*throttled_ids, *unthrottled_ids)
+
+
+@shared_task
+def flush_organization_usage():
+    """Write usage counted at ingest to OrganizationUsage"""
+    flush_usage()
 
 
 @shared_task
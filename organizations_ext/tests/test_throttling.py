@@ -8,6 +8,12 @@ from ..tasks import (
     set_organization_throttle,
     get_free_tier_organizations_with_event_count,
 )
+from ..usage import flush_usage, record_organization_usage
+
+
+def record_usage(organization, field, amount):
+    record_organization_usage(field, {organization.pk: amount})
+    flush_usage()
 
 
 class OrganizationThrottlingTestCase(TestCase):
@@ -30,16 +36,12 @@ class OrganizationThrottlingTestCase(TestCase):
                 status="active",
                 current_period_end="2000-01-31",
             )
-            baker.make(
-                "events.Event", issue__project__organization=organization, _quantity=3
-            )
+            record_usage(organization, "events", 3)
             set_organization_throttle()
             organization.refresh_from_db()
             self.assertTrue(organization.is_accepting_events)
 
-            baker.make(
-                "events.Event", issue__project__organization=organization, _quantity=8
-            )
+            record_usage(organization, "events", 8)
             set_organization_throttle()
             organization.refresh_from_db()
             self.assertFalse(organization.is_accepting_events)
@@ -59,14 +61,8 @@ class OrganizationThrottlingTestCase(TestCase):
             self.assertTrue(organization.is_accepting_events)
 
             # Throttle again
-            baker.make(
-                "events.Event", issue__project__organization=organization, _quantity=10
-            )
-            baker.make(
-                "performance.TransactionEvent",
-                group__project__organization=organization,
-                _quantity=1,
-            )
+            record_usage(organization, "events", 10)
+            record_usage(organization, "transactions", 1)
             set_organization_throttle()
             organization.refresh_from_db()
             self.assertFalse(organization.is_accepting_events)
@@ -74,7 +70,6 @@ class OrganizationThrottlingTestCase(TestCase):
     def test_organization_event_count(self):
         plan = baker.make("djstripe.Plan", active=True, amount=0)
         organization = baker.make("organizations_ext.Organization")
-        project = baker.make("projects.Project", organization=organization)
         user = baker.make("users.user")
         organization.add_user(user)
         customer = baker.make(
@@ -90,12 +85,8 @@ class OrganizationThrottlingTestCase(TestCase):
                 status="active",
                 current_period_end="2000-02-01",
             )
-            baker.make("events.Event", issue__project=project, _quantity=3)
-            baker.make(
-                "performance.TransactionEvent",
-                group__project=project,
-                _quantity=2,
-            )
+            record_usage(organization, "events", 3)
+            record_usage(organization, "transactions", 2)
             free_org = get_free_tier_organizations_with_event_count().first()
         self.assertEqual(free_org.total_event_count, 5)
 
@@ -116,8 +107,6 @@ class OrganizationThrottlingTestCase(TestCase):
                 plan=plan,
                 status="active",
             )
-            baker.make(
-                "events.Event", issue__project__organization=organization, _quantity=2
-            )
-        with self.assertNumQueries(4):
+            record_usage(organization, "events", 2)
+        with self.assertNumQueries(3):
             set_organization_throttle()
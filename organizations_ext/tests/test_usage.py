@@ -0,0 +1,147 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.shortcuts import reverse
+from django.test import override_settings
+from django.utils import timezone
+from model_bakery import baker
+from rest_framework.test import APITestCase
+
+from events.models import Event
+from glitchtip import test_utils  # pylint: disable=unused-import
+from issues.tasks import update_search_index_all_issues
+
+from ..models import OrganizationUsage
+from ..usage import (
+    flush_usage,
+    get_usage_periods,
+    local_counters,
+    record_organization_usage,
+)
+
+
+class OrganizationUsageTestCase(APITestCase):
+    def setUp(self):
+        local_counters.clear()
+        self.project = baker.make("projects.Project")
+        self.organization = self.project.organization
+        projectkey = self.project.projectkey_set.first()
+        self.url = (
+            reverse("event_store", args=[self.project.id])
+            + f"?sentry_key={projectkey.public_key}"
+        )
+        with open("events/test_data/py_hi_event.json") as json_file:
+            self.data = json.load(json_file)
+
+    def store_event(self, event_id: str):
+        self.data["event_id"] = event_id
+        return self.client.post(self.url, self.data, format="json")
+
+    def test_ingest_usage(self):
+        for event_id in [
+            "6600a066e64b4caf8ed7ec5af64ac4d1",
+            "6600a066e64b4caf8ed7ec5af64ac4d2",
+        ]:
+            self.assertEqual(self.store_event(event_id).status_code, 200)
+        self.assertEqual(flush_usage(), 1)
+        usage = OrganizationUsage.objects.get(organization=self.organization)
+        self.assertEqual(usage.events, 2)
+        # Without a subscription, usage is by calendar month
+        self.assertEqual(usage.period_start.day, 1)
+        self.assertEqual(usage.period_start.month, timezone.now().month)
+        # Nothing changed since the last flush
+        self.assertEqual(flush_usage(), 0)
+
+    def test_ingest_usage_not_stored(self):
+        event_id = "6600a066e64b4caf8ed7ec5af64ac4d1"
+        self.assertEqual(self.store_event(event_id).status_code, 200)
+        self.assertEqual(self.store_event(event_id).status_code, 403)
+        with override_settings(EVENT_STORE_ASYNC=True):
+            self.assertEqual(self.store_event(event_id).status_code, 200)
+        self.data["timestamp"] = "yesterday"
+        self.store_event("6600a066e64b4caf8ed7ec5af64ac4d2")
+        self.assertEqual(Event.objects.count(), 1)
+        # Invalid and duplicate events aren't counted
+        flush_usage()
+        self.assertEqual(OrganizationUsage.objects.get().events, 1)
+
+    def test_flush_usage_error(self):
+        record_organization_usage("events", {self.organization.pk: 1})
+        with mock.patch(
+            "organizations_ext.usage.save_usage", side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                flush_usage()
+        # Written on the next flush
+        self.assertEqual(flush_usage(), 1)
+        self.assertEqual(OrganizationUsage.objects.get().events, 1)
+
+    @override_settings(BILLING_FREE_TIER_EVENTS=2)
+    def test_ingest_quota(self):
+        baker.make(
+            "djstripe.Subscription",
+            customer__subscriber=self.organization,
+            livemode=False,
+            plan__amount=0,
+            status="active",
+        )
+        record_organization_usage("events", {self.organization.pk: 1})
+        flush_usage()
+        self.assertEqual(
+            self.store_event("6600a066e64b4caf8ed7ec5af64ac4d1").status_code, 200
+        )
+        res = self.store_event("6600a066e64b4caf8ed7ec5af64ac4d2")
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(Event.objects.count(), 1)
+
+        # Rejected events aren't counted
+        flush_usage()
+        self.assertEqual(OrganizationUsage.objects.get().events, 2)
+
+    def test_usage_period(self):
+        subscription = baker.make(
+            "djstripe.Subscription",
+            customer__subscriber=self.organization,
+            livemode=False,
+            plan__amount=1000,
+            status="active",
+        )
+        baker.make(
+            "organizations_ext.OrganizationUsage",
+            organization=self.organization,
+            period_start=subscription.current_period_start,
+            transactions=3,
+        )
+        period = get_usage_periods([self.organization.pk])[self.organization.pk]
+        self.assertEqual(period.start, subscription.current_period_start)
+        # Paid plans have no quota
+        self.assertEqual(period.quota, 0)
+        self.assertEqual(period.usage["transactions"], 3)
+
+        # Flushing never decreases usage
+        record_organization_usage("file_bytes", {self.organization.pk: 1000})
+        OrganizationUsage.objects.update(transactions=5)
+        flush_usage()
+        usage = OrganizationUsage.objects.get()
+        self.assertEqual(usage.transactions, 5)
+        self.assertEqual(usage.file_bytes, 1000)
+
+    def test_backfill_usage(self):
+        subscription = baker.make(
+            "djstripe.Subscription",
+            customer__subscriber=self.organization,
+            livemode=False,
+            status="active",
+            current_period_start=timezone.now() - timedelta(days=1),
+            current_period_end=timezone.now() + timedelta(days=29),
+        )
+        baker.make("events.Event", issue__project=self.project, _quantity=3)
+        update_search_index_all_issues()
+        call_command("backfill_organization_usage", stdout=StringIO())
+        usage = OrganizationUsage.objects.get()
+        self.assertEqual(usage.period_start, subscription.current_period_start)
+        self.assertEqual(usage.events, 3)
@@ -5,7 +5,11 @@ from teams.views import NestedTeamViewSet
 from environments.views import EnvironmentViewSet
 from releases.views import ReleaseViewSet, ReleaseFileViewSet
 from performance.views import TransactionViewSet, TransactionGroupViewSet, SpanViewSet
-from glitchtip.uptime.views import MonitorViewSet, MonitorCheckViewSet
+from glitchtip.uptime.views import (
+    MonitorCheckRollupViewSet,
+    MonitorCheckViewSet,
+    MonitorViewSet,
+)
 from glitchtip.routers import BulkSimpleRouter
 from .views import (
     OrganizationViewSet,
@@ -60,6 +64,9 @@ organizations_monitors_router = routers.NestedSimpleRouter(
 organizations_monitors_router.register(
     r"checks", MonitorCheckViewSet, basename="organization-monitor-checks"
 )
+organizations_monitors_router.register(
+    r"rollups", MonitorCheckRollupViewSet, basename="organization-monitor-rollups"
+)
 
 organizations_router.register(
     r"releases", ReleaseViewSet, basename="organization-releases"
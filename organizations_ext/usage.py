@@ -0,0 +1,343 @@
+"""
+Real-time organization usage counters
+
+Ingest counts the events, transactions, uptime checks, and uploaded file bytes
+of each organization per billing period in redis, so that quotas are checked in
+O(1) on each request instead of counting stored rows. Each counter is a redis
+hash of period totals, seeded from OrganizationUsage when it's first used.
+flush_organization_usage periodically writes changed counters back to
+OrganizationUsage, which billing views and throttling tasks read.
+
+The billing period is the current period of the organization's active
+subscription, or the calendar month without one. Ingest gets it from the
+project auth cache.
+
+When the cache isn't Redis, such as in development, counters are kept in
+process memory instead.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import DecimalField, F, JSONField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, JSONObject
+from django.utils import timezone
+
+from .models import Organization, OrganizationUsage
+
+logger = logging.getLogger(__name__)
+
+USAGE_FIELDS = ("events", "transactions", "uptime_checks", "file_bytes")
+# Set of counter keys changed since the last flush
+CHANGED_USAGE_KEY = "usage:changed"
+# Counters outlive the longest billing period, they are flushed well before
+USAGE_COUNTER_TIMEOUT = 60 * 60 * 24 * 40
+FLUSH_BATCH_SIZE = 1000
+
+# KEYS are the counter and the changed set. ARGV holds the field to increment,
+# the amount, the quota or 0, the timeout, then totals to seed the counter with.
+# Returns 0 when the quota is used up, without counting.
+USAGE_SCRIPT = """
+local key = KEYS[1]
+if redis.call("EXISTS", key) == 0 then
+    redis.call(
+        "HSET", key, "events", ARGV[5], "transactions", ARGV[6],
+        "uptime_checks", ARGV[7], "file_bytes", ARGV[8]
+    )
+end
+local quota = tonumber(ARGV[3])
+if quota > 0 then
+    local usage = redis.call(
+        "HMGET", key, "events", "transactions", "uptime_checks", "file_bytes"
+    )
+    local total = tonumber(usage[1]) + tonumber(usage[2]) + tonumber(usage[3])
+        + math.floor(tonumber(usage[4]) / 1000000)
+    if total >= quota then
+        return 0
+    end
+end
+redis.call("HINCRBY", key, ARGV[1], ARGV[2])
+redis.call("EXPIRE", key, tonumber(ARGV[4]))
+redis.call("SADD", KEYS[2], key)
+return 1
+"""
+
+# Counters may be seeded from stale totals, never let them decrease usage
+UPSERT_USAGE_SQL = """
+INSERT INTO organizations_ext_organizationusage AS usage (
+    organization_id, period_start, events, transactions, uptime_checks,
+    file_bytes, updated
+)
+SELECT counter.*, %s
+FROM (VALUES {values}) AS counter (
+    organization_id, period_start, events, transactions, uptime_checks,
+    file_bytes
+)
+JOIN organizations_ext_organization AS organization
+    ON organization.id = counter.organization_id
+ON CONFLICT (organization_id, period_start) DO UPDATE SET
+    events = GREATEST(usage.events, EXCLUDED.events),
+    transactions = GREATEST(usage.transactions, EXCLUDED.transactions),
+    uptime_checks = GREATEST(usage.uptime_checks, EXCLUDED.uptime_checks),
+    file_bytes = GREATEST(usage.file_bytes, EXCLUDED.file_bytes),
+    updated = EXCLUDED.updated
+"""
+
+
+def get_usage_total(usage: Dict[str, int]) -> int:
+    """Total events, counting each MB of files as an event"""
+    return (
+        usage["events"]
+        + usage["transactions"]
+        + usage["uptime_checks"]
+        + usage["file_bytes"] // 1000000
+    )
+
+
+@dataclass
+class UsagePeriod:
+    organization_id: int
+    start: datetime
+    quota: int  # Max total events, 0 when unlimited
+    usage: Dict[str, int]  # Totals from OrganizationUsage, to seed counters
+
+    @property
+    def key(self) -> str:
+        return f"usage:{self.organization_id}:{self.start.isoformat()}"
+
+
+def parse_usage_key(key: str) -> Tuple[int, datetime]:
+    _, organization_id, start = key.split(":", 2)
+    return int(organization_id), datetime.fromisoformat(start)
+
+
+def annotate_usage_period(queryset, organization_ref: str):
+    """
+    Annotate the usage period of the organization at organization_ref:
+    usage_period_start, usage_plan_amount, and usage_totals flushed so far
+    """
+    period_start = Value(
+        timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    )
+    plan_amount = Value(None, output_field=DecimalField())
+    if settings.BILLING_ENABLED:
+        # pylint: disable=import-outside-toplevel
+        from djstripe.models import Subscription
+
+        subscriptions = Subscription.objects.filter(
+            customer__subscriber=OuterRef(organization_ref), status="active"
+        ).order_by("-current_period_start")
+        period_start = Coalesce(
+            Subquery(subscriptions.values("current_period_start")[:1]), period_start
+        )
+        plan_amount = Subquery(subscriptions.values("plan__amount")[:1])
+    usage = OrganizationUsage.objects.filter(
+        organization_id=OuterRef(organization_ref),
+        period_start=OuterRef("usage_period_start"),
+    ).values(json=JSONObject(**{field: field for field in USAGE_FIELDS}))
+    return queryset.annotate(
+        usage_period_start=period_start, usage_plan_amount=plan_amount
+    ).annotate(usage_totals=Subquery(usage[:1], output_field=JSONField()))
+
+
+def usage_period_from_values(values: Dict) -> UsagePeriod:
+    """
+    Usage period of values annotated by annotate_usage_period, such as project
+    auth data, which must include organization_id
+    """
+    # Only free plans have a quota, paid plans are billed for overages
+    quota = 0
+    if values["usage_plan_amount"] == 0:
+        quota = settings.BILLING_FREE_TIER_EVENTS
+    return UsagePeriod(
+        organization_id=values["organization_id"],
+        start=values["usage_period_start"],
+        quota=quota,
+        usage=values["usage_totals"] or {field: 0 for field in USAGE_FIELDS},
+    )
+
+
+def get_usage_periods(organization_ids: Iterable[int]) -> Dict[int, UsagePeriod]:
+    organizations = annotate_usage_period(
+        Organization.objects.filter(pk__in=organization_ids), "pk"
+    ).values(
+        "usage_period_start",
+        "usage_plan_amount",
+        "usage_totals",
+        organization_id=F("pk"),
+    )
+    return {
+        organization["organization_id"]: usage_period_from_values(organization)
+        for organization in organizations
+    }
+
+
+class LocalUsageCounters:
+    """Same as USAGE_SCRIPT, for one process"""
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[str, int]] = {}
+        self.changed = set()
+        self.lock = threading.Lock()
+
+    def add(self, period: UsagePeriod, field: str, amount: int, quota: int) -> bool:
+        with self.lock:
+            usage = self.counters.setdefault(period.key, dict(period.usage))
+            if quota and get_usage_total(usage) >= quota:
+                return False
+            usage[field] += amount
+            self.changed.add(period.key)
+            return True
+
+    def pop_changed(self, count: int) -> List[Tuple[str, Dict[str, int]]]:
+        with self.lock:
+            keys = [self.changed.pop() for _ in range(min(count, len(self.changed)))]
+            return [(key, dict(self.counters[key])) for key in keys]
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.changed.clear()
+
+
+local_counters = LocalUsageCounters()
+_script = None
+
+
+def _get_redis_connection():
+    try:
+        # pylint: disable=import-outside-toplevel
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def _add_usage(period: UsagePeriod, field: str, amount: int, quota: int) -> bool:
+    global _script  # pylint: disable=global-statement
+    redis = _get_redis_connection()
+    if redis is None:
+        return local_counters.add(period, field, amount, quota)
+    if _script is None:
+        _script = redis.register_script(USAGE_SCRIPT)
+    return bool(
+        _script(
+            keys=[period.key, CHANGED_USAGE_KEY],
+            args=[
+                field,
+                amount,
+                quota,
+                USAGE_COUNTER_TIMEOUT,
+                *(period.usage[usage_field] for usage_field in USAGE_FIELDS),
+            ],
+            client=redis,
+        )
+    )
+
+
+def record_usage(
+    period: UsagePeriod, field: str, amount=1, enforce_quota=False
+) -> bool:
+    """
+    Count amount of field in the organization's usage period
+    Returns False, without counting, when enforce_quota and the quota is used up
+    """
+    try:
+        return _add_usage(period, field, amount, period.quota if enforce_quota else 0)
+    except Exception:  # pylint: disable=broad-except
+        # Don't reject events because usage can't be counted
+        logger.warning("Usage counting failed", exc_info=True)
+        return True
+
+
+def release_usage(period: UsagePeriod, field: str, amount=1):
+    """
+    Uncount amount of field, counted when an item was accepted but not stored,
+    such as invalid events or duplicate event ids. Usage that was already
+    flushed stays in OrganizationUsage, which is never decreased.
+    """
+    record_usage(period, field, -amount)
+
+
+def record_organization_usage(field: str, amounts: Dict[int, int]):
+    """Count usage that isn't ingested, amounts are by organization id"""
+    amounts = {pk: amount for pk, amount in amounts.items() if amount}
+    if not amounts:
+        return
+    for organization_id, period in get_usage_periods(amounts).items():
+        record_usage(period, field, amounts[organization_id])
+
+
+def _pop_changed_usage(count: int) -> List[Tuple[str, Dict[str, int]]]:
+    redis = _get_redis_connection()
+    if redis is None:
+        return local_counters.pop_changed(count)
+    keys = [key.decode() for key in redis.spop(CHANGED_USAGE_KEY, count) or []]
+    pipeline = redis.pipeline(transaction=False)
+    for key in keys:
+        pipeline.hgetall(key)
+    return [
+        (key, {field.decode(): int(value) for field, value in usage.items()})
+        for key, usage in zip(keys, pipeline.execute())
+        if usage
+    ]
+
+
+def _mark_changed(keys: List[str]):
+    redis = _get_redis_connection()
+    if redis is None:
+        with local_counters.lock:
+            local_counters.changed.update(keys)
+    elif keys:
+        redis.sadd(CHANGED_USAGE_KEY, *keys)
+
+
+def save_usage(rows: List[Tuple[int, datetime, Dict[str, int]]]):
+    """Upsert (organization id, period start, usage) rows to OrganizationUsage"""
+    if not rows:
+        return
+    params: List = [timezone.now()]
+    for organization_id, period_start, usage in rows:
+        params += [organization_id, period_start]
+        params += [usage[field] for field in USAGE_FIELDS]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPSERT_USAGE_SQL.format(
+                values=", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))
+            ),
+            params,
+        )
+
+
+def flush_usage(batch_size=FLUSH_BATCH_SIZE) -> int:
+    """Write changed counters to OrganizationUsage, returns how many were written"""
+    flushed = 0
+    while changed := _pop_changed_usage(batch_size):
+        try:
+            save_usage([(*parse_usage_key(key), usage) for key, usage in changed])
+        except Exception:
+            # Popped counters are written on the next flush instead
+            _mark_changed([key for key, _ in changed])
+            raise
+        flushed += len(changed)
+        if len(changed) < batch_size:
+            break
+    return flushed
+
+
+def reset_usage_counters(periods: Iterable[UsagePeriod]):
+    """Drop counters, they are seeded again from OrganizationUsage when next used"""
+    keys = [period.key for period in periods]
+    redis = _get_redis_connection()
+    if redis is None:
+        with local_counters.lock:
+            for key in keys:
+                local_counters.counters.pop(key, None)
+                local_counters.changed.discard(key)
+    elif keys:
+        redis.delete(*keys)
@@ -0,0 +1,21 @@
+# Generated by Django 4.1 on 2026-10-18 04:57
+
+from django.db import migrations
+import glitchtip.model_utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("performance", "0009_alter_span_description"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transactionevent",
+            name="data",
+            field=glitchtip.model_utils.FastJSONField(
+                help_text="General event data that is searchable"
+            ),
+        ),
+    ]
@@ -58,12 +58,15 @@ class SpanSerializer(serializers.ModelSerializer):
             "parent_span_id": {"write_only": True},
         }
 
-    def to_internal_value(self, data):
+    def normalize_input(self, data):
         # Coerce tags to strings
         # Must be done here to avoid failing child CharField validation
         if tags := data.get("tags"):
             data["tags"] = {key: str(value) for key, value in tags.items()}
-        return super().to_internal_value(data)
+        return data
+
+    def to_internal_value(self, data):
+        return super().to_internal_value(self.normalize_input(data))
 
     def validate_description(self, value):
         # No documented max length here, so we truncate
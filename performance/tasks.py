@@ -4,6 +4,8 @@ from celery import shared_task
 from django.conf import settings
 from django.utils.timezone import now
 
+from glitchtip.partitioning import drop_expired_partitions
+
 from .models import Span, TransactionEvent, TransactionGroup
 
 
@@ -13,10 +15,12 @@ def cleanup_old_transaction_events():
     days = settings.GLITCHTIP_MAX_TRANSACTION_EVENT_LIFE_DAYS
     days_ago = now() - timedelta(days=days)
 
+    drop_expired_partitions(Span._meta.db_table, days_ago)
     qs = Span.objects.filter(created__lt=days_ago)
     # Fast bulk delete - see https://code.djangoproject.com/ticket/9519
     qs._raw_delete(qs.db)
 
+    drop_expired_partitions(TransactionEvent._meta.db_table, days_ago)
     qs = TransactionEvent.objects.filter(created__lt=days_ago)
     qs._raw_delete(qs.db)
 
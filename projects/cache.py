@@ -0,0 +1,184 @@
+"""
+Cache for the project lookup done by every event ingest request
+
+Each SDK request must resolve the project id and public key from the DSN.
+Results are cached per project in process memory and in the shared django
+cache (redis). Unknown projects are cached as well, so requests with bad
+credentials can be rejected without touching Postgres.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from django.core.cache import cache
+
+PROJECT_AUTH_CACHE_TIMEOUT = 60
+# The local cache can't be invalidated across processes, keep it brief
+LOCAL_PROJECT_AUTH_CACHE_TIMEOUT = 5
+LOCAL_PROJECT_AUTH_CACHE_SIZE = 1000
+PROJECT_NOT_FOUND = "not_found"
+
+_local_cache: "OrderedDict[int, tuple]" = OrderedDict()
+# Threaded workers share the local cache, and reordering isn't thread safe
+_local_cache_lock = threading.Lock()
+
+
+def _get_cache_key(project_id: int) -> str:
+    return f"project-auth:{project_id}"
+
+
+def _get_local(project_id: int):
+    with _local_cache_lock:
+        cached = _local_cache.get(project_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+def _set_local(project_id: int, value):
+    with _local_cache_lock:
+        _local_cache[project_id] = (
+            time.monotonic() + LOCAL_PROJECT_AUTH_CACHE_TIMEOUT,
+            value,
+        )
+        _local_cache.move_to_end(project_id)
+        while len(_local_cache) > LOCAL_PROJECT_AUTH_CACHE_SIZE:
+            _local_cache.popitem(last=False)
+
+
+def _fetch_project_auth(project_id: int):
+    """Fetch all data needed to authenticate and ingest events in one query"""
+    # pylint: disable=import-outside-toplevel
+    from django.contrib.postgres.aggregates import ArrayAgg
+    from django.db.models import Exists, OuterRef
+
+    from difs.models import DebugInformationFile
+    from organizations_ext.usage import annotate_usage_period
+
+    from .models import Project
+
+    difs_subquery = DebugInformationFile.objects.filter(project_id=OuterRef("pk"))
+    project = (
+        annotate_usage_period(
+            Project.objects.filter(id=project_id), "organization_id"
+        )
+        .annotate(
+            has_difs=Exists(difs_subquery),
+            public_keys=ArrayAgg("projectkey__public_key", ordering="projectkey__id"),
+            rate_limit_counts=ArrayAgg(
+                "projectkey__rate_limit_count", ordering="projectkey__id"
+            ),
+            rate_limit_windows=ArrayAgg(
+                "projectkey__rate_limit_window", ordering="projectkey__id"
+            ),
+        )
+        .values(
+            "id",
+            "first_event",
+            "scrub_ip_addresses",
+            "organization_id",
+            "organization__is_accepting_events",
+            "organization__scrub_ip_addresses",
+            "has_difs",
+            "public_keys",
+            "rate_limit_counts",
+            "rate_limit_windows",
+            "usage_period_start",
+            "usage_plan_amount",
+            "usage_totals",
+        )
+        .first()
+    )
+    if project is None:
+        return PROJECT_NOT_FOUND
+    keys = list(
+        zip(
+            project["public_keys"],
+            project.pop("rate_limit_counts"),
+            project.pop("rate_limit_windows"),
+        )
+    )
+    project["public_keys"] = [key.hex for key, _, _ in keys if key]
+    # Token bucket count and window in seconds, see events/rate_limits.py
+    project["rate_limits"] = {
+        key.hex: (count, window) for key, count, window in keys if count and window
+    }
+    return project
+
+
+def get_project_auth(project_id: int) -> Optional[Dict]:
+    """
+    Get cached project authentication data, None when the project doesn't exist
+    """
+    value = _get_local(project_id)
+    if value is None:
+        cache_key = _get_cache_key(project_id)
+        value = cache.get(cache_key)
+        if value is None:
+            value = _fetch_project_auth(project_id)
+            cache.set(cache_key, value, PROJECT_AUTH_CACHE_TIMEOUT)
+        _set_local(project_id, value)
+    if value == PROJECT_NOT_FOUND:
+        return None
+    return value
+
+
+def _model_from_db(model, values: Dict):
+    """Build a model instance with only the given fields loaded, as .only() would"""
+    return model.from_db(
+        None,
+        list(values),
+        [
+            values[field.attname]
+            for field in model._meta.concrete_fields
+            if field.attname in values
+        ],
+    )
+
+
+def project_from_auth(project_auth: Dict):
+    """Build a Project instance, with organization, from cached project auth data"""
+    # pylint: disable=import-outside-toplevel
+    from organizations_ext.models import Organization
+
+    from .models import Project
+
+    project = _model_from_db(
+        Project,
+        {
+            "id": project_auth["id"],
+            "first_event": project_auth["first_event"],
+            "scrub_ip_addresses": project_auth["scrub_ip_addresses"],
+            "organization_id": project_auth["organization_id"],
+        },
+    )
+    project.organization = _model_from_db(
+        Organization,
+        {
+            "id": project_auth["organization_id"],
+            "is_accepting_events": project_auth["organization__is_accepting_events"],
+            "scrub_ip_addresses": project_auth["organization__scrub_ip_addresses"],
+        },
+    )
+    project.has_difs = project_auth["has_difs"]
+    return project
+
+
+def invalidate_project_auth(*project_ids: int):
+    """Call whenever data that get_project_auth depends on changes"""
+    with _local_cache_lock:
+        for project_id in project_ids:
+            _local_cache.pop(project_id, None)
+    cache.delete_many([_get_cache_key(project_id) for project_id in project_ids])
+
+
+def invalidate_organization_project_auth(*organization_ids: int):
+    # pylint: disable=import-outside-toplevel
+    from .models import Project
+
+    invalidate_project_auth(
+        *Project.objects.filter(organization_id__in=organization_ids).values_list(
+            "id", flat=True
+        )
+    )
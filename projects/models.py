@@ -8,6 +8,8 @@ from django_extensions.db.fields import AutoSlugField
 
 from glitchtip.base_models import CreatedModel
 
+from .cache import invalidate_project_auth
+
 
 class Project(CreatedModel):
     """
@@ -42,6 +44,11 @@ class Project(CreatedModel):
         super().save(*args, **kwargs)
         if first:
             ProjectKey.objects.create(project=self)
+        invalidate_project_auth(self.pk)
+
+    def delete(self, *args, **kwargs):
+        invalidate_project_auth(self.pk)
+        return super().delete(*args, **kwargs)
 
     @property
     def should_scrub_ip_addresses(self):
@@ -83,6 +90,14 @@ class ProjectKey(CreatedModel):
     def __str__(self):
         return str(self.public_key)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_project_auth(self.project_id)
+
+    def delete(self, *args, **kwargs):
+        invalidate_project_auth(self.project_id)
+        return super().delete(*args, **kwargs)
+
     @classmethod
     def from_dsn(cls, dsn: str):
         urlparts = urlparse(dsn)
@@ -0,0 +1,75 @@
+"""
+Release artifact lookup by URL
+
+Artifacts are uploaded with names such as ~/static/js/main.js, where ~ stands
+for any host. Frame URLs and source map references are normalized to the same
+form, so that resolving a frame to its artifact is a dictionary lookup.
+"""
+import re
+from typing import Optional
+from urllib.parse import urljoin, urlsplit
+
+SOURCEMAP_HEADERS = ("sourcemap", "x-sourcemap")
+SOURCEMAP_URL_RE = re.compile(rb"//[#@]\s*sourceMappingURL=(\S+)\s*$")
+# sourceMappingURL comments are expected at the end of the file
+SOURCEMAP_URL_TAIL_SIZE = 4096
+
+
+def normalize_artifact_url(url: str) -> str:
+    """
+    Lookup key for an artifact URL, ignoring host, query, and fragment
+
+    http://example.com/static/main.js?v=1 -> ~/static/main.js
+    """
+    parts = urlsplit(url)
+    if parts.scheme in ("http", "https") or (not parts.scheme and parts.netloc):
+        return "~" + (parts.path or "/")
+    if parts.scheme:
+        # Keep empty hosts, such as app:///main.js
+        return url.split("#", 1)[0].split("?", 1)[0]
+    path = parts.path
+    if path.startswith("~/"):
+        return path
+    return "~/" + path.lstrip("/")
+
+
+def get_basename(url: str) -> str:
+    return urlsplit(url).path.rsplit("/", 1)[-1]
+
+
+def find_artifact(manifest: dict, url: str) -> Optional[str]:
+    """
+    Normalized URL of the release artifact for url, falling back to a file name
+    that only one artifact has
+    """
+    key = normalize_artifact_url(url)
+    if key in manifest["artifacts"]:
+        return key
+    return manifest["basenames"].get(get_basename(url))
+
+
+def resolve_sourcemap_url(url: str, sourcemap: str) -> Optional[str]:
+    """Normalized URL of a source map referenced by the artifact at url"""
+    if not sourcemap or sourcemap.startswith("data:"):
+        # Inline source maps aren't uploaded artifacts
+        return None
+    return normalize_artifact_url(urljoin(normalize_artifact_url(url), sourcemap))
+
+
+def find_sourcemap_url(url: str, headers: Optional[dict], fileobj=None):
+    """
+    Find the source map referenced by an artifact, from the Sourcemap header or
+    else the sourceMappingURL comment at the end of the file
+    """
+    for key, value in (headers or {}).items():
+        if key.lower() in SOURCEMAP_HEADERS:
+            return resolve_sourcemap_url(url, value)
+    if fileobj is None or get_basename(url).endswith(".map"):
+        return None
+    fileobj.seek(0, 2)
+    fileobj.seek(max(0, fileobj.tell() - SOURCEMAP_URL_TAIL_SIZE))
+    tail = fileobj.read()
+    fileobj.seek(0)
+    if match := SOURCEMAP_URL_RE.search(tail.rstrip()):
+        return resolve_sourcemap_url(url, match.group(1).decode(errors="replace"))
+    return None
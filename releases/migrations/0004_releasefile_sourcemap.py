@@ -0,0 +1,22 @@
+# Generated by Django 4.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("releases", "0003_auto_20210509_1658"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="releasefile",
+            name="sourcemap",
+            field=models.TextField(
+                blank=True,
+                help_text="Normalized URL of the referenced source map",
+                null=True,
+            ),
+        ),
+    ]
@@ -1,6 +1,11 @@
 from hashlib import sha1
+from django.core.cache import cache
 from django.db import models
+from events.ingest_cache import forget_release
 from glitchtip.base_models import CreatedModel
+from .artifacts import get_basename, normalize_artifact_url
+
+ARTIFACT_MANIFEST_CACHE_TIMEOUT = 3600
 
 
 class Release(CreatedModel):
@@ -32,6 +37,47 @@ class Release(CreatedModel):
     class Meta:
         unique_together = ("organization", "version")
 
+    @property
+    def artifact_manifest_cache_key(self):
+        return f"release-artifact-manifest:{self.pk}"
+
+    def get_artifact_manifest(self) -> dict:
+        """
+        Release artifacts by normalized URL, cached until release files change
+
+        artifacts maps URLs to (blob checksum, source map URL). basenames maps
+        file names to artifact URLs, or None when shared by several artifacts.
+        """
+        manifest = cache.get(self.artifact_manifest_cache_key)
+        if manifest is None:
+            artifacts = {}
+            basenames = {}
+            for name, file_name, sourcemap, checksum in ReleaseFile.objects.filter(
+                release=self, file__blob__isnull=False
+            ).values_list("name", "file__name", "sourcemap", "file__blob__checksum"):
+                url = normalize_artifact_url(name)
+                artifacts[url] = (checksum, sourcemap)
+                for basename in {get_basename(name), file_name}:
+                    basenames[basename] = (
+                        url if basenames.get(basename, url) == url else None
+                    )
+            manifest = {"artifacts": artifacts, "basenames": basenames}
+            cache.set(
+                self.artifact_manifest_cache_key,
+                manifest,
+                ARTIFACT_MANIFEST_CACHE_TIMEOUT,
+            )
+        return manifest
+
+    def clear_artifact_manifest(self):
+        cache.delete(self.artifact_manifest_cache_key)
+
+    def delete(self, *args, **kwargs):
+        project_ids = list(self.projects.values_list("id", flat=True))
+        result = super().delete(*args, **kwargs)
+        forget_release(project_ids, self.version)
+        return result
+
 
 class ReleaseProject(models.Model):
     """ Through model may be used to store cached event counts in the future """
@@ -48,6 +94,9 @@ class ReleaseFile(CreatedModel):
     file = models.ForeignKey("files.File", on_delete=models.CASCADE)
     ident = models.CharField(max_length=40)
     name = models.TextField()
+    sourcemap = models.TextField(
+        null=True, blank=True, help_text="Normalized URL of the referenced source map"
+    )
 
     class Meta:
         unique_together = (("release", "file"), ("release", "ident"))
@@ -55,7 +104,14 @@ class ReleaseFile(CreatedModel):
     def save(self, *args, **kwargs):
         if not self.ident:
             self.ident = type(self).get_ident(self.name)
-        return super().save(*args, **kwargs)
+        result = super().save(*args, **kwargs)
+        self.release.clear_artifact_manifest()
+        return result
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.release.clear_artifact_manifest()
+        return result
 
     @classmethod
     def get_ident(cls, name, dist=None):
@@ -3,6 +3,8 @@ from rest_framework import serializers
 from projects.serializers.base_serializers import ProjectReferenceSerializer
 from files.models import File
 from glitchtip.exceptions import ConflictException
+from organizations_ext.usage import record_organization_usage
+from .artifacts import find_sourcemap_url
 from .models import Release, ReleaseFile
 
 
@@ -70,12 +72,16 @@ class ReleaseFileSerializer(serializers.ModelSerializer):
 
         try:
             release_file = ReleaseFile.objects.create(
-                release=release, file=file, name=full_name,
+                release=release,
+                file=file,
+                name=full_name,
+                sourcemap=find_sourcemap_url(full_name, headers, fileobj),
             )
         except IntegrityError:
             file.delete()
             raise ConflictException("File already present!")
 
+        record_organization_usage("file_bytes", {release.organization_id: file.size})
         return release_file
 
 
@@ -0,0 +1,40 @@
+from io import BytesIO
+from django.test import SimpleTestCase
+from ..artifacts import find_artifact, find_sourcemap_url, normalize_artifact_url
+
+
+class ArtifactsTestCase(SimpleTestCase):
+    def test_normalize_artifact_url(self):
+        self.assertEqual(
+            normalize_artifact_url("http://example.com/static/main.js?v=1#a"),
+            "~/static/main.js",
+        )
+        self.assertEqual(normalize_artifact_url("~/static/main.js"), "~/static/main.js")
+        self.assertEqual(normalize_artifact_url("/static/main.js"), "~/static/main.js")
+        self.assertEqual(normalize_artifact_url("app:///main.js"), "app:///main.js")
+
+    def test_find_sourcemap_url(self):
+        self.assertEqual(
+            find_sourcemap_url("~/static/main.js", {"SourceMap": "maps/main.js.map"}),
+            "~/static/maps/main.js.map",
+        )
+        fileobj = BytesIO(b"code();\n//# sourceMappingURL=main.js.map\n")
+        self.assertEqual(
+            find_sourcemap_url("https://example.com/js/main.js", {}, fileobj),
+            "~/js/main.js.map",
+        )
+        fileobj = BytesIO(b"//# sourceMappingURL=data:application/json;base64,e30=")
+        self.assertIsNone(find_sourcemap_url("~/main.js", {}, fileobj))
+
+    def test_find_artifact(self):
+        manifest = {
+            "artifacts": {"~/a/main.js": ("1", None), "~/b/main.js": ("2", None)},
+            "basenames": {"main.js": None, "vendor.js": "~/vendor.js"},
+        }
+        self.assertEqual(
+            find_artifact(manifest, "http://localhost/a/main.js"), "~/a/main.js"
+        )
+        self.assertIsNone(find_artifact(manifest, "http://localhost/c/main.js"))
+        self.assertEqual(
+            find_artifact(manifest, "http://localhost/js/vendor.js"), "~/vendor.js"
+        )
@@ -165,11 +165,11 @@ class DecompressBodyMiddleware(object):
         encoding = request.META.get("HTTP_CONTENT_ENCODING", "").lower()
 
         if encoding == "gzip":
-            request._stream = GzipDecoder(request._stream)
+            request._stream = io.BufferedReader(GzipDecoder(request._stream))
             decode = True
 
         if encoding == "deflate":
-            request._stream = DeflateDecoder(request._stream)
+            request._stream = io.BufferedReader(DeflateDecoder(request._stream))
             decode = True
 
         if decode: